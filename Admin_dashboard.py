@@ -63,6 +63,21 @@
             background: #27ae60;
         }
 
+        .vehicle-select {
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            gap: 10px;
+            margin-top: 10px;
+        }
+
+        .vehicle-select select {
+            padding: 6px 12px;
+            border-radius: 8px;
+            border: 1px solid #ccc;
+            font-size: 1em;
+        }
+
         .dashboard-grid {
             display: grid;
             grid-template-columns: 1fr 1fr;
@@ -311,6 +326,12 @@
                 <div class="status-indicator" id="connectionStatus"></div>
                 <span id="connectionText">MQTT 연결 중...</span>
             </div>
+            <div class="vehicle-select">
+                <label for="vehicleSelect">🚙 차량</label>
+                <select id="vehicleSelect" onchange="selectVehicle(this.value)">
+                    <option value="">기본 차량 (기존 토픽)</option>
+                </select>
+            </div>
         </div>
 
         <div class="alert-banner" id="alertBanner">
@@ -397,9 +418,19 @@
             DRIVER_PHOTO: "driver/photo",
             CAR_CONTROL: "car/server",
             RPI_ENGINE: "pi/engine",
-            RPI_ALERT: "pi/alert"
+            RPI_ALERT: "pi/alert",
+            HUB_STATE: "hub/state"
         };
 
+        // 여러 대 구성에서는 장치와 허브가 vehicle/<차량 ID>/<토픽>을 사용
+        // 접두사 없는 기존 토픽은 기본 차량(차량 ID "")으로 표시
+        const VEHICLE_PREFIX = "vehicle";
+        const LEGACY_VEHICLE = "";
+
+        let selectedVehicle = LEGACY_VEHICLE; // 상태 패널과 수동 제어 대상 차량
+        let messageVehicle = null;            // 처리 중인 메시지의 차량 (로그 앞에 표시)
+        const vehicles = new Set([LEGACY_VEHICLE]);
+
         let client;
         let isConnected = false;
         
@@ -437,9 +468,10 @@
             isConnected = true;
             updateConnectionStatus(true);
             
-            // 모든 토픽 구독
+            // 모든 토픽 구독 (기존 토픽 + 차량별 토픽)
             Object.values(TOPICS).forEach(topic => {
                 client.subscribe(topic);
+                client.subscribe(`${VEHICLE_PREFIX}/+/${topic}`);
             });
             
             addLog("MQTT 브로커 연결 완료", "success");
@@ -463,12 +495,73 @@
             }
         }
 
+        // 토픽에서 차량 ID와 차량 기준 토픽을 분리
+        function parseTopic(fullTopic) {
+            const parts = fullTopic.split("/");
+            if (parts.length > 2 && parts[0] === VEHICLE_PREFIX && parts[1]) {
+                return { vehicleId: parts[1], topic: parts.slice(2).join("/") };
+            }
+            return { vehicleId: LEGACY_VEHICLE, topic: fullTopic };
+        }
+
+        function vehicleLabel(vehicleId) {
+            return vehicleId === LEGACY_VEHICLE ? "기본 차량" : vehicleId;
+        }
+
+        function vehicleTopic(topic) {
+            return selectedVehicle === LEGACY_VEHICLE ? topic : `${VEHICLE_PREFIX}/${selectedVehicle}/${topic}`;
+        }
+
+        function addVehicle(vehicleId) {
+            if (vehicles.has(vehicleId)) {
+                return;
+            }
+            vehicles.add(vehicleId);
+
+            const option = document.createElement("option");
+            option.value = vehicleId;
+            option.textContent = vehicleId;
+            document.getElementById("vehicleSelect").appendChild(option);
+            addLog(`새 차량 감지: ${vehicleId}`, "info");
+        }
+
+        // 차량을 바꾸면 상태 패널을 초기화하고 이후 그 차량의 메시지만 반영
+        function selectVehicle(vehicleId) {
+            selectedVehicle = vehicleId;
+            lastFaceMatchStatus = null;
+            ["engineStatus", "breathStatus", "faceStatus", "drowsyStatus"].forEach(elementId => {
+                updateStatus(elementId, "", "대기 중");
+            });
+            updateDriverStatus("", "운전자 상태 대기 중");
+            document.getElementById("breathMeasurementTime").textContent = "-";
+            document.getElementById("faceMeasurementTime").textContent = "-";
+            addLog(`표시 차량 변경: ${vehicleLabel(vehicleId)}`, "info");
+        }
+
         function onMessageArrived(message) {
-            const topic = message.destinationName;
+            const { vehicleId, topic } = parseTopic(message.destinationName);
             const payload = message.payloadString;
             
-            console.log("메시지 수신:", topic, payload);
-            
+            console.log("메시지 수신:", message.destinationName, payload);
+            addVehicle(vehicleId);
+
+            // 다른 차량의 메시지는 상태 패널에 반영하지 않고, 경고만 로그로 남김
+            if (vehicleId !== selectedVehicle) {
+                if (topic === TOPICS.RPI_ALERT && payload !== "NORMAL") {
+                    addLog(`[${vehicleLabel(vehicleId)}] 알림: ${payload}`, "warning");
+                }
+                return;
+            }
+
+            messageVehicle = vehicleId;
+            try {
+                dispatchMessage(topic, payload);
+            } finally {
+                messageVehicle = null;
+            }
+        }
+
+        function dispatchMessage(topic, payload) {
             switch(topic) {
                 case TOPICS.BREATHALYZER:
                     handleBreathalyzerResult(payload);
@@ -488,6 +581,9 @@
                 case TOPICS.FACE_REQUEST:
                     addLog(`얼굴 인증 요청: ${payload}`, "info");
                     break;
+                case TOPICS.HUB_STATE:
+                    handleHubState(payload);
+                    break;
                 default:
                     // 알 수 없는 토픽에 대한 로그를 제거하고, 단순히 콘솔에만 출력
                     console.log(`기타 토픽 메시지: ${topic} - ${payload}`);
@@ -634,6 +730,15 @@
             }
         }
 
+        function handleHubState(payload) {
+            try {
+                const data = JSON.parse(payload);
+                addLog(`차량 상태: ${data.previous} → ${data.state} (${data.reason})`, "info");
+            } catch (error) {
+                addLog("차량 상태 데이터 파싱 오류: " + error.message, "error");
+            }
+        }
+
         function sendEngineCommand(command) {
             if (!isConnected) {
                 addLog("MQTT 연결이 끊어져 있습니다", "error");
@@ -643,13 +748,13 @@
             const message = command === "ON" ? "ENGINE_ON" : "ENGINE_OFF";
             
             // 조향장치와 라즈베리파이에 동시 전송
-            publishMessage(TOPICS.CAR_CONTROL, message);
-            publishMessage(TOPICS.RPI_ENGINE, message);
+            publishMessage(vehicleTopic(TOPICS.CAR_CONTROL), message);
+            publishMessage(vehicleTopic(TOPICS.RPI_ENGINE), message);
             
             systemStatus.engine = command === "ON" ? "시동 ON" : "시동 OFF";
             updateStatus("engineStatus", command === "ON" ? "success" : "danger", systemStatus.engine);
             
-            addLog(`수동 엔진 제어: ${message}`, command === "ON" ? "success" : "warning");
+            addLog(`[${vehicleLabel(selectedVehicle)}] 수동 엔진 제어: ${message}`, command === "ON" ? "success" : "warning");
         }
 
         function requestFaceVerification() {
@@ -658,8 +763,8 @@
                 return;
             }
             
-            publishMessage(TOPICS.FACE_REQUEST, "VERIFY_FACE");
-            addLog("얼굴 인증 요청 전송", "success");
+            publishMessage(vehicleTopic(TOPICS.FACE_REQUEST), "VERIFY_FACE");
+            addLog(`[${vehicleLabel(selectedVehicle)}] 얼굴 인증 요청 전송`, "success");
         }
 
         function publishMessage(topic, message) {
@@ -702,7 +807,8 @@
             
             const logEntry = document.createElement("div");
             logEntry.className = `log-entry ${type}`;
-            logEntry.innerHTML = `<span class="timestamp">[${timestamp}]</span> ${message}`;
+            const vehicle = messageVehicle === null ? "" : `[${vehicleLabel(messageVehicle)}] `;
+            logEntry.innerHTML = `<span class="timestamp">[${timestamp}]</span> ${vehicle}${message}`;
             
             logContainer.appendChild(logEntry);
             logContainer.scrollTop = logContainer.scrollHeight;
@@ -0,0 +1,131 @@
+import argparse
+import collections
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+# ec2_main.py 중계 허브 처리량/지연 시간 측정
+# 로컬 브로커(Mosquitto 등)에 허브를 띄우고, 여러 차량 ID로 음주측정 결과("1"/"0" 번갈아)를 보낸 뒤
+# 허브가 vehicle/<ID>/car/server로 보내는 시동 명령을 받아 메시지 하나의 중계 시간을 잰다
+# 얼굴 인증 요청에는 답하지 않으므로, 측정 중에 얼굴 인증 시간 초과로 허브가 스스로 시동을 끄지 않도록
+# 허브를 BENCH_FACE_TIMEOUT으로 띄우고, 기대한 명령과 다른 응답은 짝짓지 않고 따로 센다
+#
+# 사용 예:
+#   mosquitto -p 1883 &
+#   python bench_relay.py --engine async --vehicles 200 --messages 20000
+#   python bench_relay.py --engine thread --vehicles 200 --messages 20000
+
+BENCH_FACE_TIMEOUT = 3600.0
+
+def percentile_ms(latencies, percentile):
+    return float(np.percentile(latencies, percentile)) * 1000.0 if latencies else 0.0
+
+def start_hub(args):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ec2_main.py"),
+               "--broker", args.broker, "--port", str(args.port), "--engine", args.engine, "--quiet",
+               # 차량마다 "1"/"0"을 번갈아 보내므로 차단 후 바로 재측정을 받도록 함
+               "--lockout", "0", "--face-timeout", str(BENCH_FACE_TIMEOUT)]
+    hub = subprocess.Popen(command)
+    time.sleep(args.hub_startup)
+    if hub.poll() is not None:
+        raise RuntimeError(f"허브가 시작되지 않았습니다 (종료 코드 {hub.returncode})")
+    return hub
+
+def run(args):
+    # 차량별로 보낸 시각과 기대하는 시동 명령 (응답은 차량마다 보낸 순서대로 돌아옴)
+    sent_times = collections.defaultdict(collections.deque)
+    latencies = []
+    lock = threading.Lock()
+    received = [0]
+    unexpected = [0]
+    last_received = [time.perf_counter()]
+
+    def on_message(client, userdata, msg):
+        now = time.perf_counter()
+        vehicle_id = msg.topic.split("/")[1]
+        with lock:
+            pending = sent_times[vehicle_id]
+            command = msg.payload.decode()
+            matched = next((i for i, (_, expected) in enumerate(pending) if expected == command), None)
+            if matched is None:
+                # 보낸 메시지에 대한 응답이 아님 (얼굴 인증 시간 초과 등으로 허브가 스스로 보낸 명령)
+                unexpected[0] += 1
+            else:
+                # 앞선 메시지는 응답 없이 지나감 (허브가 이미 같은 상태였던 경우, 유실로 셈)
+                for _ in range(matched):
+                    pending.popleft()
+                latencies.append(now - pending.popleft()[0])
+                received[0] += 1
+            last_received[0] = now
+
+    subscriber = mqtt.Client()
+    subscriber.on_message = on_message
+    subscriber.connect(args.broker, args.port, 60)
+    subscriber.subscribe("vehicle/+/car/server")
+    subscriber.loop_start()
+
+    publisher = mqtt.Client()
+    publisher.connect(args.broker, args.port, 60)
+    publisher.loop_start()
+    time.sleep(0.5)
+
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    start = time.perf_counter()
+    for i in range(args.messages):
+        vehicle_id = f"bench{i % args.vehicles:05d}"
+        # 차량마다 "1"(시동 허용)과 "0"(시동 차단)을 번갈아 보내 매번 상태가 바뀌도록 함
+        payload = "1" if (i // args.vehicles) % 2 == 0 else "0"
+        with lock:
+            sent_times[vehicle_id].append((time.perf_counter(), "ENGINE_ON" if payload == "1" else "ENGINE_OFF"))
+        publisher.publish(f"vehicle/{vehicle_id}/breathalyzer/status", payload)
+
+        if interval:
+            delay = start + (i + 1) * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    send_elapsed = time.perf_counter() - start
+
+    # 더 이상 응답이 오지 않을 때까지 대기
+    while received[0] < args.messages and time.perf_counter() - last_received[0] < args.drain_timeout:
+        time.sleep(0.05)
+    elapsed = last_received[0] - start
+
+    publisher.loop_stop()
+    subscriber.loop_stop()
+    publisher.disconnect()
+    subscriber.disconnect()
+
+    print(f"엔진: {args.engine}, 차량 {args.vehicles}대, 보낸 메시지 {args.messages}건 ({send_elapsed:.2f}초)")
+    print(f"받은 응답: {received[0]}건 (유실 {args.messages - received[0]}건), "
+          f"처리량 {received[0] / max(elapsed, 1e-9):.0f}건/초, 요청하지 않은 응답 {unexpected[0]}건")
+    print(f"중계 지연: p50 {percentile_ms(latencies, 50):.2f}ms, p95 {percentile_ms(latencies, 95):.2f}ms, "
+          f"p99 {percentile_ms(latencies, 99):.2f}ms, 최대 {max(latencies, default=0) * 1000:.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="ec2_main.py 중계 허브 처리량/지연 시간 측정")
+    parser.add_argument("--broker", default="localhost", help="측정용 로컬 MQTT 브로커")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--engine", choices=["async", "thread"], default="async", help="측정할 허브 엔진")
+    parser.add_argument("--no-hub", action="store_true", help="허브를 띄우지 않고 이미 실행 중인 허브를 측정")
+    parser.add_argument("--vehicles", type=int, default=100, help="차량 수")
+    parser.add_argument("--messages", type=int, default=10000, help="보낼 메시지 수")
+    parser.add_argument("--rate", type=float, default=0, help="초당 보낼 메시지 수 (0이면 최대 속도)")
+    parser.add_argument("--hub-startup", type=float, default=1.0, help="허브 시작 대기 시간 (초)")
+    parser.add_argument("--drain-timeout", type=float, default=3.0, help="마지막 응답 후 대기 시간 (초)")
+    args = parser.parse_args()
+
+    hub = None if args.no_hub else start_hub(args)
+    try:
+        run(args)
+    finally:
+        if hub is not None:
+            hub.terminate()
+            hub.wait(timeout=5)
+
+if __name__ == "__main__":
+    main()
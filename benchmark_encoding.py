@@ -0,0 +1,105 @@
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+import mediapipe as mp
+
+import face_drowsiness as fd
+
+# 얼굴 인증 인코딩 지연 시간 비교 스크립트
+# - before: ROI 안에서 HOG 검출 + shape_predictor + ResNet 인코딩 (기존 방식)
+# - box: MediaPipe 얼굴 사각형 사용 + shape_predictor + ResNet 인코딩
+# - box+mesh: MediaPipe 사각형 + MediaPipe 68점 변환 + ResNet 인코딩
+#
+# 사용 예: python benchmark_encoding.py face_captures --repeat 20
+
+def load_images(path):
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, "*.jpg")) + glob.glob(os.path.join(path, "*.png")))
+    else:
+        files = [path]
+
+    images = []
+    for file in files:
+        image = cv2.imread(file)
+        if image is not None:
+            images.append(image)
+    return images
+
+# 벤치마크 대상 이미지마다 MediaPipe로 얼굴 사각형과 68점 계산
+def prepare_samples(images):
+    samples = []
+    with mp.solutions.face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1,
+                                         refine_landmarks=False) as mesh:
+        for image in images:
+            height, width = image.shape[:2]
+            results = mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            if not results.multi_face_landmarks:
+                continue
+
+            points = fd.landmarks_to_array(results.multi_face_landmarks[0], width, height)
+            face_box = fd.face_bounding_box(points, width, height)
+            samples.append((image, face_box, fd.mediapipe_to_dlib68(points)))
+    return samples
+
+def measure(function, samples, repeat):
+    latencies = []
+    encodings = []
+    for _ in range(repeat):
+        for sample in samples:
+            start = time.perf_counter()
+            encodings.append(function(*sample))
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), encodings
+
+def main():
+    parser = argparse.ArgumentParser(description="dlib 얼굴 인코딩 지연 시간 비교")
+    parser.add_argument("images", help="얼굴이 포함된 이미지 파일 또는 디렉토리")
+    parser.add_argument("--repeat", type=int, default=10, help="이미지당 반복 횟수")
+    args = parser.parse_args()
+
+    if not fd.is_dlib_available():
+        print("dlib 모델이 없어 벤치마크를 실행할 수 없습니다.")
+        return
+
+    samples = prepare_samples(load_images(args.images))
+    if not samples:
+        print("얼굴이 검출된 이미지가 없습니다.")
+        return
+
+    def before(image, face_box, points):
+        x_min, y_min, x_max, y_max = face_box
+        return fd.get_face_encoding_dlib(image[y_min:y_max, x_min:x_max])
+
+    def box_only(image, face_box, points):
+        region, local_box, _ = fd.crop_face_region(image, face_box)
+        return fd.get_face_encoding_from_box(region, local_box)
+
+    def box_and_mesh(image, face_box, points):
+        region, local_box, local_points = fd.crop_face_region(image, face_box, points)
+        return fd.get_face_encoding_from_box(region, local_box, local_points)
+
+    print(f"이미지 {len(samples)}장, 반복 {args.repeat}회")
+    print(f"{'방식':<10} {'평균(ms)':>10} {'p50(ms)':>10} {'p95(ms)':>10} {'실패':>6}")
+
+    baseline = None
+    for name, function in (("before", before), ("box", box_only), ("box+mesh", box_and_mesh)):
+        latencies, encodings = measure(function, samples, args.repeat)
+        failures = sum(1 for encoding in encodings if encoding is None)
+        print(f"{name:<10} {latencies.mean():>10.1f} {np.percentile(latencies, 50):>10.1f} "
+              f"{np.percentile(latencies, 95):>10.1f} {failures:>6}")
+
+        # 기존 방식 대비 인코딩 거리 (같은 사람이므로 0.6보다 충분히 작아야 함)
+        if baseline is None:
+            baseline = encodings
+        else:
+            distances = [np.linalg.norm(a - b) for a, b in zip(baseline, encodings)
+                         if a is not None and b is not None]
+            if distances:
+                print(f"{'':<10} 기존 방식 대비 평균 거리: {np.mean(distances):.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,14 @@ const int ALCOHOL_THRESHOLD = 300;   // 실험에 따라 조정
 const char* ssid = "HSKANG";
 const char* password = "58790347";
 const char* mqtt_server = "3.36.131.224";
-const char* mqtt_topic = "breathalyzer/status";
+
+// 차량 ID (여러 차량이 같은 브로커를 쓰면 차량마다 다르게 지정, Python 장치의 VEHICLE_ID 환경 변수와 같은 값)
+// 비워 두면 접두사 없는 기존 토픽(breathalyzer/status)으로 보냄
+#define VEHICLE_ID ""
+const bool has_vehicle_id = sizeof(VEHICLE_ID) > 1;
+const char* mqtt_topic = has_vehicle_id ? "vehicle/" VEHICLE_ID "/breathalyzer/status" : "breathalyzer/status";
+// 같은 클라이언트 ID로 접속하면 브로커가 이전 연결을 끊으므로 차량마다 다르게
+const char* mqtt_client_id = has_vehicle_id ? "arduinoClient-" VEHICLE_ID : "arduinoClient";
 
 WiFiClient wifiClient;
 PubSubClient client(wifiClient);
@@ -36,7 +43,7 @@ void setup_wifi() {
 void reconnect_mqtt() {
   while (!client.connected()) {
     Serial.print("MQTT 재연결 중...");
-    if (client.connect("arduinoClient")) {
+    if (client.connect(mqtt_client_id)) {
       Serial.println("MQTT 연결 성공!");
     } else {
       Serial.print("실패, 재시도 코드: ");
@@ -0,0 +1,485 @@
+import time
+
+# 졸음 판단 상태 머신
+# 카메라/모델 의존성이 없는 순수 파이썬 모듈로, Jetson 실시간 루프와 오프라인 재평가 도구가 같은 코드를 사용한다
+# 프레임 수가 아니라 타임스탬프(초)로 판단하므로 실제 FPS와 무관하게 "2초 눈 감음"이 2초를 의미한다
+
+# 졸음 감지 파라미터
+EAR_THRESHOLD = 0.3
+EAR_CLOSED_SECONDS = 2.0
+
+# 고개 자세 감지 파라미터
+CENTER_ANGLE = 90.0
+VERTICAL_ANGLE_THRESHOLD = 25.0
+HORIZONTAL_DEVIATION_THRESHOLD = 0.08
+HEAD_DROP_THRESHOLD = 0.30
+HEAD_POSE_SECONDS = 3.0
+
+# 경고 리셋 파라미터
+EAR_RESET_SECONDS = 1.0
+HEAD_POSE_RESET_SECONDS = 1.0
+
+# PERCLOS 파라미터 (일정 시간 창 안에서 눈을 감고 있던 시간 비율)
+PERCLOS_WINDOW_SECONDS = 3.0       # 기존 90프레임 (30FPS 기준)
+PERCLOS_THRESHOLD = 30 / 90        # 기존 90프레임 중 30프레임
+PERCLOS_MAX_SAMPLES = 1024         # 창에 보관하는 최대 샘플 수 (고정 메모리)
+
+# 눈 경고 발생 기준 ("ear": 연속 눈 감음, "perclos": PERCLOS, "either": 둘 중 하나)
+EYE_TRIGGER_MODES = ("ear", "perclos", "either")
+
+# 운전자별 EAR 보정 파라미터 (참조 얼굴 캡처 직후 눈을 뜬 상태의 EAR 분포로 임계값 설정)
+EAR_CALIBRATION_SECONDS = 10.0     # 보정 시간
+EAR_CALIBRATION_MIN_SAMPLES = 60   # 최소 샘플 수 (부족하면 기본 임계값 유지)
+EAR_CALIBRATION_SIGMA = 3.0        # 평균 - 3 표준편차 아래를 눈 감음으로 판단
+EAR_CALIBRATION_RATIO = 0.8        # 분산이 매우 작아도 평균의 80% 이하로 임계값 제한
+EAR_THRESHOLD_MIN = 0.15
+EAR_THRESHOLD_MAX = 0.35
+
+# 적응형 분석 주기용 여유 (임계값에서 이만큼 떨어져 있어야 "충분히 정상"으로 판단)
+ADAPTIVE_MARGIN = 0.25
+
+# 적응형 분석 주기
+# 운전자가 충분히 정상인 상태가 ADAPTIVE_RELAX_SECONDS 동안 유지되면 ADAPTIVE_IDLE_INTERVAL 간격으로만 분석
+# 낮은 주기에서 새로 관측된 눈 감음/비정상 자세는 직전 분석 시각부터 시작된 것으로 보고 그 즉시 전체 주기로 돌아오므로
+# 2초 눈 감음/3초 고개 자세 경고는 모든 프레임을 분석할 때보다 늦지 않다 (최대 한 간격 일찍 발생할 수 있음)
+ADAPTIVE_IDLE_INTERVAL = 0.2
+ADAPTIVE_RELAX_SECONDS = 2.0
+
+# 샘플 간격이 이보다 길면 (얼굴 미검출 등) 그 시간은 지속 시간에 포함하지 않음
+MAX_SAMPLE_GAP = 0.5
+
+# update 반환값 (비트 플래그)
+EYE_WARNING_CHANGED = 1
+HEAD_POSE_WARNING_CHANGED = 2
+
+class PerclosWindow:
+    """
+    시간 기준 슬라이딩 창의 PERCLOS (눈 감은 시간 / 전체 시간)
+    고정 크기 링 버퍼와 누적 합으로 샘플당 상수 시간에 갱신한다
+    각 샘플 간격은 직전 샘플의 눈 상태로 가중치를 준다 (FPS가 변해도 시간 비율 유지)
+    """
+    __slots__ = ("window", "max_gap", "capacity", "timestamps", "durations", "closed_durations",
+                 "head", "count", "total_time", "closed_time", "last_timestamp", "last_closed")
+
+    def __init__(self, window=PERCLOS_WINDOW_SECONDS, capacity=PERCLOS_MAX_SAMPLES, max_gap=MAX_SAMPLE_GAP):
+        self.window = window
+        self.max_gap = max_gap
+        self.capacity = capacity
+        self.timestamps = [0.0] * capacity
+        self.durations = [0.0] * capacity
+        self.closed_durations = [0.0] * capacity
+        self.reset()
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.total_time = 0.0
+        self.closed_time = 0.0
+        self.last_timestamp = None
+        self.last_closed = False
+
+    @property
+    def value(self):
+        if self.total_time <= 0.0:
+            return 0.0
+        return min(1.0, max(0.0, self.closed_time / self.total_time))
+
+    @property
+    def coverage(self):
+        # 창 중 실제로 채워진 비율 (시작 직후 과대 추정 방지용)
+        return min(1.0, self.total_time / self.window)
+
+    def evict_oldest(self):
+        head = self.head
+        self.total_time -= self.durations[head]
+        self.closed_time -= self.closed_durations[head]
+        head += 1
+        self.head = 0 if head == self.capacity else head
+        self.count -= 1
+        if self.count == 0:
+            # 누적 오차 제거
+            self.total_time = 0.0
+            self.closed_time = 0.0
+
+    def add(self, timestamp, closed):
+        """샘플 추가 후 현재 PERCLOS 반환"""
+        last_timestamp = self.last_timestamp
+        if last_timestamp is not None and timestamp > last_timestamp:
+            duration = timestamp - last_timestamp
+            if duration > self.max_gap:
+                duration = self.max_gap
+            if self.count == self.capacity:
+                self.evict_oldest()
+
+            tail = self.head + self.count
+            if tail >= self.capacity:
+                tail -= self.capacity
+            closed_duration = duration if self.last_closed else 0.0
+            self.timestamps[tail] = timestamp
+            self.durations[tail] = duration
+            self.closed_durations[tail] = closed_duration
+            self.count += 1
+            self.total_time += duration
+            self.closed_time += closed_duration
+
+        self.last_timestamp = timestamp
+        self.last_closed = closed
+
+        # 창을 벗어난 샘플 제거 (샘플당 평균 한 번)
+        oldest_allowed = timestamp - self.window
+        timestamps = self.timestamps
+        while self.count and timestamps[self.head] <= oldest_allowed:
+            self.evict_oldest()
+
+        if self.total_time <= 0.0:
+            return 0.0
+        return self.closed_time / self.total_time
+
+class RunningStats:
+    """Welford 방식의 스트리밍 평균/분산 (샘플을 저장하지 않음)"""
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+def calibrated_ear_threshold(mean, std, sigma=EAR_CALIBRATION_SIGMA, ratio=EAR_CALIBRATION_RATIO,
+                             minimum=EAR_THRESHOLD_MIN, maximum=EAR_THRESHOLD_MAX):
+    # 눈을 뜬 상태 분포의 아래쪽 꼬리를 임계값으로 사용
+    threshold = min(mean - sigma * std, mean * ratio)
+    return min(maximum, max(minimum, threshold))
+
+class EarCalibrator:
+    """
+    운전자가 눈을 뜨고 정면을 보는 동안의 EAR 분포를 학습
+    add(timestamp, ear, head_pose_ok): 보정이 끝나면 임계값, 진행 중이면 None 반환
+    깜빡임은 평균 - sigma 표준편차 아래 샘플로 보고 통계에서 제외
+    """
+    __slots__ = ("start_time", "seconds", "min_samples", "stats", "rejected", "threshold")
+
+    def __init__(self, start_time, seconds=EAR_CALIBRATION_SECONDS, min_samples=EAR_CALIBRATION_MIN_SAMPLES):
+        self.start_time = start_time
+        self.seconds = seconds
+        self.min_samples = min_samples
+        self.stats = RunningStats()
+        self.rejected = 0
+        self.threshold = None
+
+    @property
+    def done(self):
+        return self.threshold is not None
+
+    def progress(self, timestamp):
+        return min(1.0, (timestamp - self.start_time) / self.seconds)
+
+    def add(self, timestamp, ear, head_pose_ok=True):
+        if self.threshold is not None:
+            return self.threshold
+
+        stats = self.stats
+        if ear is not None and head_pose_ok:
+            if ear < EAR_THRESHOLD_MIN or (stats.count >= 30 and ear < stats.mean - EAR_CALIBRATION_SIGMA * stats.std):
+                self.rejected += 1
+            else:
+                stats.add(ear)
+
+        if timestamp - self.start_time < self.seconds:
+            return None
+
+        if stats.count < self.min_samples:
+            # 샘플이 부족하면 보정 시간 연장
+            return None
+
+        self.threshold = calibrated_ear_threshold(stats.mean, stats.std)
+        return self.threshold
+
+    def to_dict(self):
+        return {
+            "ear_threshold": self.threshold,
+            "ear_mean": self.stats.mean,
+            "ear_std": self.stats.std,
+            "samples": self.stats.count,
+            "rejected": self.rejected
+        }
+
+class DrowsinessDetector:
+    """
+    타임스탬프가 붙은 (EAR, 고개 자세) 샘플을 받아 졸음/고개 자세 경고를 판단
+    update(timestamp, ear, head_pose)
+      ear: 양쪽 눈 평균 EAR (None이면 눈 판단 생략), PERCLOS 창에도 함께 반영
+      head_pose: (vertical_angle, horizontal_deviation, head_drop) (None이면 고개 판단 생략)
+      onset: 눈 감음/비정상 자세가 이 샘플에서 새로 시작되면 timestamp 대신 쓸 시작 시각
+             (분석 주기를 낮춘 동안 직전 샘플 시각을 주어 건너뛴 프레임 사이에 시작됐을 경우를 반영)
+      반환값: 바뀐 경고의 비트 플래그 (EYE_WARNING_CHANGED | HEAD_POSE_WARNING_CHANGED), 변화 없으면 0
+    eye_trigger: 눈 경고 기준 ("ear", "perclos", "either")
+    track_perclos: PERCLOS 창 갱신 여부 (None이면 eye_trigger가 PERCLOS를 쓸 때만, "ear"에서 값만 볼 때는 True)
+    """
+    __slots__ = (
+        "ear_threshold", "ear_closed_seconds", "ear_reset_seconds",
+        "center_angle", "vertical_angle_threshold", "horizontal_deviation_threshold",
+        "head_drop_threshold", "head_pose_seconds", "head_pose_reset_seconds", "max_sample_gap",
+        "eye_trigger", "perclos_threshold", "perclos_window", "track_perclos",
+        "eye_warning", "head_pose_warning",
+        "eye_closed_since", "eye_open_since", "head_pose_bad_since", "head_pose_good_since",
+        "last_timestamp"
+    )
+
+    def __init__(self, ear_threshold=EAR_THRESHOLD, ear_closed_seconds=EAR_CLOSED_SECONDS,
+                 ear_reset_seconds=EAR_RESET_SECONDS, center_angle=CENTER_ANGLE,
+                 vertical_angle_threshold=VERTICAL_ANGLE_THRESHOLD,
+                 horizontal_deviation_threshold=HORIZONTAL_DEVIATION_THRESHOLD,
+                 head_drop_threshold=HEAD_DROP_THRESHOLD, head_pose_seconds=HEAD_POSE_SECONDS,
+                 head_pose_reset_seconds=HEAD_POSE_RESET_SECONDS, max_sample_gap=MAX_SAMPLE_GAP,
+                 eye_trigger="ear", perclos_threshold=PERCLOS_THRESHOLD,
+                 perclos_window_seconds=PERCLOS_WINDOW_SECONDS, track_perclos=None):
+        if eye_trigger not in EYE_TRIGGER_MODES:
+            raise ValueError(f"알 수 없는 눈 경고 기준: {eye_trigger}")
+
+        self.ear_threshold = ear_threshold
+        self.ear_closed_seconds = ear_closed_seconds
+        self.ear_reset_seconds = ear_reset_seconds
+        self.center_angle = center_angle
+        self.vertical_angle_threshold = vertical_angle_threshold
+        self.horizontal_deviation_threshold = horizontal_deviation_threshold
+        self.head_drop_threshold = head_drop_threshold
+        self.head_pose_seconds = head_pose_seconds
+        self.head_pose_reset_seconds = head_pose_reset_seconds
+        self.max_sample_gap = max_sample_gap
+        self.eye_trigger = eye_trigger
+        self.perclos_threshold = perclos_threshold
+        self.perclos_window = PerclosWindow(perclos_window_seconds, max_gap=max_sample_gap)
+        # 연속 눈 감음만으로 판단하면 샘플마다 창을 갱신하지 않음 (기록 재생 처리량)
+        self.track_perclos = eye_trigger != "ear" if track_perclos is None else track_perclos
+        self.reset()
+
+    def reset(self):
+        self.eye_warning = False
+        self.head_pose_warning = False
+        self.eye_closed_since = None
+        self.eye_open_since = None
+        self.head_pose_bad_since = None
+        self.head_pose_good_since = None
+        self.last_timestamp = None
+        self.perclos_window.reset()
+
+    @property
+    def perclos(self):
+        return self.perclos_window.value
+
+    @property
+    def drowsy(self):
+        return self.eye_warning or self.head_pose_warning
+
+    def is_head_pose_incorrect(self, vertical_angle, horizontal_deviation, head_drop):
+        return (
+            abs(vertical_angle - self.center_angle) > self.vertical_angle_threshold or
+            horizontal_deviation > self.horizontal_deviation_threshold or
+            head_drop < self.head_drop_threshold
+        )
+
+    def is_well_within_bounds(self, ear, head_pose, margin=ADAPTIVE_MARGIN):
+        """
+        경고나 경고 직전 상태(눈 감음/비정상 자세 진행 중)가 없고
+        EAR, 고개 자세, PERCLOS가 모두 임계값에서 충분히 떨어져 있으면 True
+        (분석 주기를 낮춰도 되는지 판단할 때 사용)
+        """
+        if self.eye_warning or self.head_pose_warning:
+            return False
+        if self.eye_closed_since is not None or self.head_pose_bad_since is not None:
+            return False
+        if ear is None or head_pose is None:
+            return False
+
+        vertical_angle, horizontal_deviation, head_drop = head_pose
+        return (
+            ear >= self.ear_threshold * (1 + margin) and
+            head_drop >= self.head_drop_threshold * (1 + margin) and
+            abs(vertical_angle - self.center_angle) <= self.vertical_angle_threshold * (1 - 2 * margin) and
+            horizontal_deviation <= self.horizontal_deviation_threshold * (1 - 2 * margin) and
+            self.perclos_window.value < self.perclos_threshold * (1 - 2 * margin)
+        )
+
+    def skip_gap(self, excess):
+        # 샘플이 끊긴 시간만큼 시작 시각을 뒤로 미뤄 지속 시간에서 제외
+        if self.eye_closed_since is not None:
+            self.eye_closed_since += excess
+        if self.eye_open_since is not None:
+            self.eye_open_since += excess
+        if self.head_pose_bad_since is not None:
+            self.head_pose_bad_since += excess
+        if self.head_pose_good_since is not None:
+            self.head_pose_good_since += excess
+
+    def update(self, timestamp, ear, head_pose, onset=None):
+        changed = 0
+        if onset is None:
+            onset = timestamp
+        elif timestamp - onset > self.max_sample_gap:
+            # 끊긴 구간은 지속 시간에 넣지 않는 것과 같은 기준
+            onset = timestamp - self.max_sample_gap
+
+        last_timestamp = self.last_timestamp
+        if last_timestamp is not None and timestamp - last_timestamp > self.max_sample_gap:
+            self.skip_gap(timestamp - last_timestamp - self.max_sample_gap)
+        self.last_timestamp = timestamp
+
+        # EAR 알고리즘 (2초 이상 눈 감음) 및 PERCLOS
+        if ear is not None:
+            closed = ear < self.ear_threshold
+            if self.track_perclos:
+                perclos = self.perclos_window.add(timestamp, closed)
+                perclos_alarm = (self.eye_trigger != "ear" and perclos >= self.perclos_threshold and
+                                 self.perclos_window.coverage >= 0.5)
+            else:
+                perclos_alarm = False
+
+            if closed:
+                self.eye_open_since = None
+                if self.eye_closed_since is None:
+                    self.eye_closed_since = onset
+
+                if not self.eye_warning and (
+                        perclos_alarm or (self.eye_trigger != "perclos" and
+                                          timestamp - self.eye_closed_since >= self.ear_closed_seconds)):
+                    self.eye_warning = True
+                    changed |= EYE_WARNING_CHANGED
+            else:
+                # 눈을 뜬 경우
+                self.eye_closed_since = None
+
+                # 1초 이상 눈을 정상적으로 뜨고 PERCLOS도 기준 아래면 경고 해제
+                if self.eye_warning:
+                    if self.eye_open_since is None:
+                        self.eye_open_since = timestamp
+                    if timestamp - self.eye_open_since >= self.ear_reset_seconds and not perclos_alarm:
+                        self.eye_warning = False
+                        self.eye_open_since = None
+                        changed |= EYE_WARNING_CHANGED
+                elif perclos_alarm:
+                    # 지금은 눈을 떴어도 최근 창의 눈 감은 비율이 기준 이상
+                    self.eye_warning = True
+                    changed |= EYE_WARNING_CHANGED
+
+        # 고개 자세 비정상 감지 (3초 기준)
+        if head_pose is not None:
+            vertical_angle, horizontal_deviation, head_drop = head_pose
+            if (abs(vertical_angle - self.center_angle) > self.vertical_angle_threshold or
+                    horizontal_deviation > self.horizontal_deviation_threshold or
+                    head_drop < self.head_drop_threshold):
+                self.head_pose_good_since = None
+                if self.head_pose_bad_since is None:
+                    self.head_pose_bad_since = onset
+
+                if not self.head_pose_warning and timestamp - self.head_pose_bad_since >= self.head_pose_seconds:
+                    self.head_pose_warning = True
+                    changed |= HEAD_POSE_WARNING_CHANGED
+            else:
+                # 고개 자세가 정상일 때
+                self.head_pose_bad_since = None
+
+                # 1초 이상 정상 자세면 경고 해제
+                if self.head_pose_warning:
+                    if self.head_pose_good_since is None:
+                        self.head_pose_good_since = timestamp
+                    if timestamp - self.head_pose_good_since >= self.head_pose_reset_seconds:
+                        self.head_pose_warning = False
+                        self.head_pose_good_since = None
+                        changed |= HEAD_POSE_WARNING_CHANGED
+
+        return changed
+
+class AdaptiveScheduler:
+    """
+    should_analyze(timestamp): 랜드마크 단계에서 이 프레임을 분석할지 결정
+    update(timestamp, relaxed): 판단 단계에서 현재 운전자 상태가 충분히 정상인지 알려줌
+    onset(timestamp): 낮은 주기로 분석 중이면 직전 분석 시각 (DrowsinessDetector.update의 onset으로 전달)
+    idle_interval이 0이면 항상 모든 프레임을 분석
+    """
+    def __init__(self, idle_interval=ADAPTIVE_IDLE_INTERVAL, relax_seconds=ADAPTIVE_RELAX_SECONDS):
+        self.idle_interval = idle_interval
+        self.relax_seconds = relax_seconds
+        self.interval = 0.0
+        self.relaxed_since = None
+        self.last_analyzed = None
+        self.last_decided = None
+        self.analyzed = 0
+        self.skipped = 0
+
+    def should_analyze(self, timestamp):
+        if self.last_analyzed is not None and timestamp - self.last_analyzed < self.interval:
+            self.skipped += 1
+            return False
+
+        self.last_analyzed = timestamp
+        self.analyzed += 1
+        return True
+
+    def onset(self, timestamp):
+        # 건너뛴 프레임 사이 어디서든 눈을 감았을 수 있으므로 가장 이른 시각으로 봄
+        if self.interval > 0 and self.last_decided is not None and self.last_decided < timestamp:
+            return self.last_decided
+        return None
+
+    def update(self, timestamp, relaxed):
+        self.last_decided = timestamp
+        if not relaxed or self.idle_interval <= 0:
+            # 임계값에 가까워지면 다음 프레임부터 바로 전체 주기
+            self.relaxed_since = None
+            self.interval = 0.0
+            return
+
+        if self.relaxed_since is None:
+            self.relaxed_since = timestamp
+        if timestamp - self.relaxed_since >= self.relax_seconds:
+            self.interval = self.idle_interval
+
+    def stats(self):
+        total = self.analyzed + self.skipped
+        return {
+            "analyzed": self.analyzed,
+            "skipped": self.skipped,
+            "analyzed_ratio": round(self.analyzed / total, 3) if total else 1.0
+        }
+
+# 합성 샘플로 초당 처리량 측정
+def benchmark(sample_count=2_000_000, fps=30.0, eye_trigger="ear"):
+    detector = DrowsinessDetector(eye_trigger=eye_trigger)
+    interval = 1.0 / fps
+    open_pose = (90.0, 0.01, 0.45)
+    dropped_pose = (90.0, 0.01, 0.10)
+
+    # 5초 주기로 눈 감음/고개 떨굼이 섞인 샘플
+    samples = []
+    for i in range(1000):
+        phase = (i * interval) % 5.0
+        samples.append((0.15 if phase > 2.5 else 0.32, dropped_pose if phase > 4.0 else open_pose))
+
+    transitions = 0
+    update = detector.update
+    start = time.perf_counter()
+    for i in range(sample_count):
+        ear, head_pose = samples[i % 1000]
+        if update(i * interval, ear, head_pose):
+            transitions += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"[{eye_trigger}] 샘플 {sample_count}개, {elapsed:.2f}초 ({sample_count / elapsed / 1e6:.2f}M 샘플/초), 경고 변화 {transitions}회")
+
+if __name__ == "__main__":
+    for mode in EYE_TRIGGER_MODES:
+        benchmark(eye_trigger=mode)
@@ -1,99 +1,595 @@
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+import argparse
+import asyncio
 import json
+import os
+import signal
+import sys
+import time
+import zlib
+from collections import Counter
+
+from timer_wheel import TimerWheel
 
 # 브로커 주소
 MQTT_BROKER = "your_mqtt_broker_ip"
 
-# 토픽 정의
+# 토픽 정의 (차량 기준 상대 토픽)
 BREATHALYZER_TOPIC = "breathalyzer/status"   # 아두이노에서 보내는 토픽
 REQUEST_TOPIC      = "face/request"          # Jetson 얼굴인증 요청
 RESULT_TOPIC       = "face/result"           # Jetson 인증 결과
 DROWSINESS_TOPIC   = "driver/drowsiness"     # Jetson 실시간 졸음 감지 결과 (추가)
 CAR_TOPIC          = "car/server"            # 조향장치
 RPI_ENGINE         = "pi/engine"             # 라즈베리파이 시동 제어
-RPI_ALERT          = "pi/alert"              # 졸음 경고용 (true/false 모두 전송)
+RPI_ALERT          = "pi/alert"              # 졸음 경고용 (상태가 바뀔 때만 전송)
+STATE_TOPIC        = "hub/state"             # 차량 상태 전이 (관리자 페이지용, retain)
+
+# 허브가 보내는 JSON에 붙이는 출처 (허브가 구독 중인 토픽으로 다시 보낸 메시지를 받으면 처리하지 않음)
+HUB_ORIGIN = "hub"
+
+# 차량별 상태
+#   IDLE         : 음주측정 대기 (시동 꺼짐)
+#   BREATH_OK    : 음주측정 정상, 시동 허용 → 바로 얼굴 인증 요청
+#   FACE_PENDING : 얼굴 인증 결과 대기 (FACE_TIMEOUT 안에 결과가 없으면 다시 요청, FACE_RETRIES회 넘으면 차단)
+#   DRIVING      : 인증된 운전자 운행 중
+#   LOCKED       : 음주 감지/운전자 불일치/인증 시간 초과로 시동 차단 (LOCKOUT_SECONDS 뒤 IDLE)
+IDLE, BREATH_OK, FACE_PENDING, DRIVING, LOCKED = "IDLE", "BREATH_OK", "FACE_PENDING", "DRIVING", "LOCKED"
+
+FACE_TIMEOUT = 30.0       # 얼굴 인증 결과 대기 시간 (초, Jetson 캡처 대기 3초 포함)
+FACE_RETRIES = 1          # 시간 초과 시 다시 요청하는 횟수
+LOCKOUT_SECONDS = 60.0    # 차단 후 음주측정을 다시 받기까지 대기 시간 (0이면 바로 재측정 가능)
+
+# 차량별 토픽: vehicle/<차량 ID>/<상대 토픽>
+# 여러 차량이 같은 브로커를 써도 다른 차량의 시동을 켜거나 끄지 않도록 차량마다 토픽을 분리
+VEHICLE_PREFIX = "vehicle"
+
+# 접두사 없는 기존 토픽을 쓰는 장치(단일 차량 구성)는 이 차량으로 처리하고 응답도 기존 토픽으로 보냄
+LEGACY_VEHICLE_ID = os.environ.get("VEHICLE_ID", "default")
 
 client = mqtt.Client()
 
-def on_connect(client, userdata, flags, rc):
+# 전송 통계: ("forwarded" | "suppressed" | "loop_dropped", 상대 토픽) → 건수
+publish_counts = Counter()
+
+# 모든 차량의 상태 시간 초과를 처리하는 타이머 휠 (메시지 처리와 같은 스레드에서 advance)
+timers = TimerWheel()
+
+# 여러 프로세스로 나눠 실행할 때 (hub_supervisor.py)
+# 차량마다 crc32(차량 ID) % SHARD_COUNT 번 작업자가 상태를 가지며,
+# 공유 구독($share/hub/...)으로 받은 메시지가 다른 작업자 차량이면 hub/shard/<번호>/<원래 토픽>으로 넘겨줌
+SHARD_INDEX = 0
+SHARD_COUNT = 1
+SHARE_GROUP = "hub"
+SHARD_TOPIC_PREFIX = "hub/shard"
+
+# 작업자 재시작 시 인계
+# 작업자는 hub-<번호> 고정 클라이언트 ID로 세션을 유지하므로(SESSION_EXPIRY초), 재시작하는 동안 다른 작업자가
+# 넘겨준 이 작업자 차량의 메시지(QoS 1)는 브로커에 쌓였다가 새 작업자에게 전달됨
+# 종료할 때는 공유 구독을 먼저 해제하고 DRAIN_SECONDS 동안 이미 받은 메시지를 처리한 뒤 차량 상태를 STATE_FILE에 저장
+SESSION_EXPIRY = 300
+DRAIN_SECONDS = 0.5
+STATE_FILE = None
+
+def shard_of(vehicle_id, shard_count=None):
+    return zlib.crc32(vehicle_id.encode("utf-8")) % (shard_count or SHARD_COUNT)
+
+# 메시지마다 출력하는 로그 (차량이 많을 때는 --quiet로 끔)
+VERBOSE = True
+
+def log(message):
+    if VERBOSE:
+        print(message)
+
+def vehicle_topic(vehicle_id, topic):
+    return f"{VEHICLE_PREFIX}/{vehicle_id}/{topic}"
+
+# 차량별 상태 (차량 ID로 조회)
+class VehicleSession:
+    def __init__(self, vehicle_id):
+        self.vehicle_id = vehicle_id
+        self.prefix = f"{VEHICLE_PREFIX}/{vehicle_id}/"   # 응답 토픽 접두사 (기존 토픽으로 받으면 "")
+        self.state = IDLE
+        self.state_since = time.time()
+        self.face_attempts = 0
+        self.engine = None           # 마지막으로 보낸 시동 명령
+        self.last_state = {}         # 상대 토픽 → 마지막으로 보낸 상태 값 (같은 상태는 다시 보내지 않음)
+        self.face_match = None
+        self.drowsy = False
+        self.driver_name = None
+        self.message_count = 0
+        self.last_seen = None
+
+    # state를 주면 상태 전송으로 보고, 이 토픽에 마지막으로 보낸 상태와 같으면 보내지 않음 (엣지 트리거)
+    # state 없이 보내는 명령/알림은 항상 전송
+    def publish(self, topic, payload, retain=False, state=None):
+        if state is not None:
+            if self.last_state.get(topic) == state:
+                publish_counts["suppressed", topic] += 1
+                return False
+            self.last_state[topic] = state
+        client.publish(self.prefix + topic, payload, retain=retain)
+        publish_counts["forwarded", topic] += 1
+        return True
+
+    def to_dict(self):
+        return {
+            "vehicle_id": self.vehicle_id,
+            "state": self.state,
+            "state_since": self.state_since,
+            "face_attempts": self.face_attempts,
+            "prefix": self.prefix,
+            "last_state": self.last_state,
+            "engine": self.engine,
+            "face_match": self.face_match,
+            "drowsy": self.drowsy,
+            "driver_name": self.driver_name,
+            "message_count": self.message_count,
+            "last_seen": self.last_seen
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data["vehicle_id"])
+        session.state = data["state"]
+        session.state_since = data["state_since"]
+        session.face_attempts = data["face_attempts"]
+        session.prefix = data["prefix"]
+        # JSON에는 튜플이 없어 목록으로 저장되므로 다시 튜플로 (엣지 트리거 비교가 같은 값으로 보도록)
+        session.last_state = {topic: tuple(state) if isinstance(state, list) else state
+                              for topic, state in data["last_state"].items()}
+        session.engine = data["engine"]
+        session.face_match = data["face_match"]
+        session.drowsy = data["drowsy"]
+        session.driver_name = data["driver_name"]
+        session.message_count = data["message_count"]
+        session.last_seen = data["last_seen"]
+        return session
+
+sessions = {}
+
+def get_session(vehicle_id):
+    session = sessions.get(vehicle_id)
+    if session is None:
+        session = sessions[vehicle_id] = VehicleSession(vehicle_id)
+        log(f"[차량 등록] {vehicle_id} (현재 {len(sessions)}대)")
+    return session
+
+# 상태 전이: 상태가 실제로 바뀔 때만 호출되며, 이전 상태의 시간 초과는 취소하고 새 시간 초과를 등록
+def transition(session, state, reason, timeout=None):
+    previous = session.state
+    session.state = state
+    session.state_since = time.time()
+    if timeout:
+        arm_timeout(session, timeout)
+    else:
+        timers.cancel(session.vehicle_id)
+
+    report = session.to_dict()
+    report.update(previous=previous, reason=reason, timestamp=session.state_since)
+    session.publish(STATE_TOPIC, json.dumps(report), retain=True)
+    log(f"[{session.vehicle_id}] [상태] {previous} → {state} ({reason})")
+
+def arm_timeout(session, delay):
+    state = session.state
+    timers.schedule(session.vehicle_id, delay, lambda: on_state_timeout(session, state))
+
+def set_engine(session, command, pi_engine=True):
+    session.publish(CAR_TOPIC, command)
+    if pi_engine:
+        session.publish(RPI_ENGINE, command)
+    session.engine = command
+
+def request_face(session, reason):
+    session.face_attempts += 1
+    session.publish(REQUEST_TOPIC, "VERIFY_FACE")
+    transition(session, FACE_PENDING, reason, FACE_TIMEOUT)
+    log(f"[전송] 얼굴 인증 요청 → Jetson ({session.face_attempts}회째)")
+
+# 시동 차단 (음주 감지면 라즈베리파이에 ENGINE_OFF, 운전자 문제면 MISMATCH 알림)
+def lock(session, reason):
+    if reason == "breath_fail":
+        set_engine(session, "ENGINE_OFF")
+        log("[전송] ENGINE_OFF → 조향장치, 라즈베리파이 (음주 감지)")
+    else:
+        set_engine(session, "ENGINE_OFF", pi_engine=False)
+        session.publish(RPI_ALERT, "MISMATCH")
+        log("[전송] ENGINE_OFF → 조향장치, 운전자 불일치 알림 → 라즈베리파이")
+    session.last_state[RPI_ALERT] = "NORMAL"    # 라즈베리파이는 시동이 꺼지면 경고 표시를 초기화
+    transition(session, LOCKED, reason, LOCKOUT_SECONDS if LOCKOUT_SECONDS > 0 else None)
+
+def on_state_timeout(session, state):
+    if session.state != state:
+        return
+    if state == FACE_PENDING:
+        if session.face_attempts <= FACE_RETRIES:
+            transition(session, BREATH_OK, "face_timeout")
+            request_face(session, "face_retry")
+        else:
+            lock(session, "face_timeout")
+    elif state == LOCKED:
+        transition(session, IDLE, "lockout_expired")
+
+# 졸음 알림은 졸음 여부가 바뀔 때만 라즈베리파이에 전송
+# 허브가 보는 차량 상태와 관계없이 보냄 (허브 재시작/음주측정 메시지 누락으로 IDLE이어도 경고는 전달)
+def sync_alert(session):
+    alert = "DROWSY" if session.drowsy else "NORMAL"
+    if session.publish(RPI_ALERT, alert, state=alert):
+        log(f"[전송] 졸음 상태 → 라즈베리파이 ({alert})")
+
+# 1) 아두이노 음주측정기 결과 처리
+def handle_breathalyzer(session, payload):
+    log(f"[{session.vehicle_id}] [음주측정기 결과 수신] {payload}")
+    if payload == "1":  # 정상
+        if session.state == IDLE or (session.state == LOCKED and LOCKOUT_SECONDS <= 0):
+            set_engine(session, "ENGINE_ON")
+            log("[전송] ENGINE_ON → 조향장치, 라즈베리파이")
+            session.face_attempts = 0
+            session.last_state[RPI_ALERT] = "NORMAL"   # 시동이 켜지면 라즈베리파이는 정상 표시에서 시작
+            transition(session, BREATH_OK, "breath_ok")
+            request_face(session, "face_request")
+            sync_alert(session)
+        else:
+            log(f"[무시] 현재 상태 {session.state}에서는 음주측정 정상 결과를 처리하지 않음")
+    elif payload == "0":  # 음주 감지
+        if session.state != LOCKED:
+            lock(session, "breath_fail")
+
+# 2) Jetson 얼굴 인증 및 졸음 감지
+def handle_face_result(session, payload):
+    try:
+        data = json.loads(payload)
+        # 허브가 관리자 페이지용으로 다시 보낸 결과는 처리하지 않음 (자기 메시지 반복 방지)
+        if data.get("origin") == HUB_ORIGIN:
+            publish_counts["loop_dropped", RESULT_TOPIC] += 1
+            return
+
+        log(f"[{session.vehicle_id}] [Jetson 결과 수신] {payload}")
+        face_match = data.get("face_match")
+        drowsy     = data.get("drowsiness_detected", False)
+
+        session.face_match = face_match
+        session.drowsy = drowsy is True
+        if data.get("driver_name"):
+            session.driver_name = data["driver_name"]
+
+        # 인증 결과는 요청한 뒤 기다리는 중이거나 운행 중(주기적 재인증)일 때만 반영
+        # (시동이 꺼진 상태에서 늦게 온 결과는 무시)
+        if face_match in ("MATCH", "MISMATCH"):
+            if session.state not in (FACE_PENDING, DRIVING):
+                log(f"[무시] 현재 상태 {session.state}에서 받은 얼굴 인증 결과")
+            elif face_match == "MISMATCH":
+                # 얼굴 인증 실패 시 시동 차단 (운행 중 운전자가 바뀐 경우 포함)
+                lock(session, "face_mismatch")
+            elif session.state == FACE_PENDING:
+                transition(session, DRIVING, "face_match")
+
+        sync_alert(session)
+    except json.JSONDecodeError:
+        print("⚠️ JSON 파싱 오류 - Jetson 데이터 확인 필요")
+
+# 3) Jetson 실시간 졸음 감지 결과 처리 (새로 추가)
+def handle_drowsiness(session, payload):
+    log(f"[{session.vehicle_id}] [실시간 졸음 감지 수신] {payload}")
+    try:
+        data = json.loads(payload)
+        drowsy = data.get("drowsiness_detected", False)
+        session.drowsy = drowsy is True
+        if data.get("driver_name"):
+            session.driver_name = data["driver_name"]
+
+        # 실시간 졸음 상태가 바뀌었으면 라즈베리파이에 즉시 전송
+        sync_alert(session)
+
+        # 🎯 관리자 페이지로 실시간 졸음 감지 결과 전달 (추가된 부분)
+        admin_data = {
+            "face_match": "CONTINUE",  # 얼굴 인증은 계속 유지
+            "drowsiness_detected": drowsy,
+            "driver_name": data.get("driver_name") or "운전자",  # Jetson에서 식별한 등록 운전자 이름
+            "vehicle_id": session.vehicle_id,
+            "state": session.state,
+            "origin": HUB_ORIGIN,      # 허브도 face/result를 구독하므로 다시 받으면 무시
+            "timestamp": payload  # 원본 데이터도 포함
+        }
+        # 졸음 여부/운전자/차량 상태가 그대로면 다시 보내지 않음
+        if session.publish(RESULT_TOPIC, json.dumps(admin_data),
+                           state=(drowsy is True, admin_data["driver_name"], session.state)):
+            log(f"[전송] 실시간 졸음 상태 → 관리자 페이지 (drowsy: {drowsy})")
+
+    except json.JSONDecodeError:
+        print("⚠️ 실시간 졸음 감지 JSON 파싱 오류")
+
+# 상대 토픽 → 처리 함수 (토픽마다 if 비교 없이 한 번에 찾음)
+HANDLERS = {
+    BREATHALYZER_TOPIC: handle_breathalyzer,
+    RESULT_TOPIC: handle_face_result,
+    DROWSINESS_TOPIC: handle_drowsiness
+}
+
+# 수신 토픽을 (차량 ID, 상대 토픽, 기존 토픽 여부)로 분리
+def parse_topic(topic):
+    if topic.startswith(VEHICLE_PREFIX + "/"):
+        parts = topic.split("/", 2)
+        if len(parts) == 3 and parts[1]:
+            return parts[1], parts[2], False
+        return None, None, False
+    return LEGACY_VEHICLE_ID, topic, True
+
+# 장치가 보내는 토픽 구독 목록 (기존 단일 차량 토픽 + 모든 차량의 같은 토픽)
+# 여러 작업자면 공유 구독 그룹의 작업자 중 하나에게만 전달됨 (MQTT v5)
+def intake_topics():
+    topics = []
+    for topic in HANDLERS:
+        topics += [topic, vehicle_topic("+", topic)]
+    if SHARD_COUNT > 1:
+        topics = [f"$share/{SHARE_GROUP}/{topic}" for topic in topics]
+    return topics
+
+def on_connect(client, userdata, flags, rc, properties=None):
+    if rc != 0:
+        print(f"⚠️ MQTT 연결 거부 (rc={rc})")
+        return
+
     print("✅ EC2 MQTT 연결 완료, 토픽 구독 시작")
-    client.subscribe(BREATHALYZER_TOPIC)
-    client.subscribe(RESULT_TOPIC)
-    client.subscribe(DROWSINESS_TOPIC)  # 실시간 졸음 감지 토픽 구독 추가
+    for topic in intake_topics():
+        client.subscribe(topic)
+    if SHARD_COUNT > 1:
+        # 다른 작업자가 넘겨주는 이 작업자 차량의 메시지 (QoS 1: 재시작하는 동안에는 브로커가 보관)
+        client.subscribe(f"{SHARD_TOPIC_PREFIX}/{SHARD_INDEX}/#", qos=1)
+        print(f"작업자 {SHARD_INDEX}/{SHARD_COUNT} 공유 구독 완료")
 
 def on_message(client, userdata, msg):
-    payload = msg.payload.decode()
-    topic   = msg.topic
-    
-    # 1) 아두이노 음주측정기 결과 처리
-    if topic == BREATHALYZER_TOPIC:
-        print(f"[음주측정기 결과 수신] {payload}")
-        if payload == "1":  # 정상
-            client.publish(CAR_TOPIC, "ENGINE_ON")
-            client.publish(RPI_ENGINE, "ENGINE_ON")
-            client.publish(REQUEST_TOPIC, "VERIFY_FACE")
-            print("[전송] ENGINE_ON → 조향장치, 라즈베리파이")
-            print("[전송] 얼굴 인증 요청 → Jetson")
-        elif payload == "0":  # 음주 감지
-            client.publish(CAR_TOPIC, "ENGINE_OFF")
-            client.publish(RPI_ENGINE, "ENGINE_OFF")
-            print("[전송] ENGINE_OFF → 조향장치, 라즈베리파이 (음주 감지)")
-    
-    # 2) Jetson 얼굴 인증 및 졸음 감지
-    elif topic == RESULT_TOPIC:
-        print(f"[Jetson 결과 수신] {payload}")
+    topic_name = msg.topic
+    forwarded = SHARD_COUNT > 1 and topic_name.startswith(SHARD_TOPIC_PREFIX + "/")
+    if forwarded:
+        topic_name = topic_name.split("/", 3)[3]
+
+    vehicle_id, topic, legacy = parse_topic(topic_name)
+    handler = HANDLERS.get(topic)
+    if handler is None:
+        return
+
+    # 다른 작업자 차량이면 그 작업자에게 넘김 (차량 상태는 한 작업자에만 있음)
+    if SHARD_COUNT > 1 and not forwarded:
+        owner = shard_of(vehicle_id)
+        if owner != SHARD_INDEX:
+            client.publish(f"{SHARD_TOPIC_PREFIX}/{owner}/{topic_name}", msg.payload, qos=1)
+            return
+
+    session = get_session(vehicle_id)
+    session.prefix = "" if legacy else f"{VEHICLE_PREFIX}/{vehicle_id}/"
+    session.message_count += 1
+    session.last_seen = time.time()
+    handler(session, msg.payload.decode())
+
+# asyncio 이벤트 루프에서 paho 소켓을 직접 읽고 쓰도록 연결
+# (loop_forever의 네트워크 스레드 없이 이벤트 루프 하나에서 수신, 처리, 전송을 모두 수행)
+# 처리 함수 안의 publish는 보낼 패킷을 쌓기만 하고, 실제 전송은 소켓이 쓰기 가능해질 때 loop_write가 수행
+class AsyncioMqttHelper:
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc_task = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc_task = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+            self.misc_task = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        # keepalive/재전송 처리 (loop_forever가 하던 주기 작업)
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+# 주기적으로 처리량 출력
+async def report_stats(interval):
+    last_count = 0
+    while True:
+        await asyncio.sleep(interval)
+        count = sum(session.message_count for session in sessions.values())
+        states = Counter(session.state for session in sessions.values())
+        print(f"[허브] 차량 {len(sessions)}대, 메시지 {count}건 ({(count - last_count) / interval:.1f}건/초), "
+              f"상태 {dict(states)}, 대기 타이머 {len(timers)}개")
+        print(f"[허브] {publish_report()}")
+        last_count = count
+
+# 전송/억제 건수 요약 (억제/자기 메시지 무시는 토픽별로)
+def publish_report():
+    totals = Counter()
+    details = []
+    for (kind, topic), value in sorted(publish_counts.items()):
+        totals[kind] += value
+        if kind != "forwarded":
+            details.append(f"{topic} {kind} {value}")
+    report = (f"전송 {totals['forwarded']}건, 중복 억제 {totals['suppressed']}건, "
+              f"자기 메시지 무시 {totals['loop_dropped']}건")
+    return report + (f" ({', '.join(details)})" if details else "")
+
+# 차량 상태 저장/복원 (작업자 재시작 시 인계, 복원한 파일은 삭제)
+def save_sessions(path):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump([session.to_dict() for session in sessions.values()], f)
+    os.replace(temp_path, path)
+    print(f"차량 상태 저장: {len(sessions)}대 → {path}")
+
+def load_sessions(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 차량 상태 파일 읽기 실패: {e}")
+        return
+    os.remove(path)
+
+    now = time.time()
+    for item in data:
+        # 작업자 수가 바뀌었으면 이 작업자 차량만 이어받음
+        if SHARD_COUNT > 1 and shard_of(item["vehicle_id"]) != SHARD_INDEX:
+            continue
+        session = sessions[item["vehicle_id"]] = VehicleSession.from_dict(item)
+        # 종료 중에 흐른 시간을 빼고 시간 초과를 다시 등록 (이미 지났으면 다음 틱에 처리)
+        if session.state == FACE_PENDING:
+            arm_timeout(session, max(FACE_TIMEOUT - (now - session.state_since), 0))
+        elif session.state == LOCKED and LOCKOUT_SECONDS > 0:
+            arm_timeout(session, max(LOCKOUT_SECONDS - (now - session.state_since), 0))
+    print(f"차량 상태 복원: {len(sessions)}대 ← {path} ({dict(Counter(session.state for session in sessions.values()))})")
+
+# 타이머 휠을 이벤트 루프에서 틱마다 진행 (만료된 상태 시간 초과 처리)
+async def run_timers():
+    while True:
+        await asyncio.sleep(timers.tick)
+        timers.advance()
+
+async def run_async(broker, port, stats_interval=0, connect_options=None):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    disconnected = loop.create_future()
+
+    def on_disconnect(client, userdata, rc, properties=None):
+        if rc != 0:
+            print(f"⚠️ MQTT 연결 끊김 (rc={rc}), 재연결 시도")
+            loop.create_task(reconnect())
+        elif not disconnected.done():
+            disconnected.set_result(rc)
+
+    async def reconnect():
+        while not stop.is_set():
+            await asyncio.sleep(1)
+            try:
+                client.reconnect()
+                return
+            except OSError as e:
+                print(f"⚠️ 재연결 실패: {e}")
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            data = json.loads(payload)
-            face_match = data.get("face_match")
-            drowsy     = data.get("drowsiness_detected", False)
-            
-            # 얼굴 인증 실패 시 시동 차단
-            if face_match == "MISMATCH":
-                client.publish(CAR_TOPIC, "ENGINE_OFF")
-                client.publish(RPI_ALERT, "MISMATCH")
-                print("[전송] ENGINE_OFF → 조향장치")
-                print("[전송] 운전자 불일치 알림 → 라즈베리파이")
-            
-            # 졸음 여부 전송 (true/false 모두 라즈베리파이에 전달)
-            if drowsy is True:
-                client.publish(RPI_ALERT, "DROWSY")
-                print("[전송] 졸음 상태 → 라즈베리파이 (DROWSY)")
-            else:
-                client.publish(RPI_ALERT, "NORMAL")
-                print("[전송] 졸음 없음 → 라즈베리파이 (NORMAL)")
-        except json.JSONDecodeError:
-            print("⚠️ JSON 파싱 오류 - Jetson 데이터 확인 필요")
-    
-    # 3) Jetson 실시간 졸음 감지 결과 처리 (새로 추가)
-    elif topic == DROWSINESS_TOPIC:
-        print(f"[실시간 졸음 감지 수신] {payload}")
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.on_disconnect = on_disconnect
+    AsyncioMqttHelper(loop, client)
+    client.connect(broker, port, 60, **(connect_options or {}))
+
+    # 하위 작업은 이 함수 안에서만 살아 있고 종료할 때 함께 정리
+    tasks = [loop.create_task(run_timers())]
+    if stats_interval > 0:
+        tasks.append(loop.create_task(report_stats(stats_interval)))
+    try:
+        await stop.wait()
+    finally:
+        # 공유 구독을 먼저 해제해 새 메시지는 다른 작업자가 받게 하고, 이미 받은 메시지를 처리한 뒤 상태 저장
+        if client.is_connected():
+            client.unsubscribe(intake_topics())
+            await asyncio.sleep(DRAIN_SECONDS)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if STATE_FILE:
+            save_sessions(STATE_FILE)
+        client.disconnect()
         try:
-            data = json.loads(payload)
-            drowsy = data.get("drowsiness_detected", False)
-            
-            # 실시간 졸음 상태를 라즈베리파이에 즉시 전송
-            if drowsy is True:
-                client.publish(RPI_ALERT, "DROWSY")
-                print("[전송] 실시간 졸음 감지 → 라즈베리파이 (DROWSY)")
-            else:
-                client.publish(RPI_ALERT, "NORMAL")
-                print("[전송] 실시간 졸음 해제 → 라즈베리파이 (NORMAL)")
-            
-            # 🎯 관리자 페이지로 실시간 졸음 감지 결과 전달 (추가된 부분)
-            admin_data = {
-                "face_match": "CONTINUE",  # 얼굴 인증은 계속 유지
-                "drowsiness_detected": drowsy,
-                "driver_name": "운전자",
-                "timestamp": payload  # 원본 데이터도 포함
-            }
-            client.publish(RESULT_TOPIC, json.dumps(admin_data))
-            print(f"[전송] 실시간 졸음 상태 → 관리자 페이지 (drowsy: {drowsy})")
-            
-        except json.JSONDecodeError:
-            print("⚠️ 실시간 졸음 감지 JSON 파싱 오류")
-
-# 연결 및 시작
-client.on_connect = on_connect
-client.on_message = on_message
-client.connect(MQTT_BROKER, 1883, 60)
-client.loop_forever()
\ No newline at end of file
+            await asyncio.wait_for(disconnected, timeout=2.0)
+        except asyncio.TimeoutError:
+            pass
+        print(f"허브 종료 - {publish_report()}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="EC2 MQTT 중계 허브")
+    parser.add_argument("--broker", default=MQTT_BROKER, help="MQTT 브로커 주소")
+    parser.add_argument("--port", type=int, default=1883, help="MQTT 브로커 포트")
+    parser.add_argument("--engine", choices=["async", "thread"], default="async",
+                        help="async: asyncio 이벤트 루프에서 처리, thread: paho client.loop를 직접 도는 단일 스레드")
+    parser.add_argument("--quiet", action="store_true", help="메시지마다 출력하는 로그 끄기")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="N초마다 처리량 출력 (async 엔진, 0이면 출력 안 함)")
+    parser.add_argument("--face-timeout", type=float, default=FACE_TIMEOUT, help="얼굴 인증 결과 대기 시간 (초)")
+    parser.add_argument("--lockout", type=float, default=LOCKOUT_SECONDS,
+                        help="시동 차단 후 재측정까지 대기 시간 (초, 0이면 바로 재측정 가능)")
+    parser.add_argument("--shard", type=int, default=0, help="작업자 번호 (hub_supervisor.py가 지정)")
+    parser.add_argument("--shards", type=int, default=1, help="전체 작업자 수 (2 이상이면 MQTT v5 공유 구독 사용)")
+    parser.add_argument("--state-file", help="종료할 때 차량 상태를 저장하고 시작할 때 이어받을 파일")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global VERBOSE, SHARD_INDEX, SHARD_COUNT, FACE_TIMEOUT, LOCKOUT_SECONDS, STATE_FILE, client
+
+    args = parse_args(argv)
+    VERBOSE = not args.quiet
+    FACE_TIMEOUT, LOCKOUT_SECONDS = args.face_timeout, args.lockout
+    STATE_FILE = args.state_file
+
+    if args.shards > 1:
+        if not 0 <= args.shard < args.shards:
+            raise SystemExit(f"작업자 번호는 0 ~ {args.shards - 1} 사이여야 합니다: {args.shard}")
+        SHARD_INDEX, SHARD_COUNT = args.shard, args.shards
+        client = mqtt.Client(client_id=f"hub-{args.shard}", protocol=mqtt.MQTTv5)
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = SESSION_EXPIRY
+        connect_options = {"clean_start": False, "properties": properties}
+    else:
+        connect_options = {}
+
+    # 이전 작업자가 남긴 차량 상태를 연결 전에 복원 (연결하면 보관된 메시지가 바로 들어옴)
+    if STATE_FILE:
+        load_sessions(STATE_FILE)
+
+    if args.engine == "async":
+        asyncio.run(run_async(args.broker, args.port, args.stats_interval, connect_options))
+        return
+
+    # 연결 및 시작
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.broker, args.port, 60, **connect_options)
+
+    # SIGTERM(감독 프로세스의 재시작)도 finally의 인계 과정을 거치도록 예외로 바꿈
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # loop_forever 대신 직접 돌려 메시지 처리와 같은 스레드에서 타이머 휠도 진행 (상태에 잠금 불필요)
+    try:
+        while True:
+            rc = client.loop(timeout=timers.tick)
+            timers.advance()
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                print(f"⚠️ MQTT 연결 끊김 (rc={rc}), 재연결 시도")
+                time.sleep(1)
+                try:
+                    client.reconnect()
+                except OSError as e:
+                    print(f"⚠️ 재연결 실패: {e}")
+    finally:
+        if client.is_connected():
+            client.unsubscribe(intake_topics())
+            deadline = time.monotonic() + DRAIN_SECONDS
+            while time.monotonic() < deadline:
+                client.loop(timeout=timers.tick)
+                timers.advance()
+        if STATE_FILE:
+            save_sessions(STATE_FILE)
+        client.disconnect()
+        print(f"허브 종료 - {publish_report()}")
+
+if __name__ == "__main__":
+    main()
@@ -2,123 +2,228 @@ import cv2
 import numpy as np
 import time
 import threading
-import subprocess as sp
-from scipy.spatial import distance as dist
-import mediapipe as mp
+import argparse
 import math
 import os
+import glob
 import paho.mqtt.client as mqtt
 from datetime import datetime
 import json
-import base64
-import dlib  # 추가: dlib 얼굴 인식용
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from frame_source import FramePool, create_frame_source
+from face_gallery import FaceGallery
+from frame_quality import QualityGate
+from landmark_recording import LandmarkRecorder, RECORDING_SUFFIX
+from stage_profiler import StageProfiler
+from face_image_publisher import FaceImagePublisher, IMAGE_MODES, IMAGE_ENCODINGS
+from drowsiness_detector import (DrowsinessDetector, EarCalibrator, EAR_THRESHOLD, PERCLOS_THRESHOLD, EYE_TRIGGER_MODES,
+                                 CENTER_ANGLE, VERTICAL_ANGLE_THRESHOLD, HORIZONTAL_DEVIATION_THRESHOLD,
+                                 EYE_WARNING_CHANGED, HEAD_POSE_WARNING_CHANGED, AdaptiveScheduler,
+                                 ADAPTIVE_IDLE_INTERVAL)
 
 # MQTT 브로커 설정
 MQTT_BROKER = "54.180.239.110"
 MQTT_PORT = 1883
 
+# 차량 ID (설정하면 vehicle/<ID>/ 아래 토픽 사용, 여러 차량이 한 브로커를 쓸 때 필요)
+VEHICLE_ID = os.environ.get("VEHICLE_ID")
+TOPIC_PREFIX = f"vehicle/{VEHICLE_ID}/" if VEHICLE_ID else ""
+
 # MQTT 토픽
-REQUEST_TOPIC = "face/request"
-RESULT_TOPIC = "face/result"
-CAR_TOPIC = "car/server"
-DROWSINESS_TOPIC = "driver/drowsiness"
-FACE_IMAGE_TOPIC = "face/image"
-
-# MediaPipe 얼굴 메시 초기화
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
-    static_image_mode=False,
-    max_num_faces=1,
-    min_detection_confidence=0.2,
-    min_tracking_confidence=0.2,
-    refine_landmarks=False
-)
-
-# dlib 얼굴 인식 모델 초기화
-print("dlib 모델을 로드하는 중...")
-try:
-    # 얼굴 검출기
-    detector = dlib.get_frontal_face_detector()
-    
-    # 얼굴 랜드마크 예측기 (68개 점)
-    shape_predictor = dlib.shape_predictor("shape_predictor_68_face_landmarks.dat")
-    
-    # 얼굴 인식 모델 (128차원 벡터 생성)
-    face_encoder = dlib.face_recognition_model_v1("dlib_face_recognition_resnet_model_v1.dat")
-    
-    print("dlib 모델 로드 완료!")
-    dlib_available = True
-except Exception as e:
-    print(f"dlib 모델 로드 실패: {e}")
-    print("모델 파일을 다운로드하세요:")
-    print("- shape_predictor_68_face_landmarks.dat")
-    print("- dlib_face_recognition_resnet_model_v1.dat")
-    print("http://dlib.net/files/에서 다운로드 가능합니다.")
-    dlib_available = False
+REQUEST_TOPIC = TOPIC_PREFIX + "face/request"
+RESULT_TOPIC = TOPIC_PREFIX + "face/result"
+CAR_TOPIC = TOPIC_PREFIX + "car/server"
+DROWSINESS_TOPIC = TOPIC_PREFIX + "driver/drowsiness"
+METRICS_TOPIC = TOPIC_PREFIX + "jetson/metrics"
+
+# 모델은 처음 사용할 때 로드 (모듈 import만으로는 mediapipe/dlib 모델을 읽지 않음)
+# main에서는 카메라 파이프라인을 시작하는 동안 백그라운드 스레드에서 미리 로드한다
+DLIB_SHAPE_PREDICTOR_PATH = "shape_predictor_68_face_landmarks.dat"
+DLIB_FACE_ENCODER_PATH = "dlib_face_recognition_resnet_model_v1.dat"
+
+face_mesh = None
+roi_face_mesh = None
+face_mesh_lock = threading.Lock()
+dlib_models = None  # (얼굴 검출기, 68점 랜드마크 예측기, 128차원 인코더)
+dlib_state = "unloaded"  # "unloaded", "loaded", "failed"
+dlib_lock = threading.Lock()
+
+# 시작 시간 측정 (main 시작 기준 초)
+startup_start = time.perf_counter()
+startup_timings = {}
+
+def mark_startup(name):
+    if name not in startup_timings:
+        startup_timings[name] = time.perf_counter() - startup_start
+
+def report_startup():
+    print("시작 시간: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in startup_timings.items()))
+
+# MediaPipe 얼굴 메시 생성
+def create_face_mesh():
+    import mediapipe as mp
+    return mp.solutions.face_mesh.FaceMesh(
+        static_image_mode=False,
+        max_num_faces=1,
+        min_detection_confidence=0.2,
+        min_tracking_confidence=0.2,
+        refine_landmarks=False
+    )
+
+# 전체 화면용 얼굴 메시 (처음 호출할 때 생성)
+def get_face_mesh():
+    global face_mesh
+    if face_mesh is None:
+        with face_mesh_lock:
+            if face_mesh is None:
+                start = time.perf_counter()
+                mesh = create_face_mesh()
+                startup_timings["face_mesh_load"] = time.perf_counter() - start
+                face_mesh = mesh
+    return face_mesh
+
+# 얼굴 ROI 추적용 메시 (전체 화면용 face_mesh와 추적 상태를 섞지 않도록 분리)
+# 추적이 처음 시작될 때 만들면 랜드마크 단계가 그동안 멈추므로 미리 로드 대상에 포함
+def get_roi_face_mesh():
+    global roi_face_mesh
+    if roi_face_mesh is None:
+        with face_mesh_lock:
+            if roi_face_mesh is None:
+                start = time.perf_counter()
+                mesh = create_face_mesh()
+                startup_timings["roi_face_mesh_load"] = time.perf_counter() - start
+                roi_face_mesh = mesh
+    return roi_face_mesh
+
+# dlib 얼굴 인식 모델 (처음 호출할 때 로드, 실패하면 None)
+def get_dlib_models():
+    global dlib_models, dlib_state
+    if dlib_state == "unloaded":
+        with dlib_lock:
+            if dlib_state == "unloaded":
+                start = time.perf_counter()
+                print("dlib 모델을 로드하는 중...")
+                try:
+                    import dlib
+
+                    # 얼굴 검출기
+                    detector = dlib.get_frontal_face_detector()
+
+                    # 얼굴 랜드마크 예측기 (68개 점)
+                    shape_predictor = dlib.shape_predictor(DLIB_SHAPE_PREDICTOR_PATH)
+
+                    # 얼굴 인식 모델 (128차원 벡터 생성)
+                    face_encoder = dlib.face_recognition_model_v1(DLIB_FACE_ENCODER_PATH)
+
+                    dlib_models = (detector, shape_predictor, face_encoder)
+                    dlib_state = "loaded"
+                    print("dlib 모델 로드 완료!")
+                except Exception as e:
+                    print(f"dlib 모델 로드 실패: {e}")
+                    print("모델 파일을 다운로드하세요:")
+                    print(f"- {DLIB_SHAPE_PREDICTOR_PATH}")
+                    print(f"- {DLIB_FACE_ENCODER_PATH}")
+                    print("http://dlib.net/files/에서 다운로드 가능합니다.")
+                    dlib_state = "failed"
+                startup_timings["dlib_load"] = time.perf_counter() - start
+    return dlib_models
+
+def is_dlib_available(load=True):
+    """
+    load=False: 모델을 로드하지 않고 로드에 실패하지 않았는지만 확인 (판단 스레드용)
+    아직 로드 전이면 인코딩 작업자가 첫 작업에서 로드하고, 실패하면 인코딩 None으로 히스토그램 비교에 넘어감
+    """
+    if not load:
+        return dlib_state != "failed"
+    return get_dlib_models() is not None
+
+# 카메라가 켜지는 동안 모델을 미리 로드
+def preload_models():
+    get_face_mesh()
+    get_roi_face_mesh()
+    get_dlib_models()
+    mark_startup("models_ready")
 
 # 디렉토리 생성 함수
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-# 얼굴 이미지를 저장할 디렉토리 생성
-ensure_dir("face_captures")
-ensure_dir("face_encodings")  # 얼굴 인코딩 저장용
+# MediaPipe 랜드마크 전체를 (N, 2) float32 픽셀 좌표 배열로 한 번에 변환
+def landmarks_to_array(face_landmarks, image_width, image_height, out=None):
+    """
+    face_landmarks: MediaPipe 얼굴 랜드마크
+    out: 재사용할 (N, 2) float32 배열 (None이면 새로 할당)
+    """
+    landmarks = face_landmarks.landmark
+    count = len(landmarks)
+    if out is None or out.shape[0] != count:
+        out = np.empty((count, 2), dtype=np.float32)
+
+    flat = np.fromiter((value for landmark in landmarks for value in (landmark.x, landmark.y)),
+                       dtype=np.float32, count=count * 2)
+    np.multiply(flat.reshape(count, 2), (image_width, image_height), out=out)
+    return out
+
+# 얼굴 사각형 계산 (이미지 경계로 보정)
+def face_bounding_box(points, image_width, image_height):
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    return (max(0, int(x_min)), max(0, int(y_min)),
+            min(image_width, int(x_max)), min(image_height, int(y_max)))
 
 # 눈 가로세로비율(EAR) 계산 함수
 def calculate_EAR(eye_points):
-    # 눈의 세로 거리 계산
-    A = dist.euclidean(eye_points[1], eye_points[5])
-    B = dist.euclidean(eye_points[2], eye_points[4])
-   
-    # 눈의 가로 거리 계산
-    C = dist.euclidean(eye_points[0], eye_points[3])
-   
+    """
+    eye_points: 한쪽 눈 6점 (6, 2) 또는 여러 눈 (K, 6, 2)
+    반환값: 눈마다의 EAR
+    """
+    eye_points = np.asarray(eye_points, dtype=np.float32)
+
+    # 눈의 세로 거리 계산 (1-5, 2-4)
+    vertical = np.linalg.norm(eye_points[..., [1, 2], :] - eye_points[..., [5, 4], :], axis=-1).sum(axis=-1)
+
+    # 눈의 가로 거리 계산 (0-3)
+    horizontal = np.linalg.norm(eye_points[..., 0, :] - eye_points[..., 3, :], axis=-1)
+
     # 0으로 나누기 방지 및 EAR 계산
-    if C < 0.1:  
-        return 0.3
-       
-    ear = (A + B) / (2.0 * C)
-    return ear
+    return np.where(horizontal < 0.1, 0.3, vertical / (2.0 * np.maximum(horizontal, 0.1)))
+
+# 양쪽 눈 평균 EAR 계산
+def calculate_eyes_EAR(points):
+    return float(calculate_EAR(points[EYE_INDICES]).mean())
 
 # 고개 방향 계산 함수
-def calculate_head_pose(face_landmarks, image_width, image_height):
-    # 특징점 추출 (코, 이마, 턱)
-    nose_tip = (int(face_landmarks.landmark[1].x * image_width),
-               int(face_landmarks.landmark[1].y * image_height))
-    forehead = (int(face_landmarks.landmark[10].x * image_width),
-               int(face_landmarks.landmark[10].y * image_height))
-    chin = (int(face_landmarks.landmark[152].x * image_width),
-           int(face_landmarks.landmark[152].y * image_height))
-   
-    # 얼굴 중심점 (양쪽 귀 사이 중앙)
-    left_ear = (int(face_landmarks.landmark[234].x * image_width),
-               int(face_landmarks.landmark[234].y * image_height))
-    right_ear = (int(face_landmarks.landmark[454].x * image_width),
-                int(face_landmarks.landmark[454].y * image_height))
-   
-    # 얼굴 중심 계산
+def calculate_head_pose(points, image_width, image_height):
+    # 특징점 추출 (코, 이마, 턱, 양쪽 귀)
+    nose_tip, forehead, chin, left_ear, right_ear = points[HEAD_POSE_INDICES]
+
+    # 얼굴 중심 계산 (양쪽 귀 사이 중앙)
     face_center_x = (left_ear[0] + right_ear[0]) / 2
-    face_center_y = (left_ear[1] + right_ear[1]) / 2
-   
+
     # 고개 기울기 각도 계산 (세로축 기준)
     vertical_angle = math.degrees(math.atan2(chin[1] - nose_tip[1], chin[0] - nose_tip[0]))
-   
+
     # 정면 응시 여부 계산
     horizontal_deviation = abs(nose_tip[0] - face_center_x) / image_width
-   
+
     # 고개 떨굼 감지
     head_drop = (chin[1] - forehead[1]) / image_height
-   
-    return vertical_angle, horizontal_deviation, head_drop, (nose_tip, forehead, chin)
+
+    head_points = tuple((int(x), int(y)) for x, y in (nose_tip, forehead, chin))
+    return float(vertical_angle), float(horizontal_deviation), float(head_drop), head_points
 
 # dlib을 사용한 얼굴 인코딩 추출 함수
 def get_face_encoding_dlib(face_image):
     """
     dlib을 사용하여 얼굴 이미지에서 128차원 인코딩 벡터를 추출
     """
-    if not dlib_available:
+    models = get_dlib_models()
+    if models is None:
         return None
+    detector, shape_predictor, face_encoder = models
     
     # RGB로 변환 (dlib은 RGB를 사용)
     rgb_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
@@ -142,6 +247,89 @@ def get_face_encoding_dlib(face_image):
     # numpy 배열로 변환
     return np.array(face_encoding)
 
+# MediaPipe 468점 중 dlib 68점 배치에 대응하는 인덱스
+# (턱선 17, 눈썹 10, 코 9, 눈 12, 입술 20)
+MP_TO_DLIB68 = [
+    162, 234, 93, 58, 172, 136, 149, 148, 152, 377, 378, 365, 397, 288, 323, 454, 389,
+    70, 63, 105, 66, 107,
+    336, 296, 334, 293, 300,
+    168, 197, 5, 4,
+    75, 97, 2, 326, 305,
+    33, 160, 158, 133, 153, 144,
+    362, 385, 387, 263, 373, 380,
+    61, 39, 37, 0, 267, 269, 291, 405, 314, 17, 84, 181,
+    78, 82, 13, 312, 308, 317, 14, 87
+]
+
+# 인코딩 시 사용할 랜드마크 ("dlib": shape_predictor, "mediapipe": MediaPipe 점 변환)
+# 참조 얼굴과 검증 얼굴은 반드시 같은 방식으로 인코딩해야 거리 비교가 의미 있음
+ENCODING_LANDMARK_SOURCE = "dlib"
+
+# 인코딩용으로 얼굴 주변 영역을 잘라 복사 (얼굴 정렬 시 여백이 필요함)
+def crop_face_region(frame, face_box, face_points=None, margin=0.5):
+    """
+    frame: BGR 프레임
+    face_box: MediaPipe로 계산한 (x_min, y_min, x_max, y_max)
+    face_points: 프레임 좌표의 68점 (선택)
+    반환값: (잘라낸 영역 복사본, 영역 기준 얼굴 사각형, 영역 기준 68점)
+    """
+    frame_height, frame_width = frame.shape[:2]
+    x_min, y_min, x_max, y_max = face_box
+    pad_x = int((x_max - x_min) * margin)
+    pad_y = int((y_max - y_min) * margin)
+
+    left = max(0, x_min - pad_x)
+    top = max(0, y_min - pad_y)
+    right = min(frame_width, x_max + pad_x)
+    bottom = min(frame_height, y_max + pad_y)
+
+    region = frame[top:bottom, left:right].copy()
+    local_box = (x_min - left, y_min - top, x_max - left, y_max - top)
+
+    local_points = None
+    if face_points is not None:
+        local_points = np.asarray(face_points, dtype=np.float32) - (left, top)
+
+    return region, local_box, local_points
+
+# MediaPipe 랜드마크 배열을 dlib 68점 좌표로 변환 (복사본 반환)
+def mediapipe_to_dlib68(points):
+    return points[MP_TO_DLIB68]
+
+# MediaPipe 얼굴 사각형을 그대로 사용하는 dlib 인코딩 함수 (HOG 검출 생략)
+def get_face_encoding_from_box(face_image, face_box, face_points=None):
+    """
+    face_image: 얼굴 주변 BGR 이미지
+    face_box: face_image 기준 (x_min, y_min, x_max, y_max)
+    face_points: face_image 기준 68점 좌표 (주어지면 shape_predictor도 생략)
+    """
+    models = get_dlib_models()
+    if models is None:
+        return None
+    detector, shape_predictor, face_encoder = models
+
+    import dlib
+
+    # RGB로 변환 (dlib은 RGB를 사용)
+    rgb_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
+
+    x_min, y_min, x_max, y_max = face_box
+    face = dlib.rectangle(int(x_min), int(y_min), int(x_max), int(y_max))
+
+    # 얼굴 랜드마크 (MediaPipe 점이 있으면 그대로 사용)
+    if face_points is not None:
+        parts = dlib.points()
+        for x, y in face_points:
+            parts.append(dlib.point(int(round(x)), int(round(y))))
+        shape = dlib.full_object_detection(face, parts)
+    else:
+        shape = shape_predictor(rgb_image, face)
+
+    # 얼굴 인코딩 (128차원 벡터) 생성
+    face_encoding = face_encoder.compute_face_descriptor(rgb_image, shape)
+
+    return np.array(face_encoding)
+
 # dlib 기반 얼굴 비교 함수
 def compare_faces_dlib(encoding1, encoding2, threshold=0.6):
     """
@@ -195,43 +383,161 @@ def compare_faces_histogram(face1, face2):
     # 유사도 임계값 (0.7 이상이면 동일인으로 판단)
     return similarity, similarity >= 0.7
 
-# 얼굴 이미지를 base64로 인코딩하여 MQTT로 전송하는 함수
+# 얼굴 이미지를 관리자 페이지로 전송하는 함수 (판단 루프를 막지 않도록 대기열에 넣기만 함)
 def send_face_image(face_roi, is_match=True):
     """
-    얼굴 이미지를 관리자 페이지로 전송
+    얼굴 이미지를 관리자 페이지로 전송 (썸네일 인코딩/전송은 face_image_publisher 스레드에서 수행)
     face_roi: 얼굴 영역 이미지
     is_match: True면 등록된 사용자, False면 미등록 사용자
     """
-    try:
-        if face_roi is None or face_roi.size == 0:
-            return
-           
-        # 이미지 크기 조정 (전송 최적화를 위해 적당한 크기로)
-        face_resized = cv2.resize(face_roi, (150, 150))
-       
-        # 이미지를 JPEG로 인코딩
-        _, buffer = cv2.imencode('.jpg', face_resized, [cv2.IMWRITE_JPEG_QUALITY, 85])
-       
-        # base64로 인코딩
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
-       
-        # 전송할 데이터 구성
-        image_data = {
-            "image": image_base64,
-            "type": "registered" if is_match else "unregistered",
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-       
-        # MQTT로 전송
-        client.publish(FACE_IMAGE_TOPIC, json.dumps(image_data))
-        print(f"얼굴 이미지 전송 완료 - 타입: {'등록됨' if is_match else '미등록'}")
-       
-    except Exception as e:
-        print(f"얼굴 이미지 전송 오류: {e}")
+    face_image_publisher.submit(face_roi, is_match)
+
+# dlib 인코딩 전용 작업자 (메인 루프를 멈추지 않도록 별도 스레드에서 실행)
+class VerificationWorker:
+    """
+    얼굴 영역을 받아 dlib 인코딩을 비동기로 계산하고 Future를 돌려준다
+    대기열 길이와 인코딩 소요 시간을 함께 기록한다
+    """
+    def __init__(self, max_workers=1):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verify")
+        self.lock = threading.Lock()
+        self.queue_depth = 0
+        self.encode_count = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def submit_region(self, region, local_box, local_points=None):
+        # crop_face_region으로 이미 복사한 얼굴 주변 영역을 인코딩 (호출한 쪽에서 프레임 버퍼를 재사용해도 안전)
+        with self.lock:
+            self.queue_depth += 1
+        return self.executor.submit(self._encode, region, local_box, local_points)
+
+    def submit_reference(self, region, local_box, local_points=None):
+        # 참조 얼굴: 인코딩 후 갤러리 식별과 저장된 EAR 보정값 조회까지 작업자 스레드에서 수행
+        # Future 결과: (인코딩, 운전자 이름, 거리, EAR 보정값)
+        with self.lock:
+            self.queue_depth += 1
+        return self.executor.submit(self._identify_reference, region, local_box, local_points)
+
+    def submit_calibration(self, name, calibration):
+        # 보정값 파일 저장도 판단 스레드 밖에서
+        return self.executor.submit(save_ear_calibration, name, calibration)
+
+    def _encode(self, region, face_box, face_points):
+        start = time.perf_counter()
+        try:
+            return get_face_encoding_from_box(region, face_box, face_points)
+        finally:
+            latency = profiler.stop("encode", start) - start
+            with self.lock:
+                self.queue_depth -= 1
+                self.encode_count += 1
+                self.last_latency = latency
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+    def _identify_reference(self, region, face_box, face_points):
+        encoding = self._encode(region, face_box, face_points)
+        if encoding is None or not len(face_gallery):
+            return encoding, None, None, None
+        name, distance = face_gallery.identify(encoding)
+        return encoding, name, distance, face_gallery.ear_calibration(name) if name else None
+
+    def metrics(self):
+        with self.lock:
+            average = self.total_latency / self.encode_count if self.encode_count else 0.0
+            return {
+                "queue_depth": self.queue_depth,
+                "encode_count": self.encode_count,
+                "encode_latency_ms": round(self.last_latency * 1000, 1),
+                "encode_latency_avg_ms": round(average * 1000, 1),
+                "encode_latency_max_ms": round(self.max_latency * 1000, 1)
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# 얼굴 인증 다중 프레임 투표 파라미터
+VERIFY_INTERVAL = 10.0            # 검증 창 길이 (초)
+VERIFY_CANDIDATES = 3             # 창마다 보관하는 후보 프레임 수 (= 창당 최대 인코딩 수)
+VERIFY_CONFIDENT_DISTANCE = 0.45  # 집계 거리가 이보다 가까우면 남은 후보를 인코딩하지 않고 MATCH
+SHARPNESS_SCALE = 100.0           # 라플라시안 분산이 이 값이면 선명도 점수 0.5
+
+# 정면 정도 (정면이면 1, 고개 자세 임계값에 가까울수록 0)
+def head_pose_centrality(head_pose):
+    vertical_angle, horizontal_deviation, head_drop = head_pose
+    vertical = 1.0 - abs(vertical_angle - CENTER_ANGLE) / VERTICAL_ANGLE_THRESHOLD
+    horizontal = 1.0 - horizontal_deviation / HORIZONTAL_DEVIATION_THRESHOLD
+    return max(0.0, vertical) * max(0.0, horizontal)
+
+# 얼굴 인증 후보 프레임 점수 (정면일수록, 선명할수록 높음), 후보로 쓸 수 없으면 None
+def verification_score(quality_gate, frame, face_box, head_pose):
+    centrality = head_pose_centrality(head_pose)
+    if centrality <= 0.0:
+        # 옆을 본 프레임은 선명도 계산 생략
+        return None
+
+    # 얼굴이 작거나 흐리면 인코딩 후보에서 제외
+    ok, reason, sharpness = quality_gate.check_face(frame, face_box)
+    if not ok:
+        return None
+    return centrality * sharpness / (sharpness + SHARPNESS_SCALE)
+
+class VerificationVote:
+    """
+    검증 창 동안 점수가 높은 후보 프레임 몇 장만 (얼굴 주변 영역 복사본으로) 보관하고
+    창이 끝나면 점수 순으로 하나씩 인코딩해 인코딩 평균으로 판정한다
+    가장 좋은 후보가 충분히 가까우면 인코딩 한 번으로 끝나므로 평소 CPU 사용량은 기존과 같고
+    MISMATCH는 모든 후보를 모은 뒤에만 내린다
+    """
+    def __init__(self, session, size=VERIFY_CANDIDATES):
+        self.session = session
+        self.size = size
+        self.candidates = []  # [(점수, 영역, 영역 기준 사각형, 영역 기준 68점, 얼굴 ROI)] 점수 내림차순
+        self.encodings = []
+        self.future = None
+        self.face_roi = None
+
+    def offer(self, score, frame, face_box, face_points=None):
+        # 후보가 가득 찼고 가장 낮은 후보보다 점수가 낮으면 복사하지 않음
+        if len(self.candidates) >= self.size and score <= self.candidates[-1][0]:
+            return False
+
+        region, local_box, local_points = crop_face_region(frame, face_box, face_points)
+        x_min, y_min, x_max, y_max = face_box
+        face_roi = frame[y_min:y_max, x_min:x_max].copy()
+
+        self.candidates.append((score, region, local_box, local_points, face_roi))
+        self.candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        del self.candidates[self.size:]
+        return True
+
+    def submit_next(self, verification_worker):
+        score, region, local_box, local_points, face_roi = self.candidates.pop(0)
+        if self.face_roi is None:
+            # 결과 이미지로는 점수가 가장 높은 프레임을 사용
+            self.face_roi = face_roi
+        self.future = verification_worker.submit_region(region, local_box, local_points)
+
+    def collect(self):
+        future, self.future = self.future, None
+        try:
+            encoding = future.result()
+        except Exception as e:
+            print(f"얼굴 인코딩 오류: {e}")
+            encoding = None
+
+        if encoding is not None:
+            self.encodings.append(encoding)
 
 # MediaPipe 랜드마크 인덱스
 LEFT_EYE = [362, 385, 387, 263, 373, 380]
 RIGHT_EYE = [33, 160, 158, 133, 153, 144]
+EYE_INDICES = np.array([LEFT_EYE, RIGHT_EYE])
+HEAD_POSE_INDICES = np.array([1, 10, 152, 234, 454])  # 코, 이마, 턱, 왼쪽 귀, 오른쪽 귀
+# 랜드마크 녹화(--record)에 저장하는 점 (판단에 실제로 쓰는 눈 12점 + 고개 자세 5점)
+RECORD_INDICES = np.concatenate([EYE_INDICES.ravel(), HEAD_POSE_INDICES])
 
 # 전역 변수
 verification_mode = False
@@ -239,12 +545,21 @@ capture_mode = False
 reference_face = None
 reference_encoding = None  # 추가: 참조 얼굴의 dlib 인코딩
 last_verification_time = 0
-face_capture_countdown = 0
+face_capture_deadline = None  # 참조 얼굴 캡처 예정 시각 (프레임 타임스탬프 기준)
+verification_session = 0  # VERIFY_FACE 요청마다 증가 (이전 요청의 비동기 결과 무시용)
+face_gallery = FaceGallery()  # 등록 운전자 갤러리 (main에서 로드)
+driver_name = None  # 참조 얼굴로 식별한 등록 운전자 이름 (미등록이면 None)
+
+# 운전자 등록 시 수집할 인코딩 수와 간격 (초)
+ENROLL_SAMPLES = 5
+ENROLL_INTERVAL = 0.5
 
 # 졸음 감지 상태 전역 변수
 drowsiness_state = {
     "eye_warning": False,
     "head_pose_warning": False,
+    "ear": None,
+    "perclos": 0.0,
     "last_drowsiness_time": 0,
     "last_sent_state": None
 }
@@ -259,6 +574,7 @@ def on_connect(client, userdata, flags, rc):
 
 def on_message(client, userdata, msg):
     global verification_mode, capture_mode, reference_face, reference_encoding
+    global verification_session, face_capture_deadline, driver_name
    
     payload = msg.payload.decode()
     print(f"메시지 수신: {payload}")
@@ -269,19 +585,28 @@ def on_message(client, userdata, msg):
         capture_mode = True
         reference_face = None
         reference_encoding = None  # 인코딩도 초기화
+        driver_name = None
+        face_capture_deadline = None
+        verification_session += 1
 
 # MQTT 클라이언트 설정
 client = mqtt.Client()
 client.on_connect = on_connect
 client.on_message = on_message
 
+# 얼굴 이미지 전송 작업자 (전송 대상/형식은 main에서 명령행 옵션으로 설정)
+face_image_publisher = FaceImagePublisher(client.publish, topic_prefix=TOPIC_PREFIX)
+
 # 얼굴 인증 결과 전송 함수
 def send_verification_result(is_same_person, face_roi=None):
     result = {
         "face_match": "MATCH" if is_same_person else "MISMATCH",
+        "driver_name": driver_name,
         "drowsiness_detected": drowsiness_state["eye_warning"] or drowsiness_state["head_pose_warning"],
         "eye_warning": drowsiness_state["eye_warning"],
         "head_pose_warning": drowsiness_state["head_pose_warning"],
+        "ear": drowsiness_state["ear"],
+        "perclos": drowsiness_state["perclos"],
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
    
@@ -294,9 +619,12 @@ def send_verification_result(is_same_person, face_roi=None):
 # 졸음 감지 결과 전송 함수
 def send_drowsiness_alert():
     alert_data = {
+        "driver_name": driver_name,
         "drowsiness_detected": drowsiness_state["eye_warning"] or drowsiness_state["head_pose_warning"],
         "eye_warning": drowsiness_state["eye_warning"],
         "head_pose_warning": drowsiness_state["head_pose_warning"],
+        "ear": drowsiness_state["ear"],
+        "perclos": drowsiness_state["perclos"],
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
    
@@ -309,469 +637,1150 @@ def send_drowsiness_alert():
         drowsiness_state["last_sent_state"] = current_state
         drowsiness_state["last_drowsiness_time"] = time.time()
 
-def main():
-    global verification_mode, capture_mode, reference_face, reference_encoding
-    global last_verification_time, face_capture_countdown
-    global drowsiness_state
-   
+# 카메라 설정
+FRAME_WIDTH, FRAME_HEIGHT = 320, 240
+CAMERA_FPS = 30
+
+# 참조 얼굴 캡처 대기 시간 (초)
+FACE_CAPTURE_DELAY = 3.0
+
+# 파이프라인 통계
+pipeline_stats = {"decided_frames": 0}
+
+# 단계별 지연 시간 (프레임 읽기, 색 변환, face_mesh, 특징 계산, 판단, 인코딩, 오버레이, 화면 표시)
+profiler = StageProfiler()
+METRICS_INTERVAL = 5.0   # 지표를 METRICS_TOPIC으로 보내는 간격 (초)
+
+# 파이프라인 버퍼 크기 (가득 차면 가장 오래된 항목을 버림)
+CAPTURE_BUFFER_SIZE = 2
+LANDMARK_BUFFER_SIZE = 2
+RENDER_BUFFER_SIZE = 1
+
+# 프레임 버퍼 풀 크기 (각 링 버퍼 + 단계마다 처리 중인 프레임 + 읽는 중인 프레임)
+FRAME_POOL_SIZE = CAPTURE_BUFFER_SIZE + LANDMARK_BUFFER_SIZE + RENDER_BUFFER_SIZE + 4
+
+WINDOW_NAME = "Face Verification & Drowsiness Detection (dlib)"
+
+# 고정 크기 링 버퍼 (drop-oldest 백프레셔)
+class FrameRingBuffer:
+    """
+    스레드 간 프레임 전달용 링 버퍼
+    가득 찬 상태에서 put 하면 가장 오래된 항목을 버리고 dropped 카운트를 올린다
+    on_drop: 버려진 항목을 받는 함수 (프레임 버퍼를 풀에 돌려줄 때 사용)
+    lossless: True면 버리지 않고 자리가 날 때까지 기다림 (파일 재생 시 모든 프레임 처리)
+    """
+    def __init__(self, capacity, on_drop=None, lossless=False):
+        self.capacity = capacity
+        self.on_drop = on_drop
+        self.lossless = lossless
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        dropped_item = None
+        with self.condition:
+            while self.lossless and len(self.items) >= self.capacity and not self.closed:
+                self.condition.wait()
+            if len(self.items) >= self.capacity:
+                dropped_item = self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+        if dropped_item is not None and self.on_drop is not None:
+            self.on_drop(dropped_item)
+
+    def get_latest(self, timeout=None):
+        """
+        가장 최신 항목을 꺼내고 나머지는 버림 (항상 최신 프레임으로 판단하기 위함)
+        timeout 동안 항목이 없거나 버퍼가 닫히면 None 반환
+        """
+        with self.condition:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            if not self.items:
+                return None
+            if self.lossless:
+                # 순서대로 하나씩 꺼냄
+                item = self.items.popleft()
+                self.condition.notify_all()
+                return item
+            item = self.items.pop()
+            dropped_items = list(self.items)
+            self.dropped += len(dropped_items)
+            self.items.clear()
+
+        if self.on_drop is not None:
+            for dropped_item in dropped_items:
+                self.on_drop(dropped_item)
+        return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+# 1단계: 프레임 소스(카메라 파이프, 영상 파일 등)에서 프레임 읽기
+def capture_worker(frame_source, frame_pool, capture_buffer, stop_event):
+    seq = 0
+
     try:
-        # MQTT 브로커 연결
-        print(f"MQTT 브로커({MQTT_BROKER}:{MQTT_PORT})에 연결 중...")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.loop_start()
-       
-        print("얼굴 인증 및 졸음 감지 시스템 시작...")
-        
-        if dlib_available:
-            print("dlib 얼굴 인식 모델이 활성화되었습니다.")
-        else:
-            print("dlib을 사용할 수 없어 히스토그램 비교를 사용합니다.")
-       
-        # 해상도 설정
-        width, height = 320, 240
-       
-        # GStreamer 명령어 설정 (IMX219 카메라용)
-        command = [
-            'gst-launch-1.0',
-            '-q',
-            'nvarguscamerasrc',
-            '!', f'video/x-raw(memory:NVMM),width={width},height={height},format=NV12,framerate=30/1',
-            '!', 'nvvidconv', 'flip-method=0',
-            '!', 'video/x-raw,format=BGRx',
-            '!', 'videoconvert',
-            '!', 'video/x-raw,format=BGR',
-            '!', 'fdsink'
-        ]
-       
-        # 졸음 감지 파라미터
-        EAR_THRESHOLD = 0.3
-        EAR_FRAMES = 60
-        PERCLOS_WINDOW = 90
-        PERCLOS_THRESHOLD = 30
-       
-        # 고개 자세 감지 파라미터
-        CENTER_ANGLE = 90.0
-        VERTICAL_ANGLE_THRESHOLD = 25.0
-        HORIZONTAL_DEVIATION_THRESHOLD = 0.08
-        HEAD_DROP_THRESHOLD = 0.30
-        HEAD_POSE_FRAMES = 90
-       
-        # 경고 리셋 파라미터
-        EAR_RESET_FRAMES = 30
-        HEAD_POSE_RESET_FRAMES = 30
-       
-        # 졸음 감지 변수 초기화
-        ear_counter = 0
-        ear_normal_counter = 0
-        perclos_total_frames = 0
-        perclos_closed_frames = 0
-        head_pose_counter = 0
-        head_pose_normal_counter = 0
-       
-        ear_warning_flag = False
-        head_pose_warning_flag = False
-       
-        # GStreamer 프로세스 시작
-        process = sp.Popen(command, stdout=sp.PIPE, stderr=sp.PIPE, bufsize=10**9)
-       
-        # 프레임 크기 계산
-        frame_size = width * height * 3
-       
-        print("카메라 시작... 종료하려면 'q'를 누르세요.")
-        print("AWS 서버로부터 얼굴 인증 요청 대기 중...")
-        
-        while True:
-            # 프레임 읽기
-            raw_image = process.stdout.read(frame_size)
-           
-            if len(raw_image) != frame_size:
-                time.sleep(0.01)
+        while not stop_event.is_set():
+            # 풀에서 받은 버퍼에 바로 읽기 (프레임마다 bytes 객체를 만들지 않음)
+            frame = frame_pool.acquire()
+            start = profiler.start()
+            timestamp = frame_source.read_into(frame)
+            profiler.stop("read", start)
+            if timestamp is None:
+                frame_pool.release(frame)
+                print("프레임 소스가 종료되었습니다.")
+                break
+
+            # 프레임 번호는 소스 기준으로 증가 (버려진 프레임도 포함)
+            if seq == 0:
+                mark_startup("first_frame")
+            seq += 1
+            profiler.count("captured")
+            capture_buffer.put((seq, timestamp, frame))
+    except Exception as e:
+        print(f"프레임 읽기 오류: {e}")
+    finally:
+        # 버퍼를 닫으면 남은 프레임을 처리한 뒤 다음 단계가 차례로 종료됨
+        capture_buffer.close()
+
+# 랜드마크 배열에서 판단에 필요한 값만 추출 (배열은 다음 프레임에서 재사용됨)
+def extract_face_features(points):
+    width, height = FRAME_WIDTH, FRAME_HEIGHT
+
+    features = {
+        "box": face_bounding_box(points, width, height),
+        "eye_points": None,
+        "ear": None,
+        "head_pose": (0, 0, 0),
+        "head_points": None,
+        "encoding_points": None
+    }
+
+    # 눈 랜드마크 및 EAR
+    try:
+        features["eye_points"] = points[EYE_INDICES].reshape(-1, 2).astype(np.int32)
+        features["ear"] = calculate_eyes_EAR(points)
+    except Exception as e:
+        print(f"눈 랜드마크 추출 오류: {e}")
+
+    # 고개 자세
+    try:
+        vertical_angle, horizontal_deviation, head_drop, head_points = calculate_head_pose(
+            points, width, height)
+        features["head_pose"] = (vertical_angle, horizontal_deviation, head_drop)
+        features["head_points"] = head_points
+    except Exception as e:
+        print(f"고개 자세 계산 오류: {e}")
+
+    # 인코딩에 MediaPipe 점을 쓰는 경우 68점으로 변환 (shape_predictor 생략)
+    if ENCODING_LANDMARK_SOURCE == "mediapipe":
+        features["encoding_points"] = mediapipe_to_dlib68(points)
+
+    return features
+
+# ROI 추적 파라미터
+ROI_MARGIN = 0.6     # 이전 얼굴 사각형 크기 대비 여백 (프레임 사이 움직임 허용 범위)
+ROI_MIN_SIZE = 96    # 잘라낼 영역의 최소 크기 (픽셀)
+
+class FaceRoiTracker:
+    """
+    이전 프레임의 얼굴 사각형 주변만 잘라 face_mesh를 실행하고 좌표를 프레임 기준으로 되돌린다
+    잘라낸 영역에서 얼굴을 놓치면 같은 프레임을 전체 화면으로 다시 검출한다
+    얼굴 크기만큼만 처리하므로 카메라 해상도를 올려도 추론 비용이 비례해서 늘지 않는다
+    """
+    def __init__(self, width, height, margin=ROI_MARGIN, min_size=ROI_MIN_SIZE):
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.min_size = min_size
+        self.box = None
+        self.rgb_frame = np.empty((height, width, 3), dtype=np.uint8)
+
+        self.roi_frames = 0
+        self.full_frames = 0
+        self.lost = 0
+
+    def crop_bounds(self):
+        x_min, y_min, x_max, y_max = self.box
+        size = max(x_max - x_min, y_max - y_min)
+        half = max(self.min_size, int(size * (1 + 2 * self.margin))) // 2
+        center_x, center_y = (x_min + x_max) // 2, (y_min + y_max) // 2
+
+        left = max(0, center_x - half)
+        top = max(0, center_y - half)
+        right = min(self.width, center_x + half)
+        bottom = min(self.height, center_y + half)
+        return left, top, right, bottom
+
+    def process(self, frame, points):
+        """얼굴을 찾으면 points를 프레임 좌표로 채우고 True 반환"""
+        if self.box is not None:
+            left, top, right, bottom = self.crop_bounds()
+            start = profiler.start()
+            rgb_crop = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2RGB)
+            start = profiler.stop("cvt_color", start)
+            results = get_roi_face_mesh().process(rgb_crop)
+            profiler.stop("face_mesh_roi", start)
+            self.roi_frames += 1
+
+            if results.multi_face_landmarks:
+                landmarks_to_array(results.multi_face_landmarks[0], right - left, bottom - top, points)
+                points += (left, top)
+                self.box = face_bounding_box(points, self.width, self.height)
+                return True
+
+            # 추적 실패: 같은 프레임을 전체 화면으로 다시 검출
+            self.lost += 1
+            self.box = None
+
+        start = profiler.start()
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb_frame)
+        start = profiler.stop("cvt_color", start)
+        results = get_face_mesh().process(self.rgb_frame)
+        profiler.stop("face_mesh", start)
+        self.full_frames += 1
+
+        if results.multi_face_landmarks:
+            landmarks_to_array(results.multi_face_landmarks[0], self.width, self.height, points)
+            self.box = face_bounding_box(points, self.width, self.height)
+            return True
+        return False
+
+    def stats(self):
+        return {"roi_frames": self.roi_frames, "full_frames": self.full_frames, "lost": self.lost}
+
+# 2단계: 얼굴 랜드마크 추출
+def landmark_worker(frame_pool, capture_buffer, landmark_buffer, stop_event, quality_gate, roi_tracker, scheduler,
+                    recorder=None):
+    """
+    recorder: LandmarkRecorder면 분석한 프레임의 랜드마크/EAR/고개 자세를 기록 (미검출 프레임도 타임스탬프 기록)
+              기록하는 스레드가 이 단계뿐이므로 단계가 끝날 때 여기서 닫음
+    """
+    # 프레임마다 재사용하는 랜드마크 좌표 배열
+    points = np.empty((468, 2), dtype=np.float32)
+
+    try:
+        while not stop_event.is_set():
+            item = capture_buffer.get_latest(timeout=0.5)
+            if item is None:
+                if capture_buffer.closed:
+                    break
                 continue
-           
-            # 프레임을 NumPy 배열로 변환
-            try:
-                frame = np.frombuffer(raw_image, dtype=np.uint8).reshape((height, width, 3))
-            except Exception as e:
-                print(f"프레임 변환 오류: {e}")
+
+            seq, timestamp, frame = item
+
+            # 운전자 상태가 충분히 정상이면 낮은 주기로만 분석 (나머지 프레임은 바로 반환)
+            if not scheduler.should_analyze(timestamp):
+                profiler.count("idle_skipped")
+                frame_pool.release(frame)
                 continue
-           
-            # 프레임 유효성 확인
-            if frame is None or frame.size == 0:
+
+            # 어둡거나 포화되었거나 흔들린 프레임은 face_mesh를 건너뜀 (얼굴 미검출과 같게 처리)
+            start = profiler.start()
+            ok, reason, sharpness = quality_gate.check_frame(frame)
+            profiler.stop("quality", start)
+            if not ok:
+                if recorder is not None:
+                    recorder.append_missing(timestamp)
+                landmark_buffer.put((seq, timestamp, frame, None))
                 continue
-           
-            # 안전한 복사본 생성
-            display_frame = frame.copy()
-           
-            # RGB로 변환 (MediaPipe 요구사항)
+
+            # 얼굴 랜드마크 감지 (이전 얼굴 주변만 처리, 놓치면 전체 화면)
             try:
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                found = roi_tracker.process(frame, points)
             except Exception as e:
-                print(f"RGB 변환 오류: {e}")
+                print(f"얼굴 랜드마크 감지 오류: {e}")
+                frame_pool.release(frame)
                 continue
-           
-            # 얼굴 랜드마크 감지
-            results = face_mesh.process(rgb_frame)
-           
-            # 현재 시간
-            current_time = time.time()
-           
-            # 상태 표시
-            if not verification_mode:
-                status_text = "AWS 서버 요청 대기 중..."
-            elif capture_mode:
-                status_text = "얼굴 캡처 모드 - 3초 후 캡처합니다"
-            else:
-                status_text = "얼굴 검증 모드 - 10초마다 검증합니다"
-           
-            cv2.putText(display_frame, status_text, (10, 20),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-           
+
+            start = profiler.start()
+            features = extract_face_features(points) if found else None
+            profiler.stop("features", start)
+            profiler.count("analyzed")
+
+            if recorder is not None:
+                if features is not None:
+                    recorder.append(timestamp, points, features["ear"], features["head_pose"])
+                else:
+                    recorder.append_missing(timestamp)
+
+            landmark_buffer.put((seq, timestamp, frame, features))
+    except Exception as e:
+        print(f"랜드마크 처리 오류: {e}")
+    finally:
+        landmark_buffer.close()
+        if recorder is not None:
+            recorder.close()
+
+# 비동기로 추출된 참조 얼굴 인코딩/운전자 식별 결과 반영
+def apply_reference_encoding(future):
+    """반환값: 식별한 등록 운전자의 저장된 EAR 보정값 (없으면 None)"""
+    global reference_encoding, driver_name
+
+    try:
+        encoding, name, distance, calibration = future.result()
+    except Exception as e:
+        print(f"참조 얼굴 인코딩 오류: {e}")
+        encoding = None
+
+    if encoding is not None:
+        reference_encoding = encoding
+        print("참조 얼굴 인코딩 추출 성공!")
+
+        # 등록 운전자 갤러리에서 식별한 운전자
+        if distance is not None:
+            driver_name = name
+            print(f"운전자 식별: {driver_name} (거리 {distance:.3f})" if driver_name else
+                  f"등록되지 않은 운전자입니다. (가장 가까운 거리 {distance:.3f})")
+
+        # 인코딩 저장 (옵션)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        np.save(f"face_encodings/reference_encoding_{timestamp}.npy", reference_encoding)
+        return calibration
+
+    print("dlib 인코딩 추출 실패. 히스토그램 비교를 사용합니다.")
+    return None
+
+# 운전자별 EAR 보정값은 갤러리의 운전자 정보에 저장 (시작할 때 갤러리와 함께 로드, 등록 운전자만)
+def save_ear_calibration(name, calibration):
+    try:
+        face_gallery.set_ear_calibration(name, calibration)
+        print(f"EAR 보정값 저장: {name}")
+    except OSError as e:
+        print(f"EAR 보정값 저장 오류: {e}")
+
+# 후보 프레임 인코딩들의 평균으로 얼굴 비교
+def decide_verification(encodings):
+    """
+    반환값: (유사도, 동일인 여부, 유사도 텍스트, 거리), 비교할 인코딩이 없으면 None
+    """
+    if not encodings:
+        return None
+
+    encoding = np.mean(encodings, axis=0)
+
+    if driver_name is not None and len(face_gallery):
+        # 등록 운전자면 갤러리 1:N 검색으로 같은 운전자인지 확인
+        name, distance = face_gallery.identify(encoding)
+        is_same_person = name == driver_name
+        similarity = max(0, 1 - distance)
+        print(f"갤러리 검색 결과: {name or '미등록'}({distance:.3f})")
+
+        return similarity, is_same_person, f"{name or 'Unknown'}: {similarity:.3f}", distance
+
+    if reference_encoding is not None:
+        # 미등록 운전자는 참조 얼굴과 1:1 비교
+        similarity, is_same_person = compare_faces_dlib(
+            reference_encoding, encoding, threshold=0.6)
+        distance = float(np.linalg.norm(reference_encoding - encoding))
+
+        return similarity, is_same_person, f"Similarity: {similarity:.3f}", distance
+
+    return None
+
+# 비동기 얼굴 비교 완료 처리 및 결과 전송
+def complete_verification(vote, decision, verification_worker):
+    face_roi = vote.face_roi
+
+    if decision is not None:
+        similarity, is_same_person, similarity_text, distance = decision
+    else:
+        print("현재 얼굴 인코딩 추출 실패")
+        # 폴백: 히스토그램 비교
+        similarity, is_same_person = compare_faces_histogram(reference_face, face_roi)
+        similarity_text = f"Histogram: {similarity:.2f}"
+
+    result_text = "MATCH" if is_same_person else "MISMATCH"
+
+    metrics = verification_worker.metrics()
+    print(f"얼굴 비교 결과: {similarity:.2f} - {result_text} (후보 {len(vote.encodings)}장 집계, "
+          f"인코딩 {metrics['encode_latency_ms']}ms, 대기열 {metrics['queue_depth']})")
+
+    # AWS 서버로 결과 전송
+    send_verification_result(is_same_person, face_roi)
+
+    return similarity_text, result_text, is_same_person
+
+# 운전자 등록: 프레임 소스에서 얼굴 인코딩 여러 장을 모아 갤러리에 평균을 저장
+def enroll_driver(name, frame_source, samples=ENROLL_SAMPLES, interval=ENROLL_INTERVAL):
+    if not is_dlib_available():
+        print("dlib을 사용할 수 없어 운전자를 등록할 수 없습니다.")
+        return False
+
+    frame = np.empty((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    rgb_frame = np.empty_like(frame)
+    points = np.empty((468, 2), dtype=np.float32)
+    encodings = []
+    last_sample_time = None
+
+    print(f"운전자 '{name}' 등록을 시작합니다. 정면을 바라봐 주세요.")
+    while len(encodings) < samples:
+        timestamp = frame_source.read_into(frame)
+        if timestamp is None:
+            break
+        if last_sample_time is not None and timestamp - last_sample_time < interval:
+            continue
+
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
+        results = get_face_mesh().process(rgb_frame)
+        if not results.multi_face_landmarks:
+            continue
+
+        landmarks_to_array(results.multi_face_landmarks[0], FRAME_WIDTH, FRAME_HEIGHT, out=points)
+        face_box = face_bounding_box(points, FRAME_WIDTH, FRAME_HEIGHT)
+        # 검증과 같은 랜드마크로 정렬해야 등록 인코딩과 실시간 인코딩의 거리를 비교할 수 있음
+        encoding_points = mediapipe_to_dlib68(points) if ENCODING_LANDMARK_SOURCE == "mediapipe" else None
+        region, local_box, local_points = crop_face_region(frame, face_box, encoding_points)
+        encoding = get_face_encoding_from_box(region, local_box, local_points)
+        if encoding is None:
+            continue
+
+        encodings.append(encoding)
+        last_sample_time = timestamp
+        print(f"인코딩 수집 {len(encodings)}/{samples}")
+
+    if len(encodings) < samples:
+        print("얼굴 인코딩을 충분히 수집하지 못해 등록을 취소합니다.")
+        return False
+
+    face_gallery.enroll(name, encodings)
+    print(f"운전자 '{name}' 등록 완료 (등록 운전자 {len(face_gallery)}명)")
+    return True
+
+# 3단계: 졸음 판단 및 얼굴 인증
+def decision_worker(landmark_buffer, render_buffer, frame_pool, verification_worker, quality_gate, scheduler,
+                    stop_event, preview_every=1, eye_trigger="ear"):
+    """
+    preview_every: N이면 N 프레임마다 한 번만 표시 단계로 넘김 (0이면 헤드리스, 표시 안 함)
+    eye_trigger: 눈 경고 기준 ("ear": 2초 연속 눈 감음, "perclos": PERCLOS, "either": 둘 중 하나)
+    """
+    global verification_mode, capture_mode, reference_face, reference_encoding
+    global last_verification_time, face_capture_deadline
+    global drowsiness_state
+
+    # 졸음 판단은 프레임 타임스탬프 기준 (FPS와 무관)
+    # PERCLOS 값은 경고 기준과 관계없이 화면과 졸음 알림에 표시하므로 항상 갱신
+    detector = DrowsinessDetector(eye_trigger=eye_trigger, track_perclos=True)
+
+    # 진행 중인 비동기 인코딩 (Future, ...)
+    pending_reference = None
+
+    # 얼굴 인증 투표: 현재 창의 후보 수집(vote)과 이전 창의 인코딩 진행(pending_vote)
+    vote = None
+    pending_vote = None
+
+    # 참조 얼굴 캡처 카운트다운 동안 가장 좋은 프레임 (후보 1장)
+    reference_vote = None
+
+    # 운전자별 EAR 보정 (참조 얼굴 캡처 직후 시작, 세션이 바뀌면 폐기)
+    calibrator = None
+    calibration = None
+    calibration_session = None
+
+    try:
+        while not stop_event.is_set():
+            item = landmark_buffer.get_latest(timeout=0.5)
+            if item is None:
+                if landmark_buffer.closed:
+                    break
+                continue
+
+            seq, current_time, frame, features = item
+            pipeline_stats["decided_frames"] += 1
+            profiler.count("decided")
+            decision_start = profiler.start()
+
+            overlay = {
+                "verification_mode": verification_mode,
+                "capture_mode": capture_mode,
+                "face": None,
+                "no_face_capture": False,
+                "capture_seconds_left": None,
+                "time_to_next": None,
+                "verification_text": None
+            }
+
+            # 비동기 인코딩 결과 확인 (이전 VERIFY_FACE 요청의 결과는 버림)
+            if pending_reference is not None and pending_reference[0].done():
+                future, session = pending_reference
+                pending_reference = None
+                if session == verification_session:
+                    saved = apply_reference_encoding(future)
+
+                    if driver_name is not None:
+                        if calibration is None and saved is not None:
+                            # 이전에 보정한 등록 운전자면 저장된 임계값을 바로 사용
+                            calibration = saved
+                            calibrator = None
+                            detector.ear_threshold = saved["ear_threshold"]
+                            print(f"저장된 EAR 임계값을 사용합니다: {detector.ear_threshold:.3f}")
+                        elif calibration is not None:
+                            # 운전자 식별보다 보정이 먼저 끝난 경우
+                            verification_worker.submit_calibration(driver_name, calibration)
+
+            if pending_vote is not None and pending_vote.future.done():
+                pending_vote.collect()
+                if pending_vote.session != verification_session or reference_face is None:
+                    pending_vote = None
+                else:
+                    decision = decide_verification(pending_vote.encodings)
+                    confident = decision is not None and decision[1] and decision[3] < VERIFY_CONFIDENT_DISTANCE
+
+                    if pending_vote.candidates and not confident:
+                        # 확실한 MATCH가 아니면 다음 후보까지 인코딩 (창당 최대 VERIFY_CANDIDATES회)
+                        pending_vote.submit_next(verification_worker)
+                    else:
+                        overlay["verification_text"] = complete_verification(
+                            pending_vote, decision, verification_worker)
+                        pending_vote = None
+
             # 얼굴 랜드마크가 감지된 경우
-            if results.multi_face_landmarks:
-                face_landmarks = results.multi_face_landmarks[0]
-               
-                # 얼굴 경계 좌표 계산
-                x_coords = [landmark.x * width for landmark in face_landmarks.landmark]
-                y_coords = [landmark.y * height for landmark in face_landmarks.landmark]
-               
-                # 얼굴 사각형 좌표
-                x_min, x_max = int(min(x_coords)), int(max(x_coords))
-                y_min, y_max = int(min(y_coords)), int(max(y_coords))
-               
-                # 사각형 경계 보정
-                x_min = max(0, x_min)
-                y_min = max(0, y_min)
-                x_max = min(width, x_max)
-                y_max = min(height, y_max)
-               
+            if features is not None:
+                if "first_landmarks" not in startup_timings:
+                    mark_startup("first_landmarks")
+                    report_startup()
+
                 # 얼굴 영역
+                face_box = features["box"]
+                x_min, y_min, x_max, y_max = face_box
                 face_roi = frame[y_min:y_max, x_min:x_max]
-               
-                # 눈 랜드마크 추출
-                try:
-                    left_eye_points = [(int(face_landmarks.landmark[idx].x * width),
-                                        int(face_landmarks.landmark[idx].y * height)) for idx in LEFT_EYE]
-                    right_eye_points = [(int(face_landmarks.landmark[idx].x * width),
-                                         int(face_landmarks.landmark[idx].y * height)) for idx in RIGHT_EYE]
-                   
-                    # 눈 랜드마크 그리기
-                    for point in left_eye_points + right_eye_points:
-                        cv2.drawMarker(display_frame, point, (0, 255, 0),
-                                      markerType=0, markerSize=3, thickness=1)
-                   
-                    # EAR 계산
-                    left_ear = calculate_EAR(left_eye_points)
-                    right_ear = calculate_EAR(right_eye_points)
-                    current_ear = (left_ear + right_ear) / 2.0
-                   
-                    # EAR 값 표시
-                    eye_text_color = (0, 0, 255) if current_ear < EAR_THRESHOLD else (0, 255, 0)
-                    cv2.putText(display_frame, f"EAR: {current_ear:.2f}", (10, 40),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4, eye_text_color, 1)
-                except Exception as e:
-                    print(f"눈 랜드마크 추출 오류: {e}")
-                    current_ear = None
-               
-                # 고개 자세 계산
-                try:
-                    vertical_angle, horizontal_deviation, head_drop, head_points = calculate_head_pose(
-                        face_landmarks, width, height)
-                   
-                    # 정면 응시 여부
-                    face_centered = (
-                        abs(vertical_angle - CENTER_ANGLE) <= VERTICAL_ANGLE_THRESHOLD and
-                        horizontal_deviation <= HORIZONTAL_DEVIATION_THRESHOLD and
-                        head_drop >= HEAD_DROP_THRESHOLD
-                    )
-                   
-                    # 고개 자세 정보 표시
-                    cv2.putText(display_frame, f"Head angle: {vertical_angle:.1f}", (10, 60),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-                    cv2.putText(display_frame, f"Gaze dev: {horizontal_deviation:.2f}", (10, 80),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-                    cv2.putText(display_frame, f"Head drop: {head_drop:.2f}", (10, 100),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-                   
-                    # 고개 자세 포인트 그리기
-                    if head_points:
-                        for point in head_points:
-                            cv2.drawMarker(display_frame, point, (255, 0, 0),
-                                          markerType=0, markerSize=5, thickness=1)
-                except Exception as e:
-                    print(f"고개 자세 계산 오류: {e}")
-                    face_centered = False
-                    vertical_angle, horizontal_deviation, head_drop = 0, 0, 0
-               
+                encoding_points = features["encoding_points"]
+
+                current_ear = features["ear"]
+                vertical_angle, horizontal_deviation, head_drop = features["head_pose"]
+                overlay["face"] = features
+
                 # AWS 서버 요청 이후 얼굴 캡처 모드
                 if verification_mode and capture_mode:
-                    if face_capture_countdown == 0:
-                        face_capture_countdown = 3 * 30  # 3초 (30FPS 기준)
+                    if face_capture_deadline is None:
+                        face_capture_deadline = current_time + FACE_CAPTURE_DELAY
+                        reference_vote = VerificationVote(verification_session, size=1)
                         print("얼굴 캡처 준비 중 - 3초 후 캡처합니다")
-                   
-                    face_capture_countdown -= 1
-                   
+
+                    time_left = face_capture_deadline - current_time
+
                     # 카운트다운 표시
-                    seconds_left = face_capture_countdown // 30 + 1
-                    cv2.putText(display_frame, f"Capturing in: {seconds_left}s",
-                               (width//2 - 70, height//2 + 30),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                   
-                    # 카운트다운 완료 시 얼굴 캡처
-                    if face_capture_countdown <= 0:
-                        if face_roi.size > 0:
+                    overlay["capture_seconds_left"] = max(0, int(time_left)) + 1
+
+                    # 카운트다운 동안 정면이고 선명한 프레임 중 가장 좋은 것을 보관
+                    if face_roi.size > 0:
+                        score = verification_score(quality_gate, frame, face_box, features["head_pose"])
+                        if score is not None:
+                            reference_vote.offer(score, frame, face_box, encoding_points)
+
+                    # 카운트다운 완료 시 얼굴 캡처 (품질 좋은 프레임이 없으면 나올 때까지 대기)
+                    if time_left <= 0:
+                        if reference_vote.candidates:
+                            score, region, local_box, local_points, best_roi = reference_vote.candidates[0]
+                            reference_vote = None
+
                             # 참조 얼굴로 저장
-                            reference_face = face_roi.copy()
-                            
-                            # dlib 인코딩 추출
-                            if dlib_available:
+                            reference_face = best_roi
+
+                            # dlib 인코딩 추출 (작업자 스레드에서 비동기로 수행)
+                            if is_dlib_available(load=False):
                                 print("dlib으로 참조 얼굴 인코딩을 추출합니다...")
-                                reference_encoding = get_face_encoding_dlib(face_roi)
-                                
-                                if reference_encoding is not None:
-                                    print("참조 얼굴 인코딩 추출 성공!")
-                                    
-                                    # 인코딩 저장 (옵션)
-                                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    np.save(f"face_encodings/reference_encoding_{timestamp}.npy", reference_encoding)
-                                else:
-                                    print("dlib 인코딩 추출 실패. 히스토그램 비교를 사용합니다.")
-                            
+                                pending_reference = (verification_worker.submit_reference(region, local_box, local_points),
+                                                     verification_session)
+
                             # 참조용 얼굴 파일로 저장
                             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            cv2.imwrite(f"face_captures/reference_face_{timestamp}.jpg", face_roi)
+                            cv2.imwrite(f"face_captures/reference_face_{timestamp}.jpg", best_roi)
                             print(f"참조 얼굴 캡처 완료! ({timestamp})")
-                           
+
+                            # 눈을 뜬 상태의 EAR 분포로 운전자별 임계값 보정 시작
+                            detector.ear_threshold = EAR_THRESHOLD
+                            calibrator = EarCalibrator(current_time)
+                            calibration = None
+                            calibration_session = verification_session
+                            print("EAR 보정을 시작합니다. 정면을 보고 눈을 뜨고 있어 주세요.")
+
                             # 상태 변경
                             capture_mode = False
+                            face_capture_deadline = None
                             last_verification_time = current_time
                             print("10초마다 얼굴 비교를 시작합니다.")
-               
+
                 # 얼굴 검증 모드 (참조 얼굴 캡처 완료 후)
                 elif verification_mode and not capture_mode and reference_face is not None:
                     # 다음 검증까지 남은 시간 표시
                     time_elapsed = current_time - last_verification_time
-                    time_to_next = 10 - (time_elapsed % 10)
-                   
-                    cv2.putText(display_frame, f"Next verification: {int(time_to_next)}s",
-                               (10, height - 10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
-                   
+                    overlay["time_to_next"] = VERIFY_INTERVAL - (time_elapsed % VERIFY_INTERVAL)
+
+                    # 창 동안 정면이고 선명한 후보 프레임 수집
+                    if vote is None or vote.session != verification_session:
+                        vote = VerificationVote(verification_session)
+                    if face_roi.size > 0:
+                        score = verification_score(quality_gate, frame, face_box, features["head_pose"])
+                        if score is not None:
+                            vote.offer(score, frame, face_box, encoding_points)
+
                     # 10초마다 얼굴 비교
-                    if time_elapsed >= 10:
+                    if time_elapsed >= VERIFY_INTERVAL:
                         print(f"10초 경과: 얼굴 비교 수행 ({datetime.now().strftime('%H:%M:%S')})")
                         last_verification_time = current_time
-                       
-                        if face_roi.size > 0:
+
+                        if vote.candidates:
                             # 얼굴 비교 수행
-                            if dlib_available and reference_encoding is not None:
-                                # dlib을 사용한 비교
-                                print("dlib으로 얼굴을 비교합니다...")
-                                current_encoding = get_face_encoding_dlib(face_roi)
-                                
-                                if current_encoding is not None:
-                                    similarity, is_same_person = compare_faces_dlib(
-                                        reference_encoding, current_encoding, threshold=0.6)
-                                    
-                                    # 유사도 텍스트
-                                    similarity_text = f"Similarity: {similarity:.3f}"
-                                    result_text = "MATCH" if is_same_person else "MISMATCH"
+                            if is_dlib_available(load=False) and (reference_encoding is not None or
+                                                                  pending_reference is not None):
+                                # dlib을 사용한 비교 (결과는 이후 프레임에서 확인)
+                                if pending_vote is None:
+                                    print(f"dlib으로 얼굴을 비교합니다... (후보 {len(vote.candidates)}장)")
+                                    pending_vote = vote
+                                    pending_vote.submit_next(verification_worker)
+                                else:
+                                    print("이전 얼굴 비교가 아직 진행 중이어서 이번 검증을 건너뜁니다.")
                             else:
-                                # 히스토그램 비교 (폴백)
+                                # 히스토그램 비교 (폴백, 가장 좋은 후보 프레임 사용)
                                 print("dlib을 사용할 수 없어 히스토그램 비교를 수행합니다.")
+                                face_roi = vote.candidates[0][4]
                                 similarity, is_same_person = compare_faces_histogram(reference_face, face_roi)
                                 similarity_text = f"Histogram: {similarity:.2f}"
                                 result_text = "MATCH" if is_same_person else "MISMATCH"
-                           
-                            cv2.putText(display_frame, similarity_text, (10, height - 30),
-                                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
-                            cv2.putText(display_frame, result_text, (10, height - 50),
-                                       cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                                       (0, 255, 0) if is_same_person else (0, 0, 255), 1)
-                           
-                            print(f"얼굴 비교 결과: {similarity:.2f} - {result_text}")
-                           
-                            # AWS 서버로 결과 전송
-                            send_verification_result(is_same_person, face_roi)
-               
+
+                                overlay["verification_text"] = (similarity_text, result_text, is_same_person)
+
+                                print(f"얼굴 비교 결과: {similarity:.2f} - {result_text}")
+
+                                # AWS 서버로 결과 전송
+                                send_verification_result(is_same_person, face_roi)
+                        else:
+                            # 흐리거나 옆을 본 프레임만 있으면 잘못된 MISMATCH를 보내지 않도록 이번 검증 생략
+                            print("품질 좋은 얼굴 프레임이 없어 이번 검증을 건너뜁니다.")
+
+                        # 다음 창의 후보는 새로 수집
+                        vote = VerificationVote(verification_session)
+
+                # 운전자별 EAR 보정 (정면 자세의 샘플만 사용)
+                if calibrator is not None:
+                    if calibration_session != verification_session:
+                        calibrator = None
+                    else:
+                        head_pose_ok = not detector.is_head_pose_incorrect(vertical_angle, horizontal_deviation,
+                                                                           head_drop)
+                        if calibrator.add(current_time, current_ear, head_pose_ok) is not None:
+                            calibration = calibrator.to_dict()
+                            calibrator = None
+                            detector.ear_threshold = calibration["ear_threshold"]
+                            print(f"EAR 보정 완료: 평균 {calibration['ear_mean']:.3f}, "
+                                  f"표준편차 {calibration['ear_std']:.3f} → 임계값 {detector.ear_threshold:.3f}")
+                            if driver_name is not None:
+                                verification_worker.submit_calibration(driver_name, calibration)
+
                 # 졸음 감지 및 고개 자세 모니터링 (항상 수행)
+                changed = detector.update(current_time, current_ear,
+                                          (vertical_angle, horizontal_deviation, head_drop),
+                                          onset=scheduler.onset(current_time))
+
+                # 서버로 보낼 때 함께 전송할 최신 EAR/PERCLOS
                 if current_ear is not None:
-                    # EAR 알고리즘 (2초 이상 눈 감음)
-                    if current_ear < EAR_THRESHOLD:
-                        ear_counter += 1
-                        ear_normal_counter = 0
-                       
-                        # 2초 이상 눈을 감았을 때 경고
-                        if ear_counter >= EAR_FRAMES and not ear_warning_flag:
-                            print("\n[졸음 감지] 2초 이상 눈을 감았습니다!")
-                            ear_warning_flag = True
-                            drowsiness_state["eye_warning"] = True
-                           
-                            # 졸음 감지 즉시 서버로 알림
-                            send_drowsiness_alert()
+                    drowsiness_state["ear"] = round(float(current_ear), 3)
+                drowsiness_state["perclos"] = round(detector.perclos, 3)
+
+                if changed & EYE_WARNING_CHANGED:
+                    if detector.eye_warning:
+                        print(f"\n[졸음 감지] 눈 감김이 지속되었습니다! (PERCLOS: {detector.perclos:.2f})")
                     else:
-                        # 눈을 뜬 경우
-                        ear_counter = 0
-                       
-                        # 정상 눈 상태 확인
-                        if ear_warning_flag:
-                            ear_normal_counter += 1
-                           
-                            # 1초 이상 눈을 정상적으로 뜨면 경고 해제
-                            if ear_normal_counter >= EAR_RESET_FRAMES:
-                                print("\n[눈 상태] 정상 상태로 돌아왔습니다.")
-                                ear_warning_flag = False
-                                drowsiness_state["eye_warning"] = False
-                               
-                                # 경고 해제 시 서버로 알림
-                                send_drowsiness_alert()
-                   
-                    # 졸음 경고 표시
-                    if ear_warning_flag:
-                        cv2.putText(display_frame, "DROWSINESS WARNING!", (width//2 - 100, 30),
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-               
-                # 고개 자세 비정상 감지 (3초 기준)
-                if 'vertical_angle' in locals() and 'horizontal_deviation' in locals() and 'head_drop' in locals():
-                    head_pose_incorrect = (
-                        abs(vertical_angle - CENTER_ANGLE) > VERTICAL_ANGLE_THRESHOLD or
-                        horizontal_deviation > HORIZONTAL_DEVIATION_THRESHOLD or
-                        head_drop < HEAD_DROP_THRESHOLD
-                    )
-                   
-                    if head_pose_incorrect:
-                        head_pose_counter += 1
-                        head_pose_normal_counter = 0
-                       
-                        # 3초 이상 고개 자세가 비정상일 때
-                        if head_pose_counter >= HEAD_POSE_FRAMES and not head_pose_warning_flag:
-                            print("\n[고개 자세 경고] 3초 이상 비정상 자세가 지속되었습니다!")
-                            head_pose_warning_flag = True
-                            drowsiness_state["head_pose_warning"] = True
-                           
-                            # 고개 자세 비정상 감지 시 서버로 알림
-                            send_drowsiness_alert()
+                        print("\n[눈 상태] 정상 상태로 돌아왔습니다.")
+                    drowsiness_state["eye_warning"] = detector.eye_warning
+
+                if changed & HEAD_POSE_WARNING_CHANGED:
+                    if detector.head_pose_warning:
+                        print("\n[고개 자세 경고] 3초 이상 비정상 자세가 지속되었습니다!")
                     else:
-                        # 고개 자세가 정상일 때
-                        head_pose_counter = 0
-                       
-                        # 정상 자세 확인
-                        if head_pose_warning_flag:
-                            head_pose_normal_counter += 1
-                           
-                            # 1초 이상 정상 자세면 경고 해제
-                            if head_pose_normal_counter >= HEAD_POSE_RESET_FRAMES:
-                                print("\n[고개 자세] 정상 자세로 돌아왔습니다.")
-                                head_pose_warning_flag = False
-                                drowsiness_state["head_pose_warning"] = False
-                               
-                                # 경고 해제 시 서버로 알림
-                                send_drowsiness_alert()
-                   
-                    # 고개 자세 경고 표시
-                    if head_pose_warning_flag:
-                        cv2.putText(display_frame, "HEAD POSE WARNING!", (width//2 - 100, 50),
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 165, 255), 2)
-               
-                # 얼굴 사각형 그리기
-                rect_color = (0, 255, 0)  # 기본 초록색
-                if ear_warning_flag:
-                    rect_color = (0, 0, 255)  # 졸음 감지 시 빨간색
-                elif head_pose_warning_flag:
-                    rect_color = (0, 165, 255)  # 고개 자세 비정상 시 주황색
-               
-                cv2.rectangle(display_frame, (x_min, y_min), (x_max, y_max), rect_color, 2)
-               
-                # 상태 표시
-                try:
-                    # 얼굴 인증 모드 표시
-                    mode_text = "INACTIVE"
-                    if verification_mode:
-                        mode_text = "CAPTURE" if capture_mode else "VERIFY"
-                   
-                    cv2.putText(display_frame, f"Mode: {mode_text}",
-                               (width - 140, 40),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4,
-                               (0, 255, 0) if verification_mode else (0, 0, 255), 1)
-                   
-                    # 참조 얼굴 상태
-                    ref_text = "Captured" if reference_face is not None else "Not captured"
-                    cv2.putText(display_frame, f"Reference: {ref_text}",
-                               (width - 140, 60),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4,
-                               (0, 255, 0) if reference_face is not None else (0, 0, 255), 1)
-                   
-                    # MQTT 상태
-                    mqtt_text = "Connected" if client.is_connected() else "Disconnected"
-                    cv2.putText(display_frame, f"MQTT: {mqtt_text}",
-                               (width - 140, 80),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4,
-                               (0, 255, 0) if client.is_connected() else (0, 0, 255), 1)
-                   
-                    # 눈 상태 표시
-                    if current_ear is not None:
-                        eye_state = "CLOSED" if current_ear < EAR_THRESHOLD else "OPEN"
-                        cv2.putText(display_frame, f"Eye: {eye_state}",
-                                   (width - 140, 100),
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, eye_text_color, 1)
-                   
-                    # 졸음 감지 상태 표시
-                    drowsy_text = "ACTIVE" if drowsiness_state["eye_warning"] or drowsiness_state["head_pose_warning"] else "NONE"
-                    drowsy_color = (0, 0, 255) if drowsy_text == "ACTIVE" else (0, 255, 0)
-                    cv2.putText(display_frame, f"Drowsy: {drowsy_text}",
-                               (width - 140, 120),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4, drowsy_color, 1)
-                    
-                    # dlib 상태 표시
-                    dlib_text = "dlib" if dlib_available else "Histogram"
-                    cv2.putText(display_frame, f"Method: {dlib_text}",
-                               (width - 140, 140),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
-                except Exception as e:
-                    print(f"정보 표시 오류: {e}")
+                        print("\n[고개 자세] 정상 자세로 돌아왔습니다.")
+                    drowsiness_state["head_pose_warning"] = detector.head_pose_warning
+
+                # 경고 발생/해제 시 서버로 알림
+                if changed:
+                    send_drowsiness_alert()
+
+                # 분석 주기 조절 (참조 얼굴 캡처와 EAR 보정 중에는 항상 전체 주기)
+                relaxed = (not (verification_mode and capture_mode) and calibrator is None and
+                           detector.is_well_within_bounds(current_ear,
+                                                          (vertical_angle, horizontal_deviation, head_drop)))
+                scheduler.update(current_time, relaxed)
             else:
-                # 얼굴이 감지되지 않은 경우
+                # 얼굴이 감지되지 않은 경우 (다시 찾을 때까지 전체 주기)
+                scheduler.update(current_time, False)
                 if verification_mode and capture_mode:
-                    cv2.putText(display_frame, "No face detected!",
-                               (width//2 - 70, height//2),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-           
+                    overlay["no_face_capture"] = True
+
+            overlay["ear_warning"] = detector.eye_warning
+            overlay["head_pose_warning"] = detector.head_pose_warning
+            overlay["perclos"] = detector.perclos
+            overlay["ear_threshold"] = detector.ear_threshold
+            overlay["calibration_progress"] = calibrator.progress(current_time) if calibrator is not None else None
+            overlay["reference_captured"] = reference_face is not None
+            profiler.stop("decision", decision_start)
+
+            # 표시할 프레임만 표시 단계로 넘기고 나머지는 바로 풀에 반환
+            if preview_every and pipeline_stats["decided_frames"] % preview_every == 0:
+                render_buffer.put((seq, current_time, frame, overlay))
+            else:
+                frame_pool.release(frame)
+    except Exception as e:
+        print(f"주요 오류 발생: {e}")
+    finally:
+        render_buffer.close()
+        stop_event.set()
+
+# 화면 표시용 오버레이 그리기 (판단 로직과 분리)
+def render_overlay(display_frame, overlay):
+    width, height = FRAME_WIDTH, FRAME_HEIGHT
+
+    # 상태 표시
+    if not overlay["verification_mode"]:
+        status_text = "AWS 서버 요청 대기 중..."
+    elif overlay["capture_mode"]:
+        status_text = "얼굴 캡처 모드 - 3초 후 캡처합니다"
+    else:
+        status_text = "얼굴 검증 모드 - 10초마다 검증합니다"
+
+    cv2.putText(display_frame, status_text, (10, 20),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+    face = overlay["face"]
+    if face is None:
+        # 얼굴이 감지되지 않은 경우
+        if overlay["no_face_capture"]:
+            cv2.putText(display_frame, "No face detected!",
+                       (width//2 - 70, height//2),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        return
+
+    current_ear = face["ear"]
+    eye_text_color = (0, 255, 0)
+
+    # 눈 랜드마크 그리기
+    if face["eye_points"] is not None:
+        for x, y in face["eye_points"]:
+            cv2.drawMarker(display_frame, (int(x), int(y)), (0, 255, 0),
+                          markerType=0, markerSize=3, thickness=1)
+
+    # EAR 값 표시
+    if current_ear is not None:
+        eye_text_color = (0, 0, 255) if current_ear < overlay["ear_threshold"] else (0, 255, 0)
+        cv2.putText(display_frame, f"EAR: {current_ear:.2f} / {overlay['ear_threshold']:.2f}", (10, 40),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, eye_text_color, 1)
+
+    # 고개 자세 정보 표시
+    if face["head_pose"] is not None:
+        vertical_angle, horizontal_deviation, head_drop = face["head_pose"]
+        cv2.putText(display_frame, f"Head angle: {vertical_angle:.1f}", (10, 60),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+        cv2.putText(display_frame, f"Gaze dev: {horizontal_deviation:.2f}", (10, 80),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+        cv2.putText(display_frame, f"Head drop: {head_drop:.2f}", (10, 100),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
+
+    # PERCLOS 표시
+    perclos_color = (0, 0, 255) if overlay["perclos"] >= PERCLOS_THRESHOLD else (0, 255, 0)
+    cv2.putText(display_frame, f"PERCLOS: {overlay['perclos']:.2f}", (10, 120),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.4, perclos_color, 1)
+
+    # 고개 자세 포인트 그리기
+    if face["head_points"]:
+        for point in face["head_points"]:
+            cv2.drawMarker(display_frame, point, (255, 0, 0),
+                          markerType=0, markerSize=5, thickness=1)
+
+    # 카운트다운 표시
+    if overlay["capture_seconds_left"] is not None:
+        cv2.putText(display_frame, f"Capturing in: {overlay['capture_seconds_left']}s",
+                   (width//2 - 70, height//2 + 30),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+
+    # EAR 보정 진행률 표시
+    if overlay["calibration_progress"] is not None:
+        cv2.putText(display_frame, f"Calibrating EAR: {int(overlay['calibration_progress'] * 100)}%",
+                   (width//2 - 70, height//2 + 50),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+
+    # 다음 검증까지 남은 시간 표시
+    if overlay["time_to_next"] is not None:
+        cv2.putText(display_frame, f"Next verification: {int(overlay['time_to_next'])}s",
+                   (10, height - 10),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+
+    # 얼굴 비교 결과 표시
+    if overlay["verification_text"] is not None:
+        similarity_text, result_text, is_same_person = overlay["verification_text"]
+        cv2.putText(display_frame, similarity_text, (10, height - 30),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+        cv2.putText(display_frame, result_text, (10, height - 50),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                   (0, 255, 0) if is_same_person else (0, 0, 255), 1)
+
+    # 졸음 경고 표시
+    if overlay["ear_warning"] and current_ear is not None:
+        cv2.putText(display_frame, "DROWSINESS WARNING!", (width//2 - 100, 30),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+    # 고개 자세 경고 표시
+    if overlay["head_pose_warning"]:
+        cv2.putText(display_frame, "HEAD POSE WARNING!", (width//2 - 100, 50),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 165, 255), 2)
+
+    # 얼굴 사각형 그리기
+    rect_color = (0, 255, 0)  # 기본 초록색
+    if overlay["ear_warning"]:
+        rect_color = (0, 0, 255)  # 졸음 감지 시 빨간색
+    elif overlay["head_pose_warning"]:
+        rect_color = (0, 165, 255)  # 고개 자세 비정상 시 주황색
+
+    x_min, y_min, x_max, y_max = face["box"]
+    cv2.rectangle(display_frame, (x_min, y_min), (x_max, y_max), rect_color, 2)
+
+    # 상태 표시
+    try:
+        verification_mode = overlay["verification_mode"]
+        reference_captured = overlay["reference_captured"]
+
+        # 얼굴 인증 모드 표시
+        mode_text = "INACTIVE"
+        if verification_mode:
+            mode_text = "CAPTURE" if overlay["capture_mode"] else "VERIFY"
+
+        cv2.putText(display_frame, f"Mode: {mode_text}",
+                   (width - 140, 40),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                   (0, 255, 0) if verification_mode else (0, 0, 255), 1)
+
+        # 참조 얼굴 상태
+        ref_text = "Captured" if reference_captured else "Not captured"
+        cv2.putText(display_frame, f"Reference: {ref_text}",
+                   (width - 140, 60),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                   (0, 255, 0) if reference_captured else (0, 0, 255), 1)
+
+        # MQTT 상태
+        mqtt_connected = client.is_connected()
+        mqtt_text = "Connected" if mqtt_connected else "Disconnected"
+        cv2.putText(display_frame, f"MQTT: {mqtt_text}",
+                   (width - 140, 80),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                   (0, 255, 0) if mqtt_connected else (0, 0, 255), 1)
+
+        # 눈 상태 표시
+        if current_ear is not None:
+            eye_state = "CLOSED" if current_ear < overlay["ear_threshold"] else "OPEN"
+            cv2.putText(display_frame, f"Eye: {eye_state}",
+                       (width - 140, 100),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.4, eye_text_color, 1)
+
+        # 졸음 감지 상태 표시
+        drowsy_text = "ACTIVE" if overlay["ear_warning"] or overlay["head_pose_warning"] else "NONE"
+        drowsy_color = (0, 0, 255) if drowsy_text == "ACTIVE" else (0, 255, 0)
+        cv2.putText(display_frame, f"Drowsy: {drowsy_text}",
+                   (width - 140, 120),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, drowsy_color, 1)
+
+        # dlib 상태 표시
+        dlib_text = {"loaded": "dlib", "failed": "Histogram"}.get(dlib_state, "Loading")
+        cv2.putText(display_frame, f"Method: {dlib_text}",
+                   (width - 140, 140),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
+    except Exception as e:
+        print(f"정보 표시 오류: {e}")
+
+# Jetson SoC 온도 (thermal_zone 중 가장 높은 값, 읽을 수 없으면 None)
+def read_soc_temperature():
+    temperatures = []
+    for path in glob.glob("/sys/devices/virtual/thermal/thermal_zone*/temp"):
+        try:
+            with open(path) as f:
+                temperatures.append(int(f.read().strip()) / 1000.0)
+        except (OSError, ValueError):
+            pass
+    return max(temperatures) if temperatures else None
+
+# 단계별 지연 시간, 실제 FPS, 단계별로 버려진 프레임 수
+def collect_metrics(buffers):
+    metrics = profiler.snapshot()
+    metrics["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    metrics["fps"] = metrics["rates"].get("decided", 0.0)
+    metrics["source_fps"] = CAMERA_FPS
+    metrics["dropped_frames"] = {name: buffer.dropped for name, buffer in buffers.items()}
+    metrics["temperature_c"] = read_soc_temperature()
+    return metrics
+
+# 주기적으로 지표를 서버로 전송 (발열로 인한 성능 저하, 성능 회귀 확인용)
+def metrics_worker(buffers, stop_event, interval=METRICS_INTERVAL):
+    while not stop_event.wait(interval):
+        try:
+            client.publish(METRICS_TOPIC, json.dumps(collect_metrics(buffers)))
+        except Exception as e:
+            print(f"지표 전송 오류: {e}")
+
+def dump_metrics(buffers, path=None):
+    metrics = collect_metrics(buffers)
+    print(f"단계별 지연 시간 (실행 {metrics['uptime_s']}초):")
+    print(profiler.report(metrics))
+
+    if path:
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(metrics, f, ensure_ascii=False, indent=2)
+            print(f"지표 저장: {path}")
+        except OSError as e:
+            print(f"지표 저장 오류: {e}")
+
+# 명령행 옵션
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="얼굴 인증 및 졸음 감지 (Jetson Nano)")
+    parser.add_argument("--source", choices=["gst", "video", "images", "raw"], default="gst",
+                        help="프레임 소스 (gst: CSI 카메라, video: 영상 파일, images: JPEG 디렉토리, raw: raw 프레임 파일)")
+    parser.add_argument("--input", help="video/images/raw 소스의 경로")
+    parser.add_argument("--width", type=int, default=FRAME_WIDTH, help="프레임 가로 크기")
+    parser.add_argument("--height", type=int, default=FRAME_HEIGHT, help="프레임 세로 크기")
+    parser.add_argument("--fps", type=int, default=CAMERA_FPS, help="카메라 FPS (raw/images 소스의 타임스탬프 기준)")
+    parser.add_argument("--pace", action="store_true",
+                        help="파일 소스를 원래 속도로 재생 (기본값은 최대 속도로 모든 프레임 처리)")
+    parser.add_argument("--no-mqtt", action="store_true", help="MQTT 브로커에 연결하지 않음 (오프라인 측정용)")
+    parser.add_argument("--headless", action="store_true",
+                        help="화면 표시와 오버레이 그리기를 모두 생략 (차량 설치용)")
+    parser.add_argument("--preview-every", type=int, default=1,
+                        help="N 프레임마다 한 번만 화면에 표시 (기본값 1: 모든 프레임)")
+    parser.add_argument("--eye-trigger", choices=EYE_TRIGGER_MODES, default="ear",
+                        help="눈 감김 경고 기준 (ear: 2초 연속 눈 감음, perclos: 3초 창의 PERCLOS, either: 둘 중 하나)")
+    parser.add_argument("--idle-interval", type=float, default=ADAPTIVE_IDLE_INTERVAL,
+                        help="운전자가 충분히 정상일 때의 분석 간격 (초, 0이면 모든 프레임 분석). "
+                             "경고 발생은 최대 이 시간만큼 늦어질 수 있음")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="시작할 때 모델을 미리 로드하지 않고 처음 사용할 때 로드")
+    parser.add_argument("--enroll", metavar="NAME",
+                        help="카메라 앞 운전자를 NAME으로 갤러리에 등록하고 종료")
+    parser.add_argument("--record", metavar="DIR",
+                        help="분석한 프레임의 랜드마크/EAR/고개 자세를 DIR/<시각>.lmrec에 기록 (rescore_sessions.py 입력)")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL,
+                        help=f"단계별 지연 시간/FPS 지표를 {METRICS_TOPIC}로 보내는 간격 (초, 0이면 보내지 않음)")
+    parser.add_argument("--metrics-dump", metavar="PATH", help="종료할 때 단계별 지연 시간 지표를 JSON으로 저장")
+    parser.add_argument("--face-images", choices=IMAGE_MODES, default="all",
+                        help="인증 결과와 함께 보낼 얼굴 썸네일 (all: 모두, mismatch: 불일치만, off: 보내지 않음)")
+    parser.add_argument("--image-encoding", choices=IMAGE_ENCODINGS, default="binary",
+                        help="얼굴 썸네일 형식 (binary: face/image/jpeg로 JPEG 그대로, base64: face/image로 기존 JSON)")
+    return parser.parse_args(argv)
+
+# 4단계: 화면 표시 (cv2.imshow는 메인 스레드에서 실행)
+def display_loop(render_buffer, frame_pool, stop_event):
+    # 화면 표시용 2배 확대 버퍼
+    display_frame_resized = np.empty((FRAME_HEIGHT*2, FRAME_WIDTH*2, 3), dtype=np.uint8)
+
+    while not stop_event.is_set():
+        item = render_buffer.get_latest(timeout=0.1)
+
+        if item is not None:
+            seq, timestamp, frame, overlay = item
+
+            # 표시 단계가 프레임의 마지막 사용자이므로 복사 없이 바로 그림
+            # (참조 얼굴, 인증용 얼굴 영역은 판단 단계에서 이미 복사됨)
+            start = profiler.start()
+            render_overlay(frame, overlay)
+            start = profiler.stop("overlay", start)
+
             # 프레임 표시
             try:
-                display_frame_resized = cv2.resize(display_frame, (width*2, height*2), interpolation=cv2.INTER_LINEAR)
-                cv2.imshow("Face Verification & Drowsiness Detection (dlib)", display_frame_resized)
+                cv2.resize(frame, (FRAME_WIDTH*2, FRAME_HEIGHT*2), dst=display_frame_resized,
+                           interpolation=cv2.INTER_LINEAR)
+                cv2.imshow(WINDOW_NAME, display_frame_resized)
+                profiler.stop("display", start)
+                profiler.count("displayed")
             except Exception as e:
                 print(f"프레임 표시 오류: {e}")
-           
-            # 'q' 키로 종료
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-       
+
+            frame_pool.release(frame)
+        elif render_buffer.closed:
+            break
+
+        # 'q' 키로 종료
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+def main(argv=None):
+    global FRAME_WIDTH, FRAME_HEIGHT, CAMERA_FPS, startup_start
+
+    startup_start = time.perf_counter()
+    startup_timings.clear()
+
+    args = parse_args(argv)
+    FRAME_WIDTH, FRAME_HEIGHT = args.width, args.height
+
+    frame_source = None
+    recorder = None
+    workers = []
+    buffers = {}
+    stop_event = threading.Event()
+    verification_worker = VerificationWorker()
+
+    try:
+        print("얼굴 인증 및 졸음 감지 시스템 시작...")
+
+        # 얼굴 이미지/인코딩 저장 디렉토리
+        ensure_dir("face_captures")
+        ensure_dir("face_encodings")
+
+        # 모델은 카메라를 여는 동안 백그라운드에서 로드 (끄면 처음 사용할 때 로드)
+        if not args.no_preload:
+            threading.Thread(target=preload_models, name="preload", daemon=True).start()
+
+        # MQTT 브로커 연결 (연결을 기다리지 않고 백그라운드에서 연결/재연결)
+        if not args.no_mqtt:
+            print(f"MQTT 브로커({MQTT_BROKER}:{MQTT_PORT})에 연결 중...")
+            client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+            client.loop_start()
+
+            face_image_publisher.mode = args.face_images
+            face_image_publisher.encoding = args.image_encoding
+            face_image_publisher.start()
+
+        # 등록 운전자 갤러리 로드 (메모리 맵)
+        try:
+            face_gallery.load()
+            print(f"등록 운전자 갤러리: {len(face_gallery)}명")
+        except (OSError, ValueError) as e:
+            print(f"갤러리 로드 실패: {e}")
+
+        # 프레임 소스 시작
+        frame_source = create_frame_source(args.source, args.input, FRAME_WIDTH, FRAME_HEIGHT,
+                                           args.fps, paced=args.pace)
+        frame_source.open()
+        CAMERA_FPS = frame_source.fps
+        mark_startup("source_open")
+
+        if args.enroll:
+            enroll_driver(args.enroll, frame_source)
+            return
+
+        # 파일 소스를 최대 속도로 재생할 때는 프레임을 버리지 않고 모두 처리
+        lossless = not frame_source.realtime
+
+        # 프레임 버퍼 풀과 단계별 버퍼: 캡처 → 랜드마크 → 판단 → 표시
+        frame_pool = FramePool((FRAME_HEIGHT, FRAME_WIDTH, 3), FRAME_POOL_SIZE)
+        release_frame = lambda item: frame_pool.release(item[2])
+        capture_buffer = FrameRingBuffer(CAPTURE_BUFFER_SIZE, on_drop=release_frame, lossless=lossless)
+        landmark_buffer = FrameRingBuffer(LANDMARK_BUFFER_SIZE, on_drop=release_frame, lossless=lossless)
+        render_buffer = FrameRingBuffer(RENDER_BUFFER_SIZE, on_drop=release_frame, lossless=lossless)
+        buffers = {"capture": capture_buffer, "landmark": landmark_buffer, "render": render_buffer}
+
+        # 프레임/얼굴 품질 게이트 (랜드마크 단계와 판단 단계가 함께 사용)
+        quality_gate = QualityGate((FRAME_HEIGHT, FRAME_WIDTH))
+        roi_tracker = FaceRoiTracker(FRAME_WIDTH, FRAME_HEIGHT)
+
+        # 운전자 상태에 따른 분석 주기 조절
+        scheduler = AdaptiveScheduler(idle_interval=max(0.0, args.idle_interval))
+
+        # 랜드마크 녹화 (임계값 재조정용)
+        if args.record:
+            record_path = os.path.join(args.record, datetime.now().strftime("%Y%m%d_%H%M%S") + RECORDING_SUFFIX)
+            recorder = LandmarkRecorder(record_path, RECORD_INDICES, FRAME_WIDTH, FRAME_HEIGHT)
+            print(f"랜드마크 녹화: {record_path}")
+
+        workers = [
+            threading.Thread(target=capture_worker, args=(frame_source, frame_pool, capture_buffer, stop_event),
+                             name="capture", daemon=True),
+            threading.Thread(target=landmark_worker,
+                             args=(frame_pool, capture_buffer, landmark_buffer, stop_event, quality_gate, roi_tracker,
+                                   scheduler, recorder),
+                             name="landmark", daemon=True),
+            threading.Thread(target=decision_worker,
+                             args=(landmark_buffer, render_buffer, frame_pool, verification_worker, quality_gate,
+                                   scheduler, stop_event,
+                                   0 if args.headless else max(1, args.preview_every), args.eye_trigger),
+                             name="decision", daemon=True)
+        ]
+        if not args.no_mqtt and args.metrics_interval > 0:
+            workers.append(threading.Thread(target=metrics_worker, args=(buffers, stop_event, args.metrics_interval),
+                                            name="metrics", daemon=True))
+
+        start_time = time.time()
+        for worker in workers:
+            worker.start()
+
+        print("AWS 서버로부터 얼굴 인증 요청 대기 중...")
+
+        if args.headless:
+            # 화면 표시 없이 판단 단계가 끝날 때까지 대기
+            print("헤드리스 모드로 실행합니다. 종료하려면 Ctrl+C를 누르세요.")
+            while not stop_event.wait(0.5):
+                pass
+        else:
+            print("카메라 시작... 종료하려면 'q'를 누르세요.")
+            display_loop(render_buffer, frame_pool, stop_event)
+
+        elapsed = time.time() - start_time
+        decided = pipeline_stats["decided_frames"]
+        print(f"처리한 프레임: {decided} ({decided / max(elapsed, 1e-6):.1f} FPS, {elapsed:.1f}초)")
+
+        dropped = capture_buffer.dropped + landmark_buffer.dropped + render_buffer.dropped
+        print(f"파이프라인에서 버려진 프레임: {dropped}")
+        print(f"프레임 버퍼 할당 수: {frame_pool.allocated} (기본 {FRAME_POOL_SIZE})")
+        print(f"얼굴 인증 작업자 통계: {verification_worker.metrics()}")
+        print(f"얼굴 이미지 전송: {face_image_publisher.stats()}")
+
+        print(f"얼굴 ROI 추적: {roi_tracker.stats()}")
+        print(f"적응형 분석 주기: {scheduler.stats()}")
+        report_startup()
+
+        quality = quality_gate.stats()
+        print(f"품질 게이트로 건너뛴 프레임/얼굴: {quality['skipped_total']} "
+              f"(프레임 {quality['checked_frames']}장, 얼굴 {quality['checked_faces']}개 검사, {quality['skipped']})")
+
     except KeyboardInterrupt:
         print("프로그램 중단됨")
     except Exception as e:
         print(f"주요 오류 발생: {e}")
     finally:
+        stop_event.set()
+        # 파일 재생(lossless)에서는 화면 표시가 멈추면 단계들이 가득 찬 버퍼에 넣으려고 계속 기다리므로 버퍼를 닫아 깨움
+        for buffer in buffers.values():
+            buffer.close()
+        verification_worker.shutdown()
+        face_image_publisher.stop()
+
+        # 파이프라인 단계가 끝날 때까지 대기 (녹화 중이면 랜드마크 단계가 남은 행을 기록하고 파일을 닫음)
+        for worker in workers:
+            if worker.ident is not None and worker.name != "metrics":
+                worker.join(timeout=2.0)
+
+        if recorder is not None:
+            landmark = next((worker for worker in workers if worker.name == "landmark"), None)
+            if landmark is not None and landmark.is_alive():
+                print("⚠️ 랜드마크 단계가 끝나지 않아 녹화 파일을 닫지 못했습니다.")
+            else:
+                if landmark is None or landmark.ident is None:
+                    # 랜드마크 단계를 시작하기 전에 중단된 경우
+                    recorder.close()
+                print(f"랜드마크 녹화 프레임: {len(recorder)}")
+
+        # 단계별 지연 시간 출력 (Ctrl+C로 종료해도 출력)
+        if buffers:
+            dump_metrics(buffers, args.metrics_dump)
+
         # 리소스 해제
         try:
             client.loop_stop()
             client.disconnect()
         except:
             pass
-       
+
         try:
-            process.terminate()
-            cv2.destroyAllWindows()
+            if frame_source is not None:
+                frame_source.close()
+            if not args.headless:
+                cv2.destroyAllWindows()
         except:
             pass
-       
+
         print("프로그램 종료")
 
 if __name__ == "__main__":
     main()
-    
-else:
-    print("현재 얼굴 인코딩 추출 실패")
-    # 폴백: 히스토그램 비교
-    similarity, is_same_person = compare_faces_histogram(reference_face, face_roi)
-    similarity_text = f"Histogram: {similarity:.2f}"
-    result_text = "MATCH" if is_same_person else "MISMATCH"
\ No newline at end of file
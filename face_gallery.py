@@ -0,0 +1,138 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+# 등록 운전자 얼굴 갤러리
+# 운전자 한 명당 128차원 dlib 인코딩 한 행을 하나의 float32 행렬(embeddings.npy)로 저장하고
+# 행 순서대로 운전자 정보(drivers.json, 운전자별 EAR 보정값 포함)를 저장한다
+# 읽을 때는 메모리 맵으로 열어 수백 명이어도 행렬-벡터 곱 한 번으로 1:N 검색한다
+
+GALLERY_DIR = "face_gallery"
+EMBEDDINGS_FILE = "embeddings.npy"
+DRIVERS_FILE = "drivers.json"
+
+# 검색 파라미터
+GALLERY_TOP_K = 3
+GALLERY_MATCH_THRESHOLD = 0.6   # compare_faces_dlib와 같은 동일인 판단 거리
+
+class FaceGallery:
+    """
+    load(): 갤러리 파일을 메모리 맵으로 열고 행별 제곱 노름을 미리 계산
+    search(encoding, k): 거리가 가까운 순서로 [(이름, 거리), ...] 최대 k개 반환
+    identify(encoding): 가장 가까운 운전자가 임계값 안이면 (이름, 거리), 아니면 (None, 거리)
+    enroll(name, encodings): 여러 장의 인코딩 평균을 운전자 한 행으로 저장 (같은 이름이면 교체)
+    ear_calibration(name) / set_ear_calibration(name, calibration): 운전자별 EAR 보정값 조회/저장
+    """
+    def __init__(self, directory=GALLERY_DIR):
+        self.directory = directory
+        self.embeddings = None
+        self.norms = None
+        self.drivers = []
+
+    @property
+    def embeddings_path(self):
+        return os.path.join(self.directory, EMBEDDINGS_FILE)
+
+    @property
+    def drivers_path(self):
+        return os.path.join(self.directory, DRIVERS_FILE)
+
+    def __len__(self):
+        return len(self.drivers)
+
+    def load(self):
+        self.embeddings = None
+        self.norms = None
+        self.drivers = []
+
+        if not (os.path.exists(self.embeddings_path) and os.path.exists(self.drivers_path)):
+            return self
+
+        with open(self.drivers_path, encoding="utf-8") as f:
+            drivers = json.load(f)
+        embeddings = np.load(self.embeddings_path, mmap_mode="r")
+
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(drivers):
+            raise ValueError(f"갤러리 파일이 일치하지 않습니다: 인코딩 {embeddings.shape}, 운전자 {len(drivers)}명")
+
+        self.embeddings = embeddings
+        self.drivers = drivers
+        # |e - q|² = |e|² - 2 e·q + |q|² 에서 |e|²는 검색마다 다시 계산하지 않음
+        self.norms = np.einsum("ij,ij->i", embeddings, embeddings)
+        return self
+
+    def search(self, encoding, k=GALLERY_TOP_K):
+        if not self.drivers:
+            return []
+
+        query = np.asarray(encoding, dtype=np.float32)
+        distances = self.norms - 2.0 * (self.embeddings @ query)
+        distances += float(query @ query)
+        np.maximum(distances, 0.0, out=distances)
+
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(self.drivers[i]["name"], float(np.sqrt(distances[i]))) for i in top]
+
+    def identify(self, encoding, threshold=GALLERY_MATCH_THRESHOLD):
+        matches = self.search(encoding, k=1)
+        if not matches:
+            return None, None
+
+        name, distance = matches[0]
+        return (name if distance < threshold else None), distance
+
+    def enroll(self, name, encodings):
+        encoding = np.mean(np.asarray(encodings, dtype=np.float32), axis=0)
+
+        if self.embeddings is not None:
+            embeddings = np.array(self.embeddings, dtype=np.float32)
+        else:
+            embeddings = np.empty((0, encoding.shape[0]), dtype=np.float32)
+        drivers = list(self.drivers)
+
+        entry = {
+            "name": name,
+            "samples": len(encodings),
+            "enrolled_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        names = [driver["name"] for driver in drivers]
+        if name in names:
+            index = names.index(name)
+            embeddings[index] = encoding
+            drivers[index] = entry
+        else:
+            embeddings = np.vstack([embeddings, encoding[np.newaxis]])
+            drivers.append(entry)
+
+        # 임시 파일에 쓴 뒤 교체 (쓰는 중에 다른 프로세스가 읽어도 깨진 파일을 보지 않도록)
+        os.makedirs(self.directory, exist_ok=True)
+        self.embeddings = None
+        temp_embeddings = self.embeddings_path + ".tmp.npy"
+        temp_drivers = self.drivers_path + ".tmp"
+        np.save(temp_embeddings, np.ascontiguousarray(embeddings, dtype=np.float32))
+        with open(temp_drivers, "w", encoding="utf-8") as f:
+            json.dump(drivers, f, ensure_ascii=False, indent=2)
+        os.replace(temp_embeddings, self.embeddings_path)
+        os.replace(temp_drivers, self.drivers_path)
+
+        return self.load()
+
+    def ear_calibration(self, name):
+        for driver in self.drivers:
+            if driver["name"] == name:
+                return driver.get("ear_calibration")
+        return None
+
+    def set_ear_calibration(self, name, calibration):
+        # 목록을 새로 만들어 교체 (다른 스레드의 검색은 이전 목록을 그대로 봄)
+        drivers = [dict(driver, ear_calibration=calibration) if driver["name"] == name else driver
+                   for driver in self.drivers]
+        temp_drivers = self.drivers_path + ".tmp"
+        with open(temp_drivers, "w", encoding="utf-8") as f:
+            json.dump(drivers, f, ensure_ascii=False, indent=2)
+        os.replace(temp_drivers, self.drivers_path)
+        self.drivers = drivers
@@ -0,0 +1,160 @@
+import base64
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+# 얼굴 이미지 전송 작업자
+# 인증 결과마다 얼굴 썸네일을 관리자 페이지로 보내되, 크기 조정/JPEG 인코딩/전송은 별도 스레드에서 하고
+# 종류별 전송 간격 제한과 거의 같은 얼굴의 중복 제거로 셀룰러 회선의 업로드량을 줄인다
+#
+# 전송 형식
+#   binary: FACE_IMAGE_BINARY_TOPIC으로 "메타데이터 JSON 한 줄\n" + JPEG 바이트 (base64 없이 그대로)
+#   base64: FACE_IMAGE_TOPIC으로 기존과 같은 {"image": base64, "type", "timestamp"} JSON
+
+FACE_IMAGE_TOPIC = "face/image"
+FACE_IMAGE_BINARY_TOPIC = "face/image/jpeg"
+IMAGE_ENCODINGS = ("binary", "base64")
+
+# 전송 대상 ("all": 모든 결과, "mismatch": 미등록/불일치만, "off": 전송 안 함)
+IMAGE_MODES = ("all", "mismatch", "off")
+
+THUMBNAIL_SIZE = 150
+JPEG_QUALITY = 70
+
+# 종류별 최소 전송 간격 (초)
+MIN_INTERVALS = {"registered": 60.0, "unregistered": 5.0}
+
+# 평균 해시(8x8) 해밍 거리가 이 값 이하면 같은 얼굴로 보고, 이 시간 안에는 다시 보내지 않음
+DEDUP_DISTANCE = 6
+DEDUP_SECONDS = 300.0
+
+QUEUE_SIZE = 4
+
+# 8x8 평균 해시 (64비트 정수)
+def average_hash(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+    bits = (small > small.mean()).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class FaceImagePublisher:
+    """
+    submit(face_roi, is_match): 전송 간격 안이면 바로 버리고, 아니면 복사해서 대기열에 넣음 (판단 루프를 막지 않음)
+    작업자 스레드: 썸네일 → 평균 해시 중복 확인 → JPEG 인코딩 → publish
+    stats(): 단계별로 버리거나 보낸 이미지 수와 보낸 바이트 수
+    """
+    def __init__(self, publish, mode="all", encoding="binary", size=THUMBNAIL_SIZE, quality=JPEG_QUALITY,
+                 min_intervals=None, topic_prefix=""):
+        if mode not in IMAGE_MODES:
+            raise ValueError(f"알 수 없는 얼굴 이미지 전송 대상: {mode}")
+        if encoding not in IMAGE_ENCODINGS:
+            raise ValueError(f"알 수 없는 얼굴 이미지 형식: {encoding}")
+
+        self.publish = publish
+        self.topic_prefix = topic_prefix
+        self.mode = mode
+        self.encoding = encoding
+        self.size = size
+        self.quality = quality
+        self.min_intervals = dict(MIN_INTERVALS if min_intervals is None else min_intervals)
+
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.thread = None
+        self.last_submitted = {}
+        self.recent_hashes = {}    # 종류 -> [(해시, 보낸 시각), ...]
+
+        self.counts = {"submitted": 0, "filtered": 0, "rate_limited": 0, "queue_full": 0,
+                       "duplicates": 0, "published": 0, "errors": 0}
+        self.published_bytes = 0
+
+    def start(self):
+        if self.thread is None and self.mode != "off":
+            self.thread = threading.Thread(target=self.run, name="face-image", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def submit(self, face_roi, is_match=True):
+        self.counts["submitted"] += 1
+        if face_roi is None or face_roi.size == 0:
+            return False
+
+        kind = "registered" if is_match else "unregistered"
+        if self.mode == "off" or (self.mode == "mismatch" and is_match) or self.thread is None:
+            self.counts["filtered"] += 1
+            return False
+
+        now = time.monotonic()
+        last = self.last_submitted.get(kind)
+        if last is not None and now - last < self.min_intervals.get(kind, 0.0):
+            self.counts["rate_limited"] += 1
+            return False
+
+        try:
+            self.queue.put_nowait((kind, face_roi.copy(), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        except queue.Full:
+            self.counts["queue_full"] += 1
+            return False
+
+        self.last_submitted[kind] = now
+        return True
+
+    def is_duplicate(self, kind, image_hash, now):
+        recent = [(h, sent) for h, sent in self.recent_hashes.get(kind, []) if now - sent < DEDUP_SECONDS]
+        self.recent_hashes[kind] = recent
+        return any(hamming_distance(image_hash, h) <= DEDUP_DISTANCE for h, sent in recent)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            kind, face_roi, timestamp = item
+            try:
+                thumbnail = cv2.resize(face_roi, (self.size, self.size), interpolation=cv2.INTER_AREA)
+
+                now = time.monotonic()
+                image_hash = average_hash(thumbnail)
+                if self.is_duplicate(kind, image_hash, now):
+                    self.counts["duplicates"] += 1
+                    continue
+
+                ok, buffer = cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if not ok:
+                    raise ValueError("JPEG 인코딩 실패")
+
+                if self.encoding == "binary":
+                    header = json.dumps({"type": kind, "timestamp": timestamp, "format": "jpeg",
+                                         "hash": f"{image_hash:016x}"})
+                    topic, payload = FACE_IMAGE_BINARY_TOPIC, header.encode("utf-8") + b"\n" + buffer.tobytes()
+                else:
+                    topic = FACE_IMAGE_TOPIC
+                    payload = json.dumps({"image": base64.b64encode(buffer).decode("utf-8"),
+                                          "type": kind, "timestamp": timestamp})
+
+                self.publish(self.topic_prefix + topic, payload)
+                self.recent_hashes[kind].append((image_hash, now))
+                self.counts["published"] += 1
+                self.published_bytes += len(payload)
+                print(f"얼굴 이미지 전송 완료 - 타입: {'등록됨' if kind == 'registered' else '미등록'}, "
+                      f"{len(payload)}바이트")
+            except Exception as e:
+                self.counts["errors"] += 1
+                print(f"얼굴 이미지 전송 오류: {e}")
+
+    def stats(self):
+        return dict(self.counts, published_bytes=self.published_bytes)
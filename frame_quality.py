@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+# 프레임 품질 게이트
+# 흔들린 프레임, 적외선 포화/너무 어두운 프레임, 너무 작은 얼굴에는 face_mesh나 dlib 인코딩을 돌려도
+# 쓸모 있는 결과가 나오지 않으므로, 축소한 흑백 이미지로 싸게 품질을 재서 비싼 단계를 건너뛴다
+
+# 프레임 전체 품질 (1/4 축소 흑백 이미지 기준)
+QUALITY_SCALE = 4
+MIN_LUMINANCE = 25.0        # 평균 밝기가 이보다 낮으면 너무 어두움
+MAX_LUMINANCE = 230.0       # 평균 밝기가 이보다 높으면 적외선 포화
+MIN_FRAME_SHARPNESS = 10.0  # 라플라시안 분산이 이보다 작으면 흔들린 프레임
+
+# 얼굴 영역 품질 (인코딩 대상 선택용)
+MIN_FACE_SIZE = 48          # 얼굴 사각형의 짧은 변 (픽셀)
+MIN_FACE_SHARPNESS = 20.0
+
+# 건너뛴 이유
+SKIP_DARK = "dark"
+SKIP_SATURATED = "saturated"
+SKIP_BLURRED = "blurred"
+SKIP_SMALL_FACE = "small_face"
+SKIP_BLURRED_FACE = "blurred_face"
+
+# 얼굴 영역의 선명도 (라플라시안 분산, 흔들린 프레임일수록 작음)
+def face_sharpness(frame, face_box):
+    x_min, y_min, x_max, y_max = face_box
+    roi = frame[y_min:y_max, x_min:x_max]
+    if roi.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+class QualityGate:
+    """
+    check_frame(frame): face_mesh 실행 전에 프레임 전체 품질 확인 (랜드마크 단계)
+    check_face(frame, face_box): 인코딩 후보로 쓸 얼굴 영역 품질 확인 (판단 단계)
+    둘 다 (통과 여부, 건너뛴 이유 또는 None, 선명도) 반환
+    축소/흑백 버퍼는 미리 할당해 프레임마다 재사용하고, 건너뛴 프레임 수를 이유별로 센다
+    """
+    def __init__(self, frame_shape, scale=QUALITY_SCALE):
+        height, width = frame_shape[:2]
+        self.small_size = (max(1, width // scale), max(1, height // scale))
+        self.small = np.empty((self.small_size[1], self.small_size[0], 3), dtype=np.uint8)
+        self.gray = np.empty((self.small_size[1], self.small_size[0]), dtype=np.uint8)
+        self.laplacian = np.empty((self.small_size[1], self.small_size[0]), dtype=np.float32)
+
+        self.checked_frames = 0
+        self.checked_faces = 0
+        self.skipped = {reason: 0 for reason in (SKIP_DARK, SKIP_SATURATED, SKIP_BLURRED,
+                                                 SKIP_SMALL_FACE, SKIP_BLURRED_FACE)}
+
+    def check_frame(self, frame):
+        self.checked_frames += 1
+
+        cv2.resize(frame, self.small_size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        cv2.Laplacian(self.gray, cv2.CV_32F, dst=self.laplacian)
+
+        luminance = float(self.gray.mean())
+        sharpness = float(self.laplacian.var())
+
+        if luminance < MIN_LUMINANCE:
+            reason = SKIP_DARK
+        elif luminance > MAX_LUMINANCE:
+            reason = SKIP_SATURATED
+        elif sharpness < MIN_FRAME_SHARPNESS:
+            reason = SKIP_BLURRED
+        else:
+            return True, None, sharpness
+
+        self.skipped[reason] += 1
+        return False, reason, sharpness
+
+    def check_face(self, frame, face_box):
+        self.checked_faces += 1
+
+        x_min, y_min, x_max, y_max = face_box
+        if min(x_max - x_min, y_max - y_min) < MIN_FACE_SIZE:
+            self.skipped[SKIP_SMALL_FACE] += 1
+            return False, SKIP_SMALL_FACE, 0.0
+
+        sharpness = face_sharpness(frame, face_box)
+        if sharpness < MIN_FACE_SHARPNESS:
+            self.skipped[SKIP_BLURRED_FACE] += 1
+            return False, SKIP_BLURRED_FACE, sharpness
+
+        return True, None, sharpness
+
+    def stats(self):
+        return {
+            "checked_frames": self.checked_frames,
+            "checked_faces": self.checked_faces,
+            "skipped": dict(self.skipped),
+            "skipped_total": sum(self.skipped.values())
+        }
@@ -0,0 +1,257 @@
+import fcntl
+import glob
+import os
+import subprocess as sp
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# 프레임 소스 모듈
+# 카메라(GStreamer 파이프) 외에 녹화 영상, JPEG 디렉토리, raw 프레임 파일에서도
+# 같은 방식으로 프레임을 읽어 졸음 감지 루프를 젯슨이 아닌 PC에서도 실행/측정할 수 있게 한다
+#
+# raw 프레임 파일은 BGR 프레임을 이어 붙인 파일로, 젯슨에서 다음과 같이 녹화할 수 있다
+#   gst-launch-1.0 -q nvarguscamerasrc ! ... ! video/x-raw,format=BGR ! filesink location=drive.raw
+
+# 미리 할당한 프레임 버퍼 풀
+class FramePool:
+    """
+    프레임마다 새 배열을 만들지 않도록 버퍼를 돌려 쓴다
+    acquire로 받은 버퍼는 마지막으로 사용한 단계(또는 링 버퍼의 on_drop)가 release 해야 한다
+    풀이 비면 새로 할당하고 allocated 카운트를 올린다
+    """
+    def __init__(self, shape, size):
+        self.shape = shape
+        self.lock = threading.Lock()
+        self.free = deque(np.empty(shape, dtype=np.uint8) for _ in range(size))
+        self.allocated = size
+
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+            self.allocated += 1
+        return np.empty(self.shape, dtype=np.uint8)
+
+    def release(self, buffer):
+        with self.lock:
+            self.free.append(buffer)
+
+# 스트림에서 프레임 한 장을 버퍼에 직접 읽기 (짧게 읽힌 경우 나머지를 이어서 읽음)
+def read_frame_into(stream, buffer):
+    view = memoryview(buffer).cast("B")
+    total = 0
+    while total < len(view):
+        count = stream.readinto(view[total:])
+        if not count:
+            # EOF (파이프 또는 파일 끝)
+            return False
+        total += count
+    return True
+
+# 크기가 다른 이미지를 버퍼 크기에 맞춰 복사
+def copy_into(image, buffer):
+    if image.shape == buffer.shape:
+        np.copyto(buffer, image)
+    else:
+        cv2.resize(image, (buffer.shape[1], buffer.shape[0]), dst=buffer, interpolation=cv2.INTER_AREA)
+
+class FrameSource:
+    """
+    프레임 소스 공통 인터페이스
+    read_into(buffer): (height, width, 3) BGR 버퍼를 채우고 타임스탬프(초)를 반환, 끝이면 None
+    realtime: True면 실제 시간으로 들어오는 소스 (느리면 프레임을 버림)
+              False면 파일 소스로, 모든 프레임을 최대 속도로 처리
+    """
+    realtime = False
+
+    def __init__(self, width, height, fps):
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def open(self):
+        pass
+
+    def read_into(self, buffer):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class GStreamerSource(FrameSource):
+    """젯슨 CSI 카메라 (IMX219) nvarguscamerasrc → fdsink 파이프"""
+    realtime = True
+
+    def __init__(self, width, height, fps):
+        super().__init__(width, height, fps)
+        self.process = None
+
+    def open(self):
+        # GStreamer 명령어 설정 (IMX219 카메라용)
+        command = [
+            'gst-launch-1.0',
+            '-q',
+            'nvarguscamerasrc',
+            '!', f'video/x-raw(memory:NVMM),width={self.width},height={self.height},format=NV12,framerate={self.fps}/1',
+            '!', 'nvvidconv', 'flip-method=0',
+            '!', 'video/x-raw,format=BGRx',
+            '!', 'videoconvert',
+            '!', 'video/x-raw,format=BGR',
+            '!', 'fdsink'
+        ]
+
+        # GStreamer 프로세스 시작 (버퍼 없는 파이프에서 프레임 버퍼로 직접 읽음)
+        self.process = sp.Popen(command, stdout=sp.PIPE, stderr=sp.PIPE, bufsize=0)
+
+        # 파이프 버퍼를 프레임 2장 크기로 확장 (리눅스 전용, 실패해도 동작에는 문제 없음)
+        try:
+            fcntl.fcntl(self.process.stdout.fileno(), getattr(fcntl, "F_SETPIPE_SZ", 1031),
+                        self.width * self.height * 3 * 2)
+        except OSError:
+            pass
+
+    def read_into(self, buffer):
+        if not read_frame_into(self.process.stdout, buffer):
+            return None
+        return time.time()
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+
+class VideoFileSource(FrameSource):
+    """cv2.VideoCapture로 읽는 녹화 영상 (타임스탬프는 영상 시간 기준)"""
+    def __init__(self, path, width, height, fps):
+        super().__init__(width, height, fps)
+        self.path = path
+        self.capture = None
+        self.index = 0
+
+    def open(self):
+        self.capture = cv2.VideoCapture(self.path)
+        if not self.capture.isOpened():
+            raise IOError(f"영상을 열 수 없습니다: {self.path}")
+
+        video_fps = self.capture.get(cv2.CAP_PROP_FPS)
+        if video_fps and video_fps > 0:
+            self.fps = video_fps
+
+    def read_into(self, buffer):
+        ok, image = self.capture.read(buffer)
+        if not ok:
+            return None
+        if image is not buffer:
+            copy_into(image, buffer)
+
+        timestamp = self.index / self.fps
+        self.index += 1
+        return timestamp
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+
+class ImageDirectorySource(FrameSource):
+    """디렉토리의 JPEG 이미지를 파일명 순서대로 읽음"""
+    def __init__(self, directory, width, height, fps):
+        super().__init__(width, height, fps)
+        self.files = sorted(glob.glob(os.path.join(directory, "*.jpg")) +
+                            glob.glob(os.path.join(directory, "*.jpeg")))
+        self.index = 0
+
+    def open(self):
+        if not self.files:
+            raise IOError("JPEG 이미지가 없습니다.")
+
+    def read_into(self, buffer):
+        while self.index < len(self.files):
+            image = cv2.imread(self.files[self.index])
+            timestamp = self.index / self.fps
+            self.index += 1
+
+            if image is None:
+                print(f"이미지를 읽을 수 없습니다: {self.files[self.index - 1]}")
+                continue
+
+            copy_into(image, buffer)
+            return timestamp
+        return None
+
+class RawReplaySource(FrameSource):
+    """BGR 프레임을 이어 붙인 raw 파일 (카메라 파이프 출력을 그대로 저장한 형식)"""
+    def __init__(self, path, width, height, fps):
+        super().__init__(width, height, fps)
+        self.path = path
+        self.file = None
+        self.index = 0
+
+    def open(self):
+        self.file = open(self.path, "rb", buffering=0)
+
+    def read_into(self, buffer):
+        if not read_frame_into(self.file, buffer):
+            return None
+
+        timestamp = self.index / self.fps
+        self.index += 1
+        return timestamp
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+class PacedSource(FrameSource):
+    """파일 소스를 원래 FPS에 맞춰 재생 (카메라처럼 실시간으로 동작)"""
+    realtime = True
+
+    def __init__(self, source):
+        super().__init__(source.width, source.height, source.fps)
+        self.source = source
+        self.start_time = None
+
+    def open(self):
+        self.source.open()
+        self.fps = self.source.fps
+
+    def read_into(self, buffer):
+        timestamp = self.source.read_into(buffer)
+        if timestamp is None:
+            return None
+
+        if self.start_time is None:
+            self.start_time = time.time() - timestamp
+
+        delay = self.start_time + timestamp - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return self.start_time + timestamp
+
+    def close(self):
+        self.source.close()
+
+# 명령행 옵션으로 프레임 소스 생성
+def create_frame_source(kind, path, width, height, fps, paced=False):
+    """
+    kind: "gst", "video", "images", "raw"
+    paced: 파일 소스를 원래 속도로 재생할지 여부
+    """
+    if kind == "gst":
+        return GStreamerSource(width, height, fps)
+
+    if path is None:
+        raise ValueError(f"{kind} 소스는 --input 경로가 필요합니다.")
+
+    if kind == "video":
+        source = VideoFileSource(path, width, height, fps)
+    elif kind == "images":
+        source = ImageDirectorySource(path, width, height, fps)
+    elif kind == "raw":
+        source = RawReplaySource(path, width, height, fps)
+    else:
+        raise ValueError(f"알 수 없는 프레임 소스: {kind}")
+
+    return PacedSource(source) if paced else source
@@ -0,0 +1,156 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+# 중계 허브 다중 프로세스 실행기
+# ec2_main.py 작업자를 N개 띄워 MQTT v5 공유 구독($share/hub/...)으로 메시지를 나눠 받게 하고,
+# 차량 상태는 crc32(차량 ID) % N 번 작업자 한 곳에만 두어 GIL에 묶이지 않고 코어 수만큼 처리량을 늘린다
+#
+# 사용 예:
+#   python hub_supervisor.py --workers 4 --broker localhost --quiet
+#   kill -HUP <supervisor pid>    # 작업자를 하나씩 재시작 (차량 상태는 --state-dir의 파일로 인계)
+#
+# 공유 구독은 MQTT v5를 지원하는 브로커(Mosquitto 1.6 이상 등)가 필요하다
+
+RESTART_BACKOFF_MAX = 30.0   # 비정상 종료한 작업자 재시작 대기 시간 상한 (초)
+HANDOVER_SECONDS = 2.0       # 재시작한 작업자가 구독할 때까지 기다린 뒤 다음 작업자로 넘어가는 시간 (초)
+STOP_TIMEOUT = 5.0
+
+class Worker:
+    def __init__(self, shard, shards, args):
+        self.shard = shard
+        self.shards = shards
+        self.args = args
+        self.process = None
+        self.restarts = 0
+        self.backoff = 1.0
+        self.restart_at = None
+
+    def command(self):
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ec2_main.py"),
+                   "--broker", self.args.broker, "--port", str(self.args.port), "--engine", self.args.engine,
+                   "--shard", str(self.shard), "--shards", str(self.shards)]
+        if self.args.quiet:
+            command.append("--quiet")
+        if self.args.face_timeout is not None:
+            command += ["--face-timeout", str(self.args.face_timeout)]
+        if self.args.lockout is not None:
+            command += ["--lockout", str(self.args.lockout)]
+        if self.args.stats_interval:
+            command += ["--stats-interval", str(self.args.stats_interval)]
+        if self.args.state_dir:
+            command += ["--state-file", os.path.join(self.args.state_dir, f"hub-{self.shard}.json")]
+        return command
+
+    def start(self):
+        self.process = subprocess.Popen(self.command())
+        self.restart_at = None
+        print(f"[감독] 작업자 {self.shard} 시작 (pid {self.process.pid})")
+        return self.process
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+def stop_process(process, timeout=STOP_TIMEOUT):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+class Supervisor:
+    """
+    run(): 작업자를 모두 시작하고 비정상 종료한 작업자는 점점 긴 간격으로 재시작
+    SIGHUP: 작업자를 하나씩 종료한 뒤 새로 띄움 (차량 상태와 보관된 메시지를 이어받음)
+    SIGINT/SIGTERM: 모든 작업자 종료
+    """
+    def __init__(self, args):
+        self.workers = [Worker(shard, args.workers, args) for shard in range(args.workers)]
+        self.stopping = False
+        self.reload_requested = False
+
+    def request_stop(self, signum, frame):
+        self.stopping = True
+
+    def request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def rolling_restart(self):
+        print("[감독] 작업자 무중단 재시작")
+        for worker in self.workers:
+            if self.stopping:
+                break
+            # 같은 차량을 두 작업자가 동시에 처리하지 않도록 이전 작업자가 상태를 저장하고 끝날 때까지 기다린 뒤 시작
+            # (그동안 이 작업자 차량의 메시지는 다른 작업자가 받아 넘기고, 브로커가 작업자 세션에 보관)
+            stop_process(worker.process)
+            worker.start()
+            time.sleep(HANDOVER_SECONDS)
+            worker.backoff = 1.0
+
+    def check_workers(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.alive():
+                continue
+
+            if worker.restart_at is None:
+                code = worker.process.returncode if worker.process is not None else None
+                worker.restart_at = now + worker.backoff
+                print(f"[감독] 작업자 {worker.shard} 종료 (코드 {code}), {worker.backoff:.0f}초 후 재시작")
+                worker.backoff = min(worker.backoff * 2, RESTART_BACKOFF_MAX)
+            elif now >= worker.restart_at:
+                worker.restarts += 1
+                worker.start()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.request_reload)
+
+        print(f"[감독] 작업자 {len(self.workers)}개 시작 (pid {os.getpid()})")
+        for worker in self.workers:
+            worker.start()
+
+        try:
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.rolling_restart()
+                self.check_workers()
+                time.sleep(0.5)
+        finally:
+            for worker in self.workers:
+                stop_process(worker.process)
+            print("[감독] 모든 작업자 종료 " +
+                  ", ".join(f"{worker.shard}: 재시작 {worker.restarts}회" for worker in self.workers))
+
+def main():
+    parser = argparse.ArgumentParser(description="ec2_main.py 다중 프로세스 실행기")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="작업자 프로세스 수")
+    parser.add_argument("--broker", default="localhost", help="MQTT 브로커 주소 (MQTT v5 공유 구독 지원)")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--engine", choices=["async", "thread"], default="async")
+    parser.add_argument("--quiet", action="store_true", help="작업자의 메시지별 로그 끄기")
+    parser.add_argument("--face-timeout", type=float, help="작업자의 얼굴 인증 결과 대기 시간 (초)")
+    parser.add_argument("--lockout", type=float, help="작업자의 시동 차단 후 재측정 대기 시간 (초)")
+    parser.add_argument("--stats-interval", type=float, default=0, help="작업자별 처리량 출력 간격 (초)")
+    parser.add_argument("--state-dir", default="hub_state",
+                        help="작업자 재시작 시 차량 상태를 인계할 디렉터리 (빈 문자열이면 인계하지 않음)")
+    args = parser.parse_args()
+
+    if args.workers < 2:
+        parser.error("작업자는 2개 이상이어야 합니다 (1개면 ec2_main.py를 바로 실행)")
+
+    if args.state_dir:
+        os.makedirs(args.state_dir, exist_ok=True)
+    Supervisor(args).run()
+
+if __name__ == "__main__":
+    main()
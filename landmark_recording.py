@@ -0,0 +1,296 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from drowsiness_detector import DrowsinessDetector
+
+# 랜드마크 녹화 형식
+# 임계값을 다시 맞출 때마다 몇 시간 분량의 영상에 face_mesh를 다시 돌리지 않도록,
+# 판단에 실제로 쓰는 랜드마크 몇 개와 EAR/고개 자세 값을 프레임마다 열(column)별 바이너리 파일에 덧붙여 저장한다
+#
+# <녹화 디렉토리>/
+#   meta.json    랜드마크 인덱스, 프레임 크기, 열 형식
+#   t.bin        타임스탬프 (float64)
+#   face.bin     얼굴 검출 여부 (uint8)
+#   ear.bin      양쪽 눈 평균 EAR (float32, 미검출이면 NaN)
+#   pose.bin     (vertical_angle, horizontal_deviation, head_drop) (float32 × 3)
+#   points.bin   meta의 인덱스 순서대로 랜드마크 좌표 (float32 × 인덱스 수 × 2)
+#
+# 열마다 고정 크기 행만 덧붙이므로 읽을 때는 np.memmap으로 바로 열 수 있고,
+# 녹화가 중간에 끊겨도 모든 열에 다 쓰인 행까지만 읽으면 된다
+
+RECORDING_VERSION = 1
+RECORDING_SUFFIX = ".lmrec"
+META_FILE = "meta.json"
+
+# 열 이름: (dtype, 행 하나의 모양, 인덱스 수에 따라 정해지는 모양이면 None)
+COLUMNS = {
+    "t": ("<f8", ()),
+    "face": ("u1", ()),
+    "ear": ("<f4", ()),
+    "pose": ("<f4", (3,)),
+    "points": ("<f4", None)
+}
+
+# 이 행 수만큼 모아서 한 번에 파일에 씀 (30FPS 기준 약 8초)
+RECORD_CHUNK_ROWS = 256
+
+def column_shapes(index_count):
+    return {name: (dtype, shape if shape is not None else (index_count, 2))
+            for name, (dtype, shape) in COLUMNS.items()}
+
+def column_path(directory, name):
+    return os.path.join(directory, name + ".bin")
+
+def complete_rows(directory, shapes):
+    # 모든 열에 끝까지 쓰인 행 수
+    rows = None
+    for name, (dtype, shape) in shapes.items():
+        path = column_path(directory, name)
+        row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+        count = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+        rows = count if rows is None else min(rows, count)
+    return rows or 0
+
+class LandmarkRecorder:
+    """
+    append(timestamp, points, ear, head_pose): 얼굴이 검출된 프레임 기록 (points는 468점 전체)
+    append_missing(timestamp): 얼굴 미검출/품질 불량 프레임 기록
+    close(): 남은 행을 쓰고 파일 닫기
+    같은 디렉토리를 다시 열면 뒤에 이어서 기록 (끊긴 마지막 행은 잘라냄)
+    """
+    def __init__(self, directory, indices, width, height, chunk_rows=RECORD_CHUNK_ROWS):
+        self.directory = directory
+        self.indices = np.asarray(indices, dtype=np.intp)
+        self.shapes = column_shapes(len(self.indices))
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.written = 0
+
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["indices"] != self.indices.tolist():
+                raise ValueError(f"기존 녹화와 랜드마크 인덱스가 다릅니다: {directory}")
+            self.written = complete_rows(directory, self.shapes)
+        else:
+            meta = {
+                "version": RECORDING_VERSION,
+                "indices": self.indices.tolist(),
+                "width": width,
+                "height": height,
+                "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "columns": {name: [dtype, list(shape)] for name, (dtype, shape) in self.shapes.items()}
+            }
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        # 행 버퍼 (미리 할당해 재사용)
+        self.buffers = {name: np.empty((chunk_rows,) + shape, dtype=dtype)
+                        for name, (dtype, shape) in self.shapes.items()}
+        self.files = {}
+        for name, (dtype, shape) in self.shapes.items():
+            f = open(column_path(directory, name), "ab")
+            # 이전 녹화가 행 중간에 끊겼으면 완전한 행까지만 남김
+            f.truncate(self.written * self.buffers[name][0].nbytes)
+            self.files[name] = f
+
+    def __len__(self):
+        return self.written + self.rows
+
+    def append(self, timestamp, points, ear, head_pose):
+        row = self.rows
+        buffers = self.buffers
+        buffers["t"][row] = timestamp
+        buffers["face"][row] = 1
+        buffers["ear"][row] = np.nan if ear is None else ear
+        buffers["pose"][row] = head_pose
+        np.take(points, self.indices, axis=0, out=buffers["points"][row])
+        self.advance()
+
+    def append_missing(self, timestamp):
+        row = self.rows
+        buffers = self.buffers
+        buffers["t"][row] = timestamp
+        buffers["face"][row] = 0
+        buffers["ear"][row] = np.nan
+        buffers["pose"][row] = np.nan
+        buffers["points"][row] = np.nan
+        self.advance()
+
+    def advance(self):
+        self.rows += 1
+        if self.rows == self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            for name, f in self.files.items():
+                self.buffers[name][:self.rows].tofile(f)
+                f.flush()
+            self.written += self.rows
+            self.rows = 0
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+class LandmarkRecording:
+    """
+    녹화 디렉토리를 메모리 맵으로 열어 열별 배열로 제공 (t, face, ear, pose, points)
+    samples(): 얼굴이 검출된 행만 (timestamps, ears, poses)로 반환 (판단 로직 입력)
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != RECORDING_VERSION:
+            raise ValueError(f"지원하지 않는 녹화 형식 버전입니다: {self.meta.get('version')}")
+
+        self.indices = np.asarray(self.meta["indices"], dtype=np.intp)
+        self.width = self.meta["width"]
+        self.height = self.meta["height"]
+
+        shapes = column_shapes(len(self.indices))
+        self.rows = complete_rows(directory, shapes)
+        for name, (dtype, shape) in shapes.items():
+            if self.rows:
+                column = np.memmap(column_path(directory, name), dtype=dtype, mode="r",
+                                   shape=(self.rows,) + shape)
+            else:
+                column = np.empty((0,) + shape, dtype=dtype)
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.rows
+
+    def landmark(self, index):
+        # 원래 468점 인덱스로 기록된 좌표 열 선택 (N, 2)
+        position = np.flatnonzero(self.indices == index)
+        if position.size == 0:
+            raise KeyError(f"기록되지 않은 랜드마크입니다: {index}")
+        return self.points[:, position[0]]
+
+    def samples(self):
+        detected = self.face.astype(bool) & ~np.isnan(self.ear)
+        return self.t[detected], self.ear[detected], self.pose[detected]
+
+# 연속 구간(run) 단위로 경고 발생/해제 시점 계산
+# DrowsinessDetector와 같은 규칙: 비정상 구간이 on_seconds 이상 이어지면 경고,
+# 경고 중 정상 구간이 off_seconds 이상 이어지면 해제
+def warning_transitions(times, excess, bad, on_seconds, off_seconds):
+    transitions = []
+    if len(bad) == 0:
+        return transitions
+
+    starts = np.flatnonzero(bad[1:] != bad[:-1]) + 1
+    starts = np.concatenate(([0], starts)).tolist()
+    ends = starts[1:] + [len(bad)]
+    bad_runs = bad[starts].tolist()
+
+    warning = False
+    for start, end, run_bad in zip(starts, ends, bad_runs):
+        if run_bad == warning:
+            continue
+        seconds = on_seconds if run_bad else off_seconds
+
+        if excess[start + 1:end].any():
+            # 구간 중간에 샘플이 끊겼으면 DrowsinessDetector.skip_gap과 같은 순서로 시작 시각을 뒤로 미룸
+            since = times[start]
+            first = None
+            for index in range(start, end):
+                if index > start:
+                    since += excess[index]
+                if times[index] - since >= seconds:
+                    first = index
+                    break
+        else:
+            reached = times[start:end] - times[start] >= seconds
+            first = start + int(reached.argmax())
+            if not reached[first - start]:
+                first = None
+
+        if first is not None:
+            transitions.append((first, run_bad))
+            warning = run_bad
+    return transitions
+
+def replay(timestamps, ears, poses, detector=None):
+    """
+    기록된 샘플을 판단 로직에 넣어 경고가 바뀐 시점 [(timestamp, eye_warning, head_pose_warning), ...] 반환
+    detector의 파라미터를 사용하며, eye_trigger가 "ear"이면 구간 단위로 벡터화해 계산하고
+    PERCLOS를 쓰는 경우에는 DrowsinessDetector.update를 프레임마다 호출한다
+    """
+    if detector is None:
+        detector = DrowsinessDetector()
+    detector.reset()
+
+    if detector.eye_trigger != "ear":
+        timeline = []
+        update = detector.update
+        for timestamp, ear, pose in zip(timestamps.tolist(), ears.tolist(), poses.tolist()):
+            if update(timestamp, ear, pose):
+                timeline.append((timestamp, detector.eye_warning, detector.head_pose_warning))
+        return timeline
+
+    times = np.asarray(timestamps, dtype=np.float64)
+    if len(times) == 0:
+        return []
+
+    # 샘플이 끊긴 시간(직전 샘플과의 간격 중 max_sample_gap 초과분)은 지속 시간에서 제외
+    excess = np.concatenate(([0.0], np.diff(times) - detector.max_sample_gap))
+    np.maximum(excess, 0.0, out=excess)
+
+    ears = np.asarray(ears, dtype=np.float64)
+    poses = np.asarray(poses, dtype=np.float64)
+    closed = ears < detector.ear_threshold
+    bad_pose = ((np.abs(poses[:, 0] - detector.center_angle) > detector.vertical_angle_threshold) |
+                (poses[:, 1] > detector.horizontal_deviation_threshold) |
+                (poses[:, 2] < detector.head_drop_threshold))
+
+    changes = {}
+    for index, state in warning_transitions(times, excess, closed, detector.ear_closed_seconds,
+                                            detector.ear_reset_seconds):
+        changes.setdefault(index, [None, None])[0] = state
+    for index, state in warning_transitions(times, excess, bad_pose, detector.head_pose_seconds,
+                                            detector.head_pose_reset_seconds):
+        changes.setdefault(index, [None, None])[1] = state
+
+    timeline = []
+    eye_warning = head_pose_warning = False
+    for index in sorted(changes):
+        eye_state, head_state = changes[index]
+        if eye_state is not None:
+            eye_warning = eye_state
+        if head_state is not None:
+            head_pose_warning = head_state
+        timeline.append((float(timestamps[index]), eye_warning, head_pose_warning))
+
+    detector.eye_warning = eye_warning
+    detector.head_pose_warning = head_pose_warning
+    return timeline
+
+# 합성 녹화로 재생 처리량 측정
+def benchmark(sample_count=5_000_000, fps=30.0):
+    timestamps = np.arange(sample_count) / fps
+    phase = timestamps % 5.0
+    ears = np.where(phase > 2.5, 0.15, 0.32).astype(np.float32)
+    poses = np.tile(np.array([90.0, 0.01, 0.45], dtype=np.float32), (sample_count, 1))
+    poses[phase > 4.0, 2] = 0.10
+
+    start = time.perf_counter()
+    timeline = replay(timestamps, ears, poses)
+    elapsed = time.perf_counter() - start
+
+    print(f"샘플 {sample_count}개, {elapsed:.2f}초 ({sample_count / elapsed / 1e6:.2f}M 샘플/초), "
+          f"경고 변화 {len(timeline)}회")
+
+if __name__ == "__main__":
+    benchmark()
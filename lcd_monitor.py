@@ -4,6 +4,7 @@ import RPi.GPIO as GPIO
 import time
 import threading
 import json
+import os
 
 # GPIO 설정
 LED_PIN = 14
@@ -17,9 +18,13 @@ GPIO.setup(BUZZER_PIN, GPIO.OUT)
 MQTT_BROKER = "54.180.229.202"
 MQTT_PORT = 1883
 
+# 차량 ID (설정하면 vehicle/<ID>/ 아래 토픽 사용)
+VEHICLE_ID = os.environ.get("VEHICLE_ID")
+TOPIC_PREFIX = f"vehicle/{VEHICLE_ID}/" if VEHICLE_ID else ""
+
 # 토픽 정의
-RPI_ENGINE = "pi/engine"
-RPI_ALERT = "pi/alert"
+RPI_ENGINE = TOPIC_PREFIX + "pi/engine"
+RPI_ALERT = TOPIC_PREFIX + "pi/alert"
 
 # 전역 변수
 engine_status = "OFF"
@@ -0,0 +1,264 @@
+import argparse
+import csv
+import inspect
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from drowsiness_detector import DrowsinessDetector
+from landmark_recording import LandmarkRecording, RECORDING_SUFFIX, META_FILE, replay
+
+# 녹화 세션 일괄 재평가 도구
+# 녹화 영상(또는 랜드마크 녹화/덤프)에서 프레임별 EAR/고개 자세를 한 번만 추출해 두고,
+# 임계값 조합마다 Jetson 실시간 루프와 같은 DrowsinessDetector로 다시 판단해
+# 세션별 경고 타임라인과 라벨 대비 정밀도/재현율을 계산한다
+#
+# 사용 예:
+#   python rescore_sessions.py recordings/*.mp4 --labels labels.json \
+#       --param ear_threshold=0.25,0.28,0.3 --param head_drop_threshold=0.25,0.3 --output rescore_out
+#
+# labels.json: {"세션 이름": [[졸음 시작(초), 졸음 끝(초)], ...], ...}
+# 랜드마크 녹화(.lmrec): face_drowsiness.py --record로 기록한 디렉토리 (추론 없이 바로 재평가)
+# 랜드마크 덤프(.npz): t (N,), ear (N,), pose (N, 3) 배열, 얼굴 미검출 프레임은 NaN
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov")
+FEATURE_SUFFIX = ".features.npz"
+
+# 경고가 라벨 구간 앞뒤로 이만큼 벗어나도 같은 이벤트로 인정 (초)
+MATCH_TOLERANCE = 2.0
+
+def session_name(path):
+    name = os.path.basename(path.rstrip(os.sep))
+    for suffix in (FEATURE_SUFFIX, RECORDING_SUFFIX) + VIDEO_EXTENSIONS + (".npz",):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+# 1단계: 영상에서 프레임별 특징 추출 (작업자 프로세스에서 실행)
+def extract_video_features(video_path, output_path, width, height):
+    # 모델은 작업자 프로세스마다 따로 로드
+    import face_drowsiness as fd
+    from frame_source import VideoFileSource
+
+    source = VideoFileSource(video_path, width, height, fd.CAMERA_FPS)
+    source.open()
+    tracker = fd.FaceRoiTracker(width, height)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    points = np.empty((468, 2), dtype=np.float32)
+
+    timestamps, ears, poses = [], [], []
+    start = time.perf_counter()
+    try:
+        while True:
+            timestamp = source.read_into(frame)
+            if timestamp is None:
+                break
+
+            timestamps.append(timestamp)
+            if tracker.process(frame, points):
+                ears.append(fd.calculate_eyes_EAR(points))
+                poses.append(fd.calculate_head_pose(points, width, height)[:3])
+            else:
+                ears.append(np.nan)
+                poses.append((np.nan, np.nan, np.nan))
+    finally:
+        source.close()
+
+    np.savez(output_path,
+             t=np.asarray(timestamps, dtype=np.float64),
+             ear=np.asarray(ears, dtype=np.float32),
+             pose=np.asarray(poses, dtype=np.float32).reshape(-1, 3))
+    return output_path, len(timestamps), time.perf_counter() - start
+
+def is_recording(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+# 얼굴이 검출된 샘플만 (timestamps, ears, poses)로 반환 (미검출 프레임은 실시간 루프와 같이 판단하지 않음)
+def load_features(path):
+    if is_recording(path):
+        return LandmarkRecording(path).samples()
+
+    with np.load(path) as data:
+        timestamps, ears, poses = data["t"], data["ear"], data["pose"]
+    detected = ~np.isnan(ears)
+    return timestamps[detected], ears[detected], poses[detected]
+
+# 임계값 조합 하나로 세션 전체를 다시 판단해 경고 변화 타임라인 반환
+def run_detector(timestamps, ears, poses, params):
+    timeline = replay(timestamps, ears, poses, DrowsinessDetector(**params))
+    return [(round(timestamp, 3), eye_warning, head_pose_warning)
+            for timestamp, eye_warning, head_pose_warning in timeline]
+
+# 경고 시작 시점과 라벨 구간 비교
+def match_events(timeline, intervals, tolerance=MATCH_TOLERANCE):
+    onsets = []
+    drowsy = False
+    for timestamp, eye_warning, head_pose_warning in timeline:
+        now_drowsy = eye_warning or head_pose_warning
+        if now_drowsy and not drowsy:
+            onsets.append(timestamp)
+        drowsy = now_drowsy
+
+    true_positives = sum(1 for onset in onsets
+                         if any(start - tolerance <= onset <= end + tolerance for start, end in intervals))
+    detected = sum(1 for start, end in intervals
+                   if any(start - tolerance <= onset <= end + tolerance for onset in onsets))
+    return {
+        "alerts": len(onsets),
+        "true_positives": true_positives,
+        "false_positives": len(onsets) - true_positives,
+        "events": len(intervals),
+        "detected": detected
+    }
+
+# 2단계: 세션 하나에 모든 임계값 조합 적용 (작업자 프로세스에서 실행)
+def score_session(name, features_path, param_sets, intervals, tolerance):
+    timestamps, ears, poses = load_features(features_path)
+
+    results = []
+    for index, params in enumerate(param_sets):
+        timeline = run_detector(timestamps, ears, poses, params)
+        result = {"session": name, "param_index": index, "timeline": timeline}
+        if intervals is not None:
+            result.update(match_events(timeline, intervals, tolerance))
+        results.append(result)
+    return results
+
+# --param name=v1,v2,... 목록을 DrowsinessDetector 인자 조합으로 변환
+def build_param_grid(param_args):
+    valid = set(inspect.signature(DrowsinessDetector.__init__).parameters) - {"self"}
+
+    names, choices = [], []
+    for arg in param_args:
+        name, _, values = arg.partition("=")
+        name = name.strip().lower()
+        if name not in valid:
+            raise ValueError(f"알 수 없는 파라미터: {name} (가능: {', '.join(sorted(valid))})")
+
+        parsed = []
+        for value in values.split(","):
+            value = value.strip()
+            try:
+                parsed.append(float(value))
+            except ValueError:
+                parsed.append(value)
+        names.append(name)
+        choices.append(parsed)
+
+    return [dict(zip(names, combination)) for combination in itertools.product(*choices)]
+
+def collect_inputs(paths):
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path) and not is_recording(path):
+            inputs.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                 if name.endswith(VIDEO_EXTENSIONS) or name.endswith(".npz") or
+                                 is_recording(os.path.join(path, name))))
+        else:
+            inputs.append(path)
+    return inputs
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="녹화 세션 졸음 판단 일괄 재평가")
+    parser.add_argument("inputs", nargs="+", help="녹화 영상, 랜드마크 녹화(.lmrec), 덤프(.npz) 또는 디렉토리")
+    parser.add_argument("--labels", help="세션별 졸음 구간 라벨 JSON")
+    parser.add_argument("--param", action="append", default=[],
+                        help="임계값 후보 (예: ear_threshold=0.25,0.3), 여러 번 지정하면 모든 조합을 평가")
+    parser.add_argument("--output", default="rescore_out", help="결과 디렉토리")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="작업자 프로세스 수")
+    parser.add_argument("--width", type=int, default=320, help="특징 추출 프레임 가로 크기 (Jetson 설정과 같게)")
+    parser.add_argument("--height", type=int, default=240, help="특징 추출 프레임 세로 크기")
+    parser.add_argument("--tolerance", type=float, default=MATCH_TOLERANCE, help="라벨 구간 허용 오차 (초)")
+    parser.add_argument("--refresh", action="store_true", help="저장된 특징이 있어도 영상에서 다시 추출")
+    args = parser.parse_args()
+
+    param_sets = build_param_grid(args.param) or [{}]
+    labels = None
+    if args.labels:
+        with open(args.labels, encoding="utf-8") as f:
+            labels = json.load(f)
+
+    feature_dir = os.path.join(args.output, "features")
+    os.makedirs(feature_dir, exist_ok=True)
+
+    sessions = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # 1단계: 영상별 특징 추출 (이미 추출한 영상은 건너뜀)
+        futures = {}
+        for path in collect_inputs(args.inputs):
+            name = session_name(path)
+            if path.endswith(VIDEO_EXTENSIONS):
+                features_path = os.path.join(feature_dir, name + FEATURE_SUFFIX)
+                if args.refresh or not os.path.exists(features_path):
+                    futures[executor.submit(extract_video_features, path, features_path,
+                                            args.width, args.height)] = name
+                    continue
+                sessions[name] = features_path
+            else:
+                sessions[name] = path
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                features_path, frames, elapsed = future.result()
+            except Exception as e:
+                print(f"[{name}] 특징 추출 실패: {e}")
+                continue
+            sessions[name] = features_path
+            print(f"[{name}] 특징 추출 완료: {frames}프레임, {elapsed:.1f}초")
+
+        print(f"세션 {len(sessions)}개 × 임계값 조합 {len(param_sets)}개 평가 중...")
+
+        # 2단계: 세션마다 모든 조합 재평가
+        futures = [executor.submit(score_session, name, path, param_sets,
+                                   None if labels is None else labels.get(name, []), args.tolerance)
+                   for name, path in sorted(sessions.items())]
+
+        totals = [{"alerts": 0, "true_positives": 0, "false_positives": 0, "events": 0, "detected": 0}
+                  for _ in param_sets]
+        with open(os.path.join(args.output, "timelines.jsonl"), "w", encoding="utf-8") as timelines:
+            for future in as_completed(futures):
+                for result in future.result():
+                    timelines.write(json.dumps({
+                        "session": result["session"],
+                        "params": param_sets[result["param_index"]],
+                        "timeline": [{"t": t, "eye_warning": eye, "head_pose_warning": head}
+                                     for t, eye, head in result["timeline"]]
+                    }, ensure_ascii=False) + "\n")
+
+                    total = totals[result["param_index"]]
+                    for key in total:
+                        total[key] += result.get(key, 0)
+
+    # 조합별 집계 (F1 높은 순)
+    rows = []
+    for params, total in zip(param_sets, totals):
+        precision = ratio(total["true_positives"], total["alerts"])
+        recall = ratio(total["detected"], total["events"])
+        f1 = ratio(2 * precision * recall, precision + recall)
+        rows.append(dict(params, **total, precision=round(precision, 4), recall=round(recall, 4), f1=round(f1, 4)))
+    rows.sort(key=lambda row: (row["f1"], -row["false_positives"]), reverse=True)
+
+    summary_path = os.path.join(args.output, "summary.csv")
+    with open(summary_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"완료: {time.perf_counter() - start:.1f}초, 결과 {summary_path}")
+    if labels is not None:
+        for row in rows[:5]:
+            params = ", ".join(f"{name}={row[name]}" for name in param_sets[0])
+            print(f"  {params or '기본값'}: 정밀도 {row['precision']:.3f}, 재현율 {row['recall']:.3f}, "
+                  f"F1 {row['f1']:.3f} (경고 {row['alerts']}회, 오경고 {row['false_positives']}회)")
+
+if __name__ == "__main__":
+    main()
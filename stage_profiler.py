@@ -0,0 +1,98 @@
+import threading
+import time
+
+import numpy as np
+
+# 단계별 지연 시간 프로파일러
+# 프레임 루프의 각 단계(프레임 읽기, 색 변환, face_mesh, EAR/자세 계산, dlib 인코딩, 오버레이, 화면 표시)를
+# time.perf_counter로 재고, 단계마다 최근 측정값만 고정 크기 링에 보관해 p50/p95/p99를 계산한다
+# 측정 경로에서는 리스트 한 칸에 값을 쓰는 것 외에 아무것도 하지 않고, 통계는 snapshot()을 부를 때만 계산한다
+
+PROFILE_WINDOW = 512                # 단계마다 보관하는 최근 측정 수
+PROFILE_PERCENTILES = (50, 95, 99)
+
+class StageStats:
+    __slots__ = ("samples", "index", "count", "total", "max")
+
+    def __init__(self, window):
+        self.samples = [0.0] * window
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        samples = self.samples
+        samples[self.index] = seconds
+        self.index = (self.index + 1) % len(samples)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        recent = np.array(self.samples[:min(self.count, len(self.samples))]) * 1000.0
+        result = {"count": self.count, "mean_ms": round(self.total / self.count * 1000.0, 2),
+                  "max_ms": round(self.max * 1000.0, 2)}
+        for percentile, value in zip(PROFILE_PERCENTILES, np.percentile(recent, PROFILE_PERCENTILES)):
+            result[f"p{percentile}_ms"] = round(float(value), 2)
+        return result
+
+class StageProfiler:
+    """
+    start(): 측정 시작 시각 (time.perf_counter)
+    stop(stage, start): start 이후 걸린 시간을 stage에 기록하고 현재 시각 반환 (다음 단계의 시작으로 사용 가능)
+    count(name, n): 처리/버린 프레임 수 같은 카운터 증가
+    snapshot(): 단계별 최근 백분위수, 카운터 누적값과 직전 snapshot 이후 초당 비율
+    """
+    def __init__(self, window=PROFILE_WINDOW):
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.last_snapshot_time = self.started
+        self.last_counters = {}
+
+    start = staticmethod(time.perf_counter)
+
+    def stop(self, stage, start):
+        now = time.perf_counter()
+        stats = self.stages.get(stage)
+        if stats is None:
+            with self.lock:
+                stats = self.stages.setdefault(stage, StageStats(self.window))
+        stats.add(now - start)
+        return now
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        now = time.perf_counter()
+        with self.lock:
+            stages = dict(self.stages)
+            counters = dict(self.counters)
+            elapsed = now - self.last_snapshot_time
+            previous = self.last_counters
+            self.last_snapshot_time = now
+            self.last_counters = counters
+
+        rates = {name: round((value - previous.get(name, 0)) / elapsed, 2) if elapsed > 0 else 0.0
+                 for name, value in counters.items()}
+        return {
+            "uptime_s": round(now - self.started, 1),
+            "interval_s": round(elapsed, 2),
+            "stages": {stage: stats.summary() for stage, stats in stages.items() if stats.count},
+            "counters": counters,
+            "rates": rates
+        }
+
+    def report(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        lines = [f"  {stage}: p50 {stats['p50_ms']:.2f}ms, p95 {stats['p95_ms']:.2f}ms, "
+                 f"p99 {stats['p99_ms']:.2f}ms, 최대 {stats['max_ms']:.2f}ms ({stats['count']}회)"
+                 for stage, stats in snapshot["stages"].items()]
+        if snapshot["counters"]:
+            lines.append("  카운터: " + ", ".join(f"{name} {value}" for name, value in snapshot["counters"].items()))
+        return "\n".join(lines)
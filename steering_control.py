@@ -2,10 +2,13 @@ import paho.mqtt.client as mqtt
 import pyvjoy
 from pywinusb import hid
 import time
+import os
 
 # MQTT 설정
 MQTT_BROKER = "3.36.131.224"
-MQTT_TOPIC = "car/server"
+# 차량 ID를 설정하면 vehicle/<ID>/car/server 구독 (여러 차량이 한 브로커를 쓸 때)
+VEHICLE_ID = os.environ.get("VEHICLE_ID")
+MQTT_TOPIC = f"vehicle/{VEHICLE_ID}/car/server" if VEHICLE_ID else "car/server"
 
 # 상태 변수
 engine_permission = False   # 서버에서 ENGINE_ON 허용받은 상태
@@ -0,0 +1,68 @@
+import pytest
+
+from drowsiness_detector import (AdaptiveScheduler, DrowsinessDetector, ADAPTIVE_IDLE_INTERVAL,
+                                 EYE_WARNING_CHANGED, HEAD_POSE_WARNING_CHANGED)
+
+# 적응형 분석 주기로 프레임을 건너뛰어도 경고가 모든 프레임을 분석할 때보다 늦지 않은지 확인
+
+FPS = 30.0
+OPEN_EAR = 0.40
+CLOSED_EAR = 0.15
+GOOD_POSE = (90.0, 0.01, 0.45)
+DROPPED_POSE = (90.0, 0.01, 0.10)
+
+def frames(onset, duration=8.0, eyes=True):
+    # onset초까지 정상, 이후 눈 감음(eyes=True) 또는 고개 떨굼
+    for i in range(int(duration * FPS)):
+        timestamp = i / FPS
+        bad = timestamp >= onset
+        ear = CLOSED_EAR if bad and eyes else OPEN_EAR
+        pose = DROPPED_POSE if bad and not eyes else GOOD_POSE
+        yield timestamp, ear, pose
+
+def first_alert(samples, flag, scheduler=None):
+    detector = DrowsinessDetector()
+    for timestamp, ear, pose in samples:
+        if scheduler is None:
+            changed = detector.update(timestamp, ear, pose)
+        else:
+            if not scheduler.should_analyze(timestamp):
+                continue
+            changed = detector.update(timestamp, ear, pose, onset=scheduler.onset(timestamp))
+            scheduler.update(timestamp, detector.is_well_within_bounds(ear, pose))
+        if changed & flag:
+            return timestamp
+    return None
+
+@pytest.mark.parametrize("eyes, flag", [(True, EYE_WARNING_CHANGED), (False, HEAD_POSE_WARNING_CHANGED)])
+@pytest.mark.parametrize("offset", [i / 10 * ADAPTIVE_IDLE_INTERVAL for i in range(10)])
+def test_adaptive_alert_not_later_than_full_rate(eyes, flag, offset):
+    # 낮은 주기로 바뀐 뒤(정상 2초 이후) 간격 안의 여러 위치에서 이상 상태가 시작되는 경우
+    onset = 4.0 + offset
+    full_rate = first_alert(frames(onset, eyes=eyes), flag)
+    scheduler = AdaptiveScheduler()
+    adaptive = first_alert(frames(onset, eyes=eyes), flag, scheduler)
+
+    assert scheduler.skipped > 0
+    assert full_rate is not None and adaptive is not None
+    assert adaptive <= full_rate + 1e-9
+    assert adaptive >= full_rate - ADAPTIVE_IDLE_INTERVAL - 1 / FPS
+
+def test_onset_only_backdated_while_idle():
+    scheduler = AdaptiveScheduler(idle_interval=0.2, relax_seconds=0.0)
+    assert scheduler.onset(0.0) is None
+
+    scheduler.update(0.0, True)
+    assert scheduler.onset(0.2) == 0.0
+
+    scheduler.update(0.2, False)
+    assert scheduler.onset(0.233) is None
+
+def test_perclos_window_only_tracked_when_used():
+    assert not DrowsinessDetector(eye_trigger="ear").track_perclos
+    assert DrowsinessDetector(eye_trigger="either").track_perclos
+
+    detector = DrowsinessDetector(eye_trigger="ear", track_perclos=True)
+    for i in range(90):
+        detector.update(i / 30, 0.1, None)
+    assert detector.perclos > 0.9
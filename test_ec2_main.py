@@ -0,0 +1,110 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import ec2_main
+from timer_wheel import TimerWheel
+
+# ec2_main.py 차량 상태 머신 테스트 (브로커 없이 on_message에 메시지를 직접 넣고 보낸 메시지를 확인)
+
+class FakeClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, retain=False, qos=0):
+        self.published.append((topic, payload))
+
+    def sent(self, vehicle_id, topic):
+        return [payload for sent_topic, payload in self.published
+                if sent_topic == ec2_main.vehicle_topic(vehicle_id, topic)]
+
+@pytest.fixture
+def hub(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(ec2_main, "client", client)
+    monkeypatch.setattr(ec2_main, "sessions", {})
+    monkeypatch.setattr(ec2_main, "timers", TimerWheel())
+    monkeypatch.setattr(ec2_main, "VERBOSE", False)
+    return client
+
+def receive(vehicle_id, topic, payload):
+    if not isinstance(payload, str):
+        payload = json.dumps(payload)
+    message = SimpleNamespace(topic=ec2_main.vehicle_topic(vehicle_id, topic), payload=payload.encode())
+    ec2_main.on_message(None, None, message)
+    return ec2_main.sessions[vehicle_id]
+
+def start_driving(vehicle_id):
+    receive(vehicle_id, ec2_main.BREATHALYZER_TOPIC, "1")
+    return receive(vehicle_id, ec2_main.RESULT_TOPIC, {"face_match": "MATCH", "drowsiness_detected": False})
+
+def test_breath_ok_then_match_starts_driving(hub):
+    session = start_driving("v1")
+    assert session.state == ec2_main.DRIVING
+    assert hub.sent("v1", ec2_main.CAR_TOPIC) == ["ENGINE_ON"]
+    assert hub.sent("v1", ec2_main.REQUEST_TOPIC) == ["VERIFY_FACE"]
+
+def test_mismatch_while_driving_locks_vehicle(hub):
+    start_driving("v1")
+    session = receive("v1", ec2_main.RESULT_TOPIC, {"face_match": "MISMATCH", "drowsiness_detected": False})
+
+    assert session.state == ec2_main.LOCKED
+    assert hub.sent("v1", ec2_main.CAR_TOPIC) == ["ENGINE_ON", "ENGINE_OFF"]
+    assert "MISMATCH" in hub.sent("v1", ec2_main.RPI_ALERT)
+
+def test_late_face_result_ignored_when_engine_off(hub):
+    receive("v1", ec2_main.BREATHALYZER_TOPIC, "0")
+    session = receive("v1", ec2_main.RESULT_TOPIC, {"face_match": "MATCH", "drowsiness_detected": False})
+
+    assert session.state == ec2_main.LOCKED
+    assert hub.sent("v1", ec2_main.CAR_TOPIC) == ["ENGINE_OFF"]
+
+def test_drowsy_alert_forwarded_without_breath_message(hub):
+    # 허브 재시작 직후처럼 음주측정/인증 메시지 없이 졸음 감지 결과만 오는 경우
+    session = receive("z", ec2_main.DROWSINESS_TOPIC, {"drowsiness_detected": True})
+
+    assert session.state == ec2_main.IDLE
+    assert hub.sent("z", ec2_main.RPI_ALERT) == ["DROWSY"]
+
+def test_drowsy_alert_sent_only_on_change(hub):
+    start_driving("v1")
+    for drowsy in (True, True, False, False, True):
+        receive("v1", ec2_main.DROWSINESS_TOPIC, {"drowsiness_detected": drowsy})
+
+    assert hub.sent("v1", ec2_main.RPI_ALERT) == ["DROWSY", "NORMAL", "DROWSY"]
+
+def test_state_report_includes_session(hub):
+    start_driving("v1")
+    report = json.loads(hub.sent("v1", ec2_main.STATE_TOPIC)[-1])
+
+    assert report["state"] == ec2_main.DRIVING
+    assert report["previous"] == ec2_main.FACE_PENDING
+    assert report["engine"] == "ENGINE_ON"
+    assert report["face_match"] == "MATCH"
+
+def test_sessions_handed_over_through_state_file(hub, monkeypatch, tmp_path):
+    start_driving("v1")
+    receive("v1", ec2_main.DROWSINESS_TOPIC, {"drowsiness_detected": True, "driver_name": "kim"})
+    receive("v2", ec2_main.BREATHALYZER_TOPIC, "1")
+    path = str(tmp_path / "hub-0.json")
+    ec2_main.save_sessions(path)
+
+    # 새 작업자: 빈 상태에서 파일을 읽어 이어받음
+    monkeypatch.setattr(ec2_main, "sessions", {})
+    monkeypatch.setattr(ec2_main, "timers", TimerWheel())
+    ec2_main.load_sessions(path)
+
+    assert not (tmp_path / "hub-0.json").exists()
+    assert ec2_main.sessions["v1"].state == ec2_main.DRIVING
+    assert ec2_main.sessions["v2"].state == ec2_main.FACE_PENDING
+    assert "v2" in ec2_main.timers
+
+    # 이어받은 차량도 같은 졸음 상태는 다시 보내지 않음
+    before = len(hub.sent("v1", ec2_main.RESULT_TOPIC))
+    receive("v1", ec2_main.DROWSINESS_TOPIC, {"drowsiness_detected": True, "driver_name": "kim"})
+    assert len(hub.sent("v1", ec2_main.RESULT_TOPIC)) == before
+    assert hub.sent("v1", ec2_main.RPI_ALERT) == ["DROWSY"]
+
+    session = receive("v1", ec2_main.RESULT_TOPIC, {"face_match": "MISMATCH", "drowsiness_detected": False})
+    assert session.state == ec2_main.LOCKED
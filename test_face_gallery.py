@@ -0,0 +1,19 @@
+import numpy as np
+
+from face_gallery import FaceGallery
+
+# 운전자별 EAR 보정값이 갤러리 운전자 정보와 함께 저장/로드되는지 확인
+
+def test_ear_calibration_saved_with_driver(tmp_path):
+    gallery = FaceGallery(str(tmp_path))
+    gallery.enroll("kim", [np.full(128, 0.1, dtype=np.float32)])
+    gallery.enroll("lee", [np.full(128, 0.5, dtype=np.float32)])
+    assert gallery.ear_calibration("kim") is None
+
+    calibration = {"ear_mean": 0.31, "ear_std": 0.02, "ear_threshold": 0.25}
+    gallery.set_ear_calibration("kim", calibration)
+
+    loaded = FaceGallery(str(tmp_path)).load()
+    assert loaded.ear_calibration("kim") == calibration
+    assert loaded.ear_calibration("lee") is None
+    assert loaded.identify(np.full(128, 0.1, dtype=np.float32))[0] == "kim"
@@ -0,0 +1,114 @@
+import math
+import time
+
+# 해시 타이머 휠
+# 차량마다 스레드나 asyncio 타이머를 두지 않고, 모든 시간 초과를 고정 개수 슬롯의 원형 배열 하나에 넣어
+# 틱마다 해당 슬롯만 확인한다. 등록/취소는 O(1)이고, 차량이 수천 대여도 틱당 비용은 만료될 타이머 수에만 비례
+# 키(차량 ID)마다 타이머는 하나만 유지하며, 같은 키로 다시 등록하면 이전 타이머는 취소된다
+#
+# advance()는 이벤트 루프/메시지 루프와 같은 스레드에서 주기적으로 불러야 함 (콜백도 그 스레드에서 실행)
+
+WHEEL_TICK = 0.1        # 틱 간격 (초)
+WHEEL_SLOTS = 1024      # 슬롯 수 (한 바퀴 = WHEEL_TICK * WHEEL_SLOTS초, 더 긴 타이머는 여러 바퀴 뒤 만료)
+
+class Timer:
+    __slots__ = ("key", "tick", "callback")
+
+    def __init__(self, key, tick, callback):
+        self.key = key
+        self.tick = tick
+        self.callback = callback
+
+class TimerWheel:
+    """
+    schedule(key, delay, callback): delay초 뒤 callback() 실행 (같은 key의 기존 타이머는 취소)
+    cancel(key): key의 타이머 취소
+    advance(): 지금까지 만료된 타이머의 콜백 실행, 실행한 수 반환
+    """
+    def __init__(self, tick=WHEEL_TICK, slots=WHEEL_SLOTS, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [{} for _ in range(slots)]
+        self.timers = {}
+        self.started = clock()
+        self.current = 0        # 마지막으로 처리한 틱
+        self.fired = 0
+
+    def now_tick(self):
+        return int((self.clock() - self.started) / self.tick)
+
+    def schedule(self, key, delay, callback):
+        self.cancel(key)
+        due = self.now_tick() + max(1, math.ceil(delay / self.tick))
+        timer = self.timers[key] = Timer(key, due, callback)
+        self.slots[due % len(self.slots)][key] = timer
+        return timer
+
+    def cancel(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            del self.slots[timer.tick % len(self.slots)][key]
+        return timer is not None
+
+    def advance(self):
+        target = self.now_tick()
+        if target <= self.current:
+            return 0
+
+        # 한 바퀴 넘게 밀렸으면 모든 슬롯을 한 번씩만 확인
+        slot_count = len(self.slots)
+        steps = min(target - self.current, slot_count)
+        fired = 0
+        for tick in range(target - steps + 1, target + 1):
+            slot = self.slots[tick % slot_count]
+            if not slot:
+                continue
+            expired = [timer for timer in slot.values() if timer.tick <= target]
+            for timer in expired:
+                del slot[timer.key]
+                del self.timers[timer.key]
+            for timer in expired:
+                # 콜백이 같은 키로 다시 등록할 수 있도록 제거한 뒤 실행
+                timer.callback()
+            fired += len(expired)
+
+        self.current = target
+        self.fired += fired
+        return fired
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+def benchmark(vehicle_count=10000, seconds=5.0):
+    wheel = TimerWheel()
+    fired = [0]
+
+    def expire():
+        fired[0] += 1
+
+    start = time.perf_counter()
+    for i in range(vehicle_count):
+        wheel.schedule(f"car{i}", (i % 50) / 10.0, expire)
+    # 절반은 만료 전에 다시 등록 (상태 변화로 시간 초과가 바뀌는 경우)
+    for i in range(0, vehicle_count, 2):
+        wheel.schedule(f"car{i}", seconds, expire)
+    scheduled = time.perf_counter() - start
+
+    ticks = 0
+    advance_time = 0.0
+    end = time.monotonic() + seconds + 0.2
+    while time.monotonic() < end:
+        time.sleep(wheel.tick)
+        tick_start = time.perf_counter()
+        wheel.advance()
+        advance_time += time.perf_counter() - tick_start
+        ticks += 1
+
+    print(f"타이머 {vehicle_count}개 등록 {scheduled * 1000:.1f}ms, 만료 {fired[0]}개, 남은 타이머 {len(wheel)}개, "
+          f"틱당 평균 {advance_time / max(ticks, 1) * 1000:.3f}ms")
+
+if __name__ == "__main__":
+    benchmark()